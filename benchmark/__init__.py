@@ -0,0 +1 @@
+# Benchmark of the per-move latency and training throughput of myTeam.py, see runBenchmark.py
@@ -0,0 +1,4 @@
+import sys
+from benchmark.runBenchmark import main
+
+sys.exit(main(sys.argv[1:]))
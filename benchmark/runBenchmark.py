@@ -0,0 +1,306 @@
+# runBenchmark.py
+# ---------------
+# Per-move latency and training throughput benchmark of the agents of myTeam.py.
+#
+# Games of our team against itself are played once per layout with a fixed seed, and the game states
+# seen by our agents are recorded. The recorded states are then replayed through fresh instances of
+# every agent class, measuring chooseAction() latency (p50/p95/p99), registerInitialState() time and
+# peak memory. The same states are replayed through a myAttackingAgent planning with MCTS for --planTime seconds
+# per move, reporting its search iterations per move. Training throughput is measured with a learning
+# myAttackingAgent, as in trainTeam.py, with the engine and with the headless simulator fastCapture.py.
+# With --guardMemo, the states are also replayed through a myDefensiveAgent that recomputes its guard position on
+# every move, as before it was memoized per defended capsule set, to measure what the memo saves.
+#
+# The Berkeley engine is used if --contestDir holds capture.py, otherwise the minimal stub engine in
+# benchmark/stubEngine (with stand-in layouts of the same names). Compare against a baseline with e.g.
+#   python -m benchmark --contestDir ../pacman-contest --baseline benchmark/baseline.json
+
+import argparse, contextlib, gc, io, json, os, random, sys, time, tracemalloc
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MY_TEAM = os.path.join(PACKAGE_DIR, 'myTeam.py')
+STUB_ENGINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stubEngine')
+
+AGENT_CLASSES = ['myAttackingAgent', 'myDefensiveAgent', 'myAttackingDefender', 'myDefendingAttacker']
+# Results name of the planning attacker
+PLANNER_AGENT = 'myAttackingAgent+mcts'
+# Results names of the defenders of --guardMemo. Both evaluate their features, without a compiled policy table.
+GUARD_MEMO_AGENTS = ['myDefensiveAgent+guardMemo', 'myDefensiveAgent-guardMemo']
+
+# Our team plays red, so our agents are the red agents 0 and 2
+OUR_INDICES = [0, 2]
+
+# Metrics where a higher value is worse, and where a lower value is worse
+LATENCY_METRICS = ['p50', 'p95', 'p99', 'registerInitialState', 'peakMemory']
+THROUGHPUT_METRICS = ['episodesPerSecond']
+
+
+def loadEngine(contestDir):
+    if contestDir is not None and os.path.exists(os.path.join(contestDir, 'capture.py')):
+        engineDir = os.path.abspath(contestDir)
+        # capture.py loads layouts relative to the working directory
+        os.chdir(engineDir)
+    else:
+        engineDir = STUB_ENGINE_DIR
+    for path in [engineDir, PACKAGE_DIR]:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    import capture
+    return capture, engineDir
+
+
+# Games are played quietly, the agents print a line per game
+def runQuietly(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def recordGame(capture, layout, seed):
+    """
+    Plays one game of our team against itself and returns, for each of our agents, the initial state
+    it was registered with and the states it chose actions in.
+    """
+    options = capture.readCommand(['-r', MY_TEAM, '-b', MY_TEAM, '-l', layout, '-Q'])
+    random.seed(seed)
+    recordings = {}
+    for index in OUR_INDICES:
+        agent = options['agents'][index]
+        recording = recordings[index] = {'initialState': None, 'states': []}
+
+        def recordInitialState(gameState, agent=agent, recording=recording,
+                               registerInitialState=agent.registerInitialState):
+            recording['initialState'] = gameState
+            return registerInitialState(gameState)
+
+        def recordState(gameState, recording=recording, getAction=agent.getAction):
+            recording['states'].append(gameState)
+            return getAction(gameState)
+
+        agent.registerInitialState = recordInitialState
+        agent.getAction = recordState
+    runQuietly(capture.runGames, **options)
+    return recordings
+
+
+def clearLayoutCaches(myTeam):
+    # Layout analyses are shared within a process, every agent class is measured from a cold start
+    myTeam.distanceTables.clear()
+    myTeam.deadEndIndexes.clear()
+    myTeam.layoutAnalyses.clear()
+    gc.collect()
+
+
+def replay(myTeam, className, recordings, seed, traceMemory=False, agentOptions=None, agentClass=None):
+    """
+    Replays the recorded states through fresh agents of the class (agentClass if given, else the class of myTeam.py
+    with that name), made with the given options. Returns the
+    chooseAction() times, the registerInitialState() time, the peak memory allocated if traceMemory is set,
+    and the search iterations of the moves planned with MCTS.
+    """
+    clearLayoutCaches(myTeam)
+    random.seed(seed)
+    if traceMemory:
+        tracemalloc.start()
+    # The agents share a blackboard, as the agents made by createTeam() do
+    blackboard = myTeam.TeamBlackboard()
+    agentClass = agentClass or getattr(myTeam, className)
+    agents = {index: agentClass(index, blackboard=blackboard, **(agentOptions or {})) for index in recordings}
+
+    startTime = time.perf_counter()
+    for index, agent in agents.items():
+        runQuietly(agent.registerInitialState, recordings[index]['initialState'])
+    registerTime = time.perf_counter() - startTime
+
+    moveTimes = []
+    for moveNumber in range(max([len(recording['states']) for recording in recordings.values()])):
+        for index, agent in agents.items():
+            states = recordings[index]['states']
+            if moveNumber < len(states):
+                startTime = time.perf_counter()
+                agent.getAction(states[moveNumber])
+                moveTimes.append(time.perf_counter() - startTime)
+
+    peakMemory = None
+    if traceMemory:
+        peakMemory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    # The composite agents keep their move stats in the agents they wrap
+    planIterations = [n for agent in agents.values() if hasattr(agent, 'moveStats')
+                      for n in agent.moveStats.planIterations]
+    return moveTimes, registerTime, peakMemory, planIterations
+
+
+def getPercentile(values, percentile):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percentile / 100.0 * (len(values) - 1))))]
+
+
+def benchmarkAgent(myTeam, className, recordings, seed, agentOptions=None, agentClass=None):
+    moveTimes, registerTime, _, planIterations = replay(myTeam, className, recordings, seed,
+                                                        agentOptions=agentOptions, agentClass=agentClass)
+    # Memory is traced in a separate replay, tracemalloc slows down every allocation
+    _, _, peakMemory, _ = replay(myTeam, className, recordings, seed, traceMemory=True, agentOptions=agentOptions,
+                                 agentClass=agentClass)
+    stats = {
+        'moves': len(moveTimes),
+        'mean': sum(moveTimes) / len(moveTimes),
+        'p50': getPercentile(moveTimes, 50),
+        'p95': getPercentile(moveTimes, 95),
+        'p99': getPercentile(moveTimes, 99),
+        'max': max(moveTimes),
+        'registerInitialState': registerTime,
+        'peakMemory': peakMemory
+    }
+    if len(planIterations) > 0:
+        stats['meanPlanIterations'] = sum(planIterations) / len(planIterations)
+        stats['minPlanIterations'] = min(planIterations)
+    return stats
+
+
+def getUnmemoizedDefender(myTeam):
+    # myDefensiveAgent without the memo of its guard positions
+    class UnmemoizedDefensiveAgent(myTeam.myDefensiveAgent):
+        def getGuardPosition(self, capsules):
+            return self.computeGuardPosition(capsules)
+    return UnmemoizedDefensiveAgent
+
+
+def benchmarkTraining(capture, myTeam, layout, numEpisodes, seed, engine=None):
+    options = capture.readCommand(['-r', MY_TEAM, '-b', MY_TEAM, '-l', layout, '-n', str(numEpisodes), '-Q'])
+    blackboard = options['agents'][OUR_INDICES[0]].blackboard
+    attacker = myTeam.myAttackingAgent(OUR_INDICES[0], numTraining=numEpisodes, blackboard=blackboard)
+    # The benchmark must not overwrite the weight files
+    attacker.printStatistics = lambda: None
+    options['agents'][OUR_INDICES[0]] = attacker
+
+    random.seed(seed)
+    startTime = time.perf_counter()
+    runQuietly((engine or capture).runGames, **options)
+    elapsed = time.perf_counter() - startTime
+    return {'episodes': numEpisodes, 'seconds': elapsed, 'episodesPerSecond': numEpisodes / elapsed}
+
+
+def runBenchmark(options):
+    capture, engineDir = loadEngine(options.contestDir)
+    import myTeam
+
+    results = {
+        'engine': 'stub' if engineDir == STUB_ENGINE_DIR else 'berkeley',
+        'seed': options.seed,
+        'python': sys.version.split()[0],
+        'planTime': options.planTime,
+        'agents': {className: {} for className in AGENT_CLASSES + [PLANNER_AGENT]
+                   + (GUARD_MEMO_AGENTS if options.guardMemo else [])},
+        'training': {},
+        'trainingFast': {}
+    }
+    for layout in options.layouts.split(','):
+        recordings = recordGame(capture, layout, options.seed)
+        for className in AGENT_CLASSES:
+            results['agents'][className][layout] = benchmarkAgent(myTeam, className, recordings, options.seed)
+            report(className, layout, results['agents'][className][layout])
+        if options.planTime > 0:
+            results['agents'][PLANNER_AGENT][layout] = benchmarkAgent(
+                myTeam, 'myAttackingAgent', recordings, options.seed,
+                {'planner': 'mcts', 'planTime': options.planTime})
+            report(PLANNER_AGENT, layout, results['agents'][PLANNER_AGENT][layout])
+        if options.guardMemo:
+            for name, agentClass in zip(GUARD_MEMO_AGENTS, [None, getUnmemoizedDefender(myTeam)]):
+                results['agents'][name][layout] = benchmarkAgent(
+                    myTeam, 'myDefensiveAgent', recordings, options.seed, {'compiledPolicy': False}, agentClass)
+                report(name, layout, results['agents'][name][layout])
+
+    if options.episodes > 0:
+        layout = options.layouts.split(',')[0]
+        results['training'][layout] = benchmarkTraining(capture, myTeam, layout, options.episodes, options.seed)
+        print('training {}: {:.2f} episodes/s'.format(layout, results['training'][layout]['episodesPerSecond']))
+        # The same games, played by the headless simulator of trainTeam.py --engine fast
+        import fastCapture
+        results['trainingFast'][layout] = benchmarkTraining(capture, myTeam, layout, options.episodes, options.seed,
+                                                            fastCapture)
+        print('training {} (fastCapture): {:.2f} episodes/s'.format(
+            layout, results['trainingFast'][layout]['episodesPerSecond']))
+    return results
+
+
+def report(className, layout, stats):
+    print('{:26} {:16} moves {:5}  p50 {:6.2f}ms  p95 {:6.2f}ms  p99 {:6.2f}ms  max {:6.2f}ms  '
+          'register {:7.1f}ms  peak {:6.2f}MB'.format(
+              className, layout, stats['moves'], stats['p50'] * 1000, stats['p95'] * 1000, stats['p99'] * 1000,
+              stats['max'] * 1000, stats['registerInitialState'] * 1000, stats['peakMemory'] / 1e6))
+    if 'meanPlanIterations' in stats:
+        print('{:26} {:16} plan iterations per move: mean {:.1f}  min {}'.format(
+            className, layout, stats['meanPlanIterations'], stats['minPlanIterations']))
+
+
+def compareResults(results, baseline, tolerance):
+    """
+    Returns a description of every metric that is more than tolerance (a fraction) worse than in the baseline.
+    Agents, layouts and metrics missing from either side are skipped.
+    """
+    regressions = []
+    for className, layouts in results['agents'].items():
+        for layout, stats in layouts.items():
+            baselineStats = baseline.get('agents', {}).get(className, {}).get(layout)
+            if baselineStats is None:
+                continue
+            for metric in LATENCY_METRICS:
+                if stats.get(metric) is not None and baselineStats.get(metric):
+                    ratio = stats[metric] / baselineStats[metric]
+                    if ratio > 1 + tolerance:
+                        regressions.append('{} {} {}: {:.2f}x the baseline'.format(className, layout, metric, ratio))
+    for training in ['training', 'trainingFast']:
+        for layout, stats in results.get(training, {}).items():
+            baselineStats = baseline.get(training, {}).get(layout)
+            if baselineStats is None:
+                continue
+            for metric in THROUGHPUT_METRICS:
+                ratio = stats[metric] / baselineStats[metric]
+                if ratio < 1 / (1 + tolerance):
+                    regressions.append('{} {} {}: {:.2f}x the baseline'.format(training, layout, metric, ratio))
+    return regressions
+
+
+def readCommand(argv):
+    parser = argparse.ArgumentParser(description='Benchmark per-move latency and training throughput of myTeam.py')
+    parser.add_argument('--contestDir', default=None,
+                        help='directory of capture.py and its layouts, the stub engine is used if not given')
+    parser.add_argument('--layouts', default='defaultCapture,mediumCapture,jumboCapture',
+                        help='comma separated layouts')
+    parser.add_argument('--episodes', type=int, default=3, help='training episodes for the throughput benchmark')
+    parser.add_argument('--planTime', type=float, default=0.01,
+                        help='search time per move of the MCTS attacker, 0 to leave it out')
+    parser.add_argument('--guardMemo', action='store_true',
+                        help='also measure the defender with and without the memo of its guard positions')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=None, help='compare the results with this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='fraction by which a metric may be worse than the baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    options = readCommand(argv)
+    workingDir = os.getcwd()
+    results = runBenchmark(options)
+    os.chdir(workingDir)
+
+    if options.output is not None:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if options.baseline is not None:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = compareResults(results, baseline, options.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if len(regressions) > 0:
+            return 1
+        print('No regression against {}'.format(options.baseline))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,346 @@
+# capture.py
+# ----------
+# Minimal stand-in for the capture module of the Berkeley Pacman engine, used by the benchmark when the
+# engine is not available. It follows the capture rules the agents depend on (movement, eating food and
+# capsules, scared timers, deaths, returning food, 5-cell sensing and noisy distances) and the
+# readCommand() / runGames() entry points, without graphics, replays or time limits.
+
+import argparse, importlib.util, os, random
+from game import Actions, AgentState, Configuration, Directions, Grid
+from util import manhattanDistance, nearestPoint
+
+SIGHT_RANGE = 5
+MIN_FOOD = 2
+SCARED_TIME = 40
+COLLISION_TOLERANCE = 0.7
+SONAR_NOISE_RANGE = 13
+SONAR_NOISE_VALUES = [i - (SONAR_NOISE_RANGE - 1) // 2 for i in range(SONAR_NOISE_RANGE)]
+LAYOUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layouts')
+
+
+###########
+# Layouts #
+###########
+
+class Layout:
+    def __init__(self, layoutText):
+        self.width = len(layoutText[0])
+        self.height = len(layoutText)
+        self.walls = Grid(self.width, self.height, False)
+        self.food = Grid(self.width, self.height, False)
+        self.capsules = []
+        self.layoutText = layoutText
+        agentPositions = []
+        for y in range(self.height):
+            for x in range(self.width):
+                c = layoutText[self.height - 1 - y][x]
+                if c == '%':
+                    self.walls[x][y] = True
+                elif c == '.':
+                    self.food[x][y] = True
+                elif c == 'o':
+                    self.capsules.append((x, y))
+                elif c in '1234':
+                    agentPositions.append((int(c), (x, y)))
+        self.agentPositions = [(False, pos) for _, pos in sorted(agentPositions)]
+        self.totalFood = self.food.count()
+
+    def isWall(self, pos):
+        return self.walls[pos[0]][pos[1]]
+
+
+def getLayout(name):
+    fileName = name if name.endswith('.lay') else os.path.join(LAYOUT_DIR, name + '.lay')
+    with open(fileName) as f:
+        return Layout([line.rstrip('\n') for line in f if line.strip()])
+
+
+##############
+# Game state #
+##############
+
+class GameStateData:
+    def __init__(self, prevState=None):
+        if prevState is not None:
+            self.food = prevState.food
+            self.capsules = prevState.capsules[:]
+            self.agentStates = [agentState.copy() for agentState in prevState.agentStates]
+            self.layout = prevState.layout
+            self.score = prevState.score
+            self.timeleft = prevState.timeleft
+
+
+class GameState:
+    def __init__(self, prevState=None):
+        if prevState is not None:
+            self.data = GameStateData(prevState.data)
+            self.redTeam = prevState.redTeam
+            self.blueTeam = prevState.blueTeam
+            self.teams = prevState.teams
+            self.agentDistances = prevState.agentDistances
+        else:
+            self.data = GameStateData()
+            self.agentDistances = []
+
+    def initialize(self, layout, length):
+        self.data.layout = layout
+        self.data.food = layout.food.copy()
+        self.data.capsules = layout.capsules[:]
+        self.data.agentStates = [AgentState(Configuration(pos, Directions.STOP), False)
+                                 for _, pos in layout.agentPositions]
+        self.data.score = 0
+        self.data.timeleft = length
+        self.teams = [self.isRed(agentState.configuration.pos) for agentState in self.data.agentStates]
+        self.redTeam = [i for i, isRed in enumerate(self.teams) if isRed]
+        self.blueTeam = [i for i, isRed in enumerate(self.teams) if not isRed]
+
+    def deepCopy(self):
+        state = GameState(self)
+        state.data.food = self.data.food.copy()
+        return state
+
+    def getLegalActions(self, agentIndex=0):
+        return Actions.getPossibleActions(self.getAgentState(agentIndex).configuration, self.getWalls())
+
+    def generateSuccessor(self, agentIndex, action):
+        if action not in self.getLegalActions(agentIndex):
+            raise Exception('Illegal action ' + str(action))
+        state = GameState(self)
+        applyAction(state, action, agentIndex)
+        checkDeath(state, agentIndex)
+        agentState = state.data.agentStates[agentIndex]
+        agentState.scaredTimer = max(0, agentState.scaredTimer - 1)
+        state.data.timeleft = self.data.timeleft - 1
+        return state
+
+    def makeObservation(self, index):
+        state = self.deepCopy()
+        pos = state.getAgentPosition(index)
+        state.agentDistances = [int(manhattanDistance(pos, state.getAgentPosition(i))
+                                    + random.choice(SONAR_NOISE_VALUES)) for i in range(state.getNumAgents())]
+        team, otherTeam = (self.redTeam, self.blueTeam) if self.isOnRedTeam(index) else (self.blueTeam, self.redTeam)
+        for enemy in otherTeam:
+            enemyPos = state.getAgentPosition(enemy)
+            if all([manhattanDistance(enemyPos, state.getAgentPosition(i)) > SIGHT_RANGE for i in team]):
+                state.data.agentStates[enemy].configuration = None
+        return state
+
+    def getAgentState(self, index):
+        return self.data.agentStates[index]
+
+    def getAgentPosition(self, index):
+        pos = self.data.agentStates[index].getPosition()
+        return None if pos is None else (int(pos[0]), int(pos[1]))
+
+    def getNumAgents(self):
+        return len(self.data.agentStates)
+
+    def getScore(self):
+        return self.data.score
+
+    def getRedFood(self):
+        return halfGrid(self.data.food, red=True)
+
+    def getBlueFood(self):
+        return halfGrid(self.data.food, red=False)
+
+    def getRedCapsules(self):
+        return [c for c in self.data.capsules if c[0] < self.data.layout.width // 2]
+
+    def getBlueCapsules(self):
+        return [c for c in self.data.capsules if c[0] >= self.data.layout.width // 2]
+
+    def getCapsules(self):
+        return self.data.capsules
+
+    def getWalls(self):
+        return self.data.layout.walls
+
+    def hasFood(self, x, y):
+        return self.data.food[x][y]
+
+    def hasWall(self, x, y):
+        return self.data.layout.walls[x][y]
+
+    def getRedTeamIndices(self):
+        return self.redTeam[:]
+
+    def getBlueTeamIndices(self):
+        return self.blueTeam[:]
+
+    def isOnRedTeam(self, agentIndex):
+        return self.teams[agentIndex]
+
+    def isRed(self, pos):
+        return pos[0] < self.data.layout.width // 2
+
+    def getAgentDistances(self):
+        return self.agentDistances
+
+    def getDistanceProb(self, trueDistance, noisyDistance):
+        return 1.0 / SONAR_NOISE_RANGE if noisyDistance - trueDistance in SONAR_NOISE_VALUES else 0
+
+    def getInitialAgentPosition(self, agentIndex):
+        return self.data.layout.agentPositions[agentIndex][1]
+
+
+def halfGrid(grid, red):
+    halfway = grid.width // 2
+    half = Grid(grid.width, grid.height, False)
+    for x in (range(halfway) if red else range(halfway, grid.width)):
+        half.data[x] = grid.data[x][:]
+    return half
+
+
+#########
+# Rules #
+#########
+
+def applyAction(state, action, agentIndex):
+    agentState = state.data.agentStates[agentIndex]
+    agentState.configuration = agentState.configuration.generateSuccessor(Actions.directionToVector(action))
+    pos = nearestPoint(agentState.configuration.getPosition())
+    isRed = state.isOnRedTeam(agentIndex)
+    agentState.isPacman = isRed != state.isRed(pos)
+
+    if agentState.numCarrying > 0 and not agentState.isPacman:
+        state.data.score += agentState.numCarrying if isRed else -agentState.numCarrying
+        agentState.numReturned += agentState.numCarrying
+        agentState.numCarrying = 0
+
+    if agentState.isPacman:
+        x, y = pos
+        if state.data.food[x][y]:
+            state.data.food = state.data.food.copy()
+            state.data.food[x][y] = False
+            agentState.numCarrying += 1
+        elif pos in state.data.capsules:
+            state.data.capsules.remove(pos)
+            for index in (state.blueTeam if isRed else state.redTeam):
+                state.data.agentStates[index].scaredTimer = SCARED_TIME
+
+
+def checkDeath(state, agentIndex):
+    agentState = state.data.agentStates[agentIndex]
+    otherTeam = state.blueTeam if state.isOnRedTeam(agentIndex) else state.redTeam
+    for index in otherTeam:
+        otherAgentState = state.data.agentStates[index]
+        if otherAgentState.isPacman == agentState.isPacman:
+            continue
+        if manhattanDistance(otherAgentState.getPosition(), agentState.getPosition()) > COLLISION_TOLERANCE:
+            continue
+        pacmanIndex, ghostState = (agentIndex, otherAgentState) if agentState.isPacman else (index, agentState)
+        pacmanState = state.data.agentStates[pacmanIndex]
+        if ghostState.scaredTimer <= 0:
+            dumpFood(state, pacmanState, state.isOnRedTeam(pacmanIndex))
+            killAgent(pacmanState)
+        else:
+            killAgent(ghostState)
+
+
+def killAgent(agentState):
+    agentState.isPacman = False
+    agentState.configuration = agentState.start
+    agentState.scaredTimer = 0
+
+
+# The food carried by a dead Pacman goes back to the free cells nearest to where it died
+def dumpFood(state, pacmanState, isRed):
+    layout = state.data.layout
+    x0, y0 = nearestPoint(pacmanState.getPosition())
+    cells = sorted([(abs(x - x0) + abs(y - y0), x, y) for x in range(layout.width) for y in range(layout.height)
+                    if not layout.walls[x][y] and state.isRed((x, y)) != isRed])
+    state.data.food = state.data.food.copy()
+    numToDump = pacmanState.numCarrying
+    for _, x, y in cells:
+        if numToDump == 0:
+            break
+        if not state.data.food[x][y] and (x, y) not in state.data.capsules:
+            state.data.food[x][y] = True
+            numToDump -= 1
+    pacmanState.numCarrying = 0
+
+
+#########
+# Games #
+#########
+
+class Game:
+    def __init__(self, agents, state):
+        self.agents = agents
+        self.state = state
+        self.moveHistory = []
+        self.totalAgentTimes = [0.0 for _ in agents]
+
+
+def loadAgents(isRed, factory, agentArgs):
+    if not factory.endswith('.py'):
+        factory += '.py'
+    spec = importlib.util.spec_from_file_location('player' + str(int(isRed)), factory)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    indices = [2 * i + (0 if isRed else 1) for i in range(2)]
+    return module.createTeam(indices[0], indices[1], isRed, **agentArgs)
+
+
+def parseAgentArgs(s):
+    opts = {}
+    for pair in (s.split(',') if s else []):
+        key, value = pair.split('=') if '=' in pair else (pair, 1)
+        opts[key] = value
+    return opts
+
+
+def readCommand(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--red', default='baselineTeam')
+    parser.add_argument('-b', '--blue', default='baselineTeam')
+    parser.add_argument('--redOpts', default='')
+    parser.add_argument('--blueOpts', default='')
+    parser.add_argument('-l', '--layout', default='defaultCapture')
+    parser.add_argument('-n', '--numGames', type=int, default=1)
+    parser.add_argument('-i', '--time', type=int, default=1200)
+    parser.add_argument('-x', '--numTraining', type=int, default=0)
+    parser.add_argument('-q', '--quiet', action='store_true')
+    parser.add_argument('-Q', '--super-quiet', action='store_true')
+    options = parser.parse_args(argv)
+
+    redArgs = parseAgentArgs(options.redOpts)
+    blueArgs = parseAgentArgs(options.blueOpts)
+    if options.numTraining > 0:
+        redArgs['numTraining'] = blueArgs['numTraining'] = options.numTraining
+    redAgents = loadAgents(True, options.red, redArgs)
+    blueAgents = loadAgents(False, options.blue, blueArgs)
+    agents = [agent for pair in zip(redAgents, blueAgents) for agent in pair]
+    return dict(layouts=[getLayout(options.layout) for _ in range(options.numGames)], agents=agents, display=None,
+                length=options.time, numGames=options.numGames, record=False, numTraining=options.numTraining,
+                redTeamName=options.red, blueTeamName=options.blue, muteAgents=options.super_quiet,
+                catchExceptions=False)
+
+
+def runGames(layouts, agents, display, length, numGames, record, numTraining, redTeamName, blueTeamName,
+             muteAgents=False, catchExceptions=False, delay_step=0):
+    games = []
+    for i in range(numGames):
+        state = GameState()
+        state.initialize(layouts[i], length)
+        game = Game(agents, state)
+        for agent in agents:
+            agent.registerInitialState(state.deepCopy())
+
+        agentIndex = 0
+        while state.data.timeleft > 0:
+            agent = agents[agentIndex]
+            observation = agent.observationFunction(state.deepCopy())
+            action = agent.getAction(observation)
+            game.moveHistory.append((agentIndex, action))
+            state = state.generateSuccessor(agentIndex, action)
+            if state.getRedFood().count() <= MIN_FOOD or state.getBlueFood().count() <= MIN_FOOD:
+                break
+            agentIndex = (agentIndex + 1) % len(agents)
+
+        game.state = state
+        for agent in agents:
+            agent.final(state)
+        games.append(game)
+    return games
@@ -0,0 +1,83 @@
+# captureAgents.py
+# ----------------
+# Minimal stand-in for the captureAgents module of the Berkeley Pacman engine, used by the benchmark
+# when the engine is not available. Only what myTeam.py uses is implemented.
+
+from collections import deque
+from game import Agent, Actions
+
+
+class CaptureAgent(Agent):
+    def __init__(self, index, timeForComputing=.1):
+        self.index = index
+        self.red = None
+        self.agentsOnTeam = None
+        self.distances = None
+        self.observationHistory = []
+        self.timeForComputing = timeForComputing
+        self.display = None
+
+    def registerInitialState(self, gameState):
+        self.red = gameState.isOnRedTeam(self.index)
+        self.registerTeam(self.getTeam(gameState))
+        self.distances = {}
+        self.walls = gameState.getWalls()
+
+    def final(self, gameState):
+        self.observationHistory = []
+
+    def registerTeam(self, agentsOnTeam):
+        self.agentsOnTeam = agentsOnTeam
+
+    def observationFunction(self, gameState):
+        return gameState.makeObservation(self.index)
+
+    def getAction(self, gameState):
+        self.observationHistory.append(gameState)
+        return self.chooseAction(gameState)
+
+    def chooseAction(self, gameState):
+        raise NotImplementedError
+
+    def getFood(self, gameState):
+        return gameState.getBlueFood() if self.red else gameState.getRedFood()
+
+    def getFoodYouAreDefending(self, gameState):
+        return gameState.getRedFood() if self.red else gameState.getBlueFood()
+
+    def getCapsules(self, gameState):
+        return gameState.getBlueCapsules() if self.red else gameState.getRedCapsules()
+
+    def getCapsulesYouAreDefending(self, gameState):
+        return gameState.getRedCapsules() if self.red else gameState.getBlueCapsules()
+
+    def getOpponents(self, gameState):
+        return gameState.getBlueTeamIndices() if self.red else gameState.getRedTeamIndices()
+
+    def getTeam(self, gameState):
+        return gameState.getRedTeamIndices() if self.red else gameState.getBlueTeamIndices()
+
+    def getScore(self, gameState):
+        return gameState.getScore() if self.red else gameState.getScore() * -1
+
+    # BFS from pos1, memoized per source cell
+    def getMazeDistance(self, pos1, pos2):
+        if pos1 not in self.distances:
+            distances = {pos1: 0}
+            queue = deque([pos1])
+            while queue:
+                pos = queue.popleft()
+                for neighbor in Actions.getLegalNeighbors(pos, self.walls):
+                    if neighbor not in distances:
+                        distances[neighbor] = distances[pos] + 1
+                        queue.append(neighbor)
+            self.distances[pos1] = distances
+        return self.distances[pos1][pos2]
+
+    def getPreviousObservation(self):
+        if len(self.observationHistory) <= 1:
+            return None
+        return self.observationHistory[-2]
+
+    def getCurrentObservation(self):
+        return self.observationHistory[-1]
@@ -0,0 +1,165 @@
+# game.py
+# -------
+# Minimal stand-in for the game module of the Berkeley Pacman engine, used by the benchmark when the
+# engine is not available. Only what myTeam.py and the stub engine use is implemented.
+
+
+class Agent:
+    def __init__(self, index=0):
+        self.index = index
+
+
+class Directions:
+    NORTH = 'North'
+    SOUTH = 'South'
+    EAST = 'East'
+    WEST = 'West'
+    STOP = 'Stop'
+
+    LEFT = {NORTH: WEST, SOUTH: EAST, EAST: NORTH, WEST: SOUTH, STOP: STOP}
+    RIGHT = dict([(y, x) for x, y in LEFT.items()])
+    REVERSE = {NORTH: SOUTH, SOUTH: NORTH, EAST: WEST, WEST: EAST, STOP: STOP}
+
+
+class Configuration:
+    def __init__(self, pos, direction):
+        self.pos = pos
+        self.direction = direction
+
+    def getPosition(self):
+        return self.pos
+
+    def getDirection(self):
+        return self.direction
+
+    def __eq__(self, other):
+        if other is None:
+            return False
+        return self.pos == other.pos and self.direction == other.direction
+
+    def __hash__(self):
+        return hash((self.pos, self.direction))
+
+    def generateSuccessor(self, vector):
+        x, y = self.pos
+        dx, dy = vector
+        direction = Actions.vectorToDirection(vector)
+        if direction == Directions.STOP:
+            direction = self.direction
+        return Configuration((x + dx, y + dy), direction)
+
+
+class AgentState:
+    def __init__(self, startConfiguration, isPacman):
+        self.start = startConfiguration
+        self.configuration = startConfiguration
+        self.isPacman = isPacman
+        self.scaredTimer = 0
+        self.numCarrying = 0
+        self.numReturned = 0
+
+    def copy(self):
+        state = AgentState(self.start, self.isPacman)
+        state.configuration = self.configuration
+        state.scaredTimer = self.scaredTimer
+        state.numCarrying = self.numCarrying
+        state.numReturned = self.numReturned
+        return state
+
+    def getPosition(self):
+        if self.configuration is None:
+            return None
+        return self.configuration.getPosition()
+
+    def getDirection(self):
+        return self.configuration.getDirection()
+
+
+class Grid:
+    def __init__(self, width, height, initialValue=False):
+        self.width = width
+        self.height = height
+        self.data = [[initialValue for y in range(height)] for x in range(width)]
+
+    def __getitem__(self, i):
+        return self.data[i]
+
+    def __setitem__(self, key, item):
+        self.data[key] = item
+
+    def __eq__(self, other):
+        if other is None:
+            return False
+        return self.data == other.data
+
+    def __hash__(self):
+        return hash(tuple([tuple(column) for column in self.data]))
+
+    def copy(self):
+        grid = Grid(self.width, self.height)
+        grid.data = [column[:] for column in self.data]
+        return grid
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        grid = Grid(self.width, self.height)
+        grid.data = self.data
+        return grid
+
+    def count(self, item=True):
+        return sum([column.count(item) for column in self.data])
+
+    def asList(self, key=True):
+        return [(x, y) for x in range(self.width) for y in range(self.height) if self.data[x][y] == key]
+
+
+class Actions:
+    _directions = {Directions.NORTH: (0, 1), Directions.SOUTH: (0, -1),
+                   Directions.EAST: (1, 0), Directions.WEST: (-1, 0), Directions.STOP: (0, 0)}
+    _directionsAsList = list(_directions.items())
+
+    @staticmethod
+    def reverseDirection(action):
+        return Directions.REVERSE[action]
+
+    @staticmethod
+    def vectorToDirection(vector):
+        dx, dy = vector
+        if dy > 0:
+            return Directions.NORTH
+        if dy < 0:
+            return Directions.SOUTH
+        if dx < 0:
+            return Directions.WEST
+        if dx > 0:
+            return Directions.EAST
+        return Directions.STOP
+
+    @staticmethod
+    def directionToVector(direction, speed=1.0):
+        dx, dy = Actions._directions[direction]
+        return (dx * speed, dy * speed)
+
+    @staticmethod
+    def getPossibleActions(config, walls):
+        x, y = config.pos
+        return [direction for direction, (dx, dy) in Actions._directionsAsList
+                if not walls[int(x + dx)][int(y + dy)]]
+
+    @staticmethod
+    def getLegalNeighbors(position, walls):
+        x, y = position
+        neighbors = []
+        for _, (dx, dy) in Actions._directionsAsList:
+            nextX, nextY = int(x + dx), int(y + dy)
+            if 0 <= nextX < walls.width and 0 <= nextY < walls.height and not walls[nextX][nextY]:
+                neighbors.append((nextX, nextY))
+        return neighbors
+
+    @staticmethod
+    def getSuccessor(position, action):
+        dx, dy = Actions.directionToVector(action)
+        x, y = position
+        return (x + dx, y + dy)
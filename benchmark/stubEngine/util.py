@@ -0,0 +1,54 @@
+# util.py
+# -------
+# Minimal stand-in for the util module of the Berkeley Pacman engine, used by the benchmark when the
+# engine is not available. Only what myTeam.py and the stub engine use is implemented.
+
+import random
+
+
+def manhattanDistance(xy1, xy2):
+    return abs(xy1[0] - xy2[0]) + abs(xy1[1] - xy2[1])
+
+
+def nearestPoint(pos):
+    return (int(pos[0] + 0.5), int(pos[1] + 0.5))
+
+
+def flipCoin(p):
+    return random.random() < p
+
+
+class Counter(dict):
+    def __getitem__(self, idx):
+        self.setdefault(idx, 0)
+        return dict.__getitem__(self, idx)
+
+    def argMax(self):
+        if len(self) == 0:
+            return None
+        return max(self.items(), key=lambda item: item[1])[0]
+
+    def totalCount(self):
+        return sum(self.values())
+
+    def incrementAll(self, keys, count):
+        for key in keys:
+            self[key] += count
+
+    def divideAll(self, divisor):
+        for key in self:
+            self[key] /= float(divisor)
+
+    def normalize(self):
+        total = float(self.totalCount())
+        if total != 0:
+            self.divideAll(total)
+
+    def copy(self):
+        return Counter(dict.copy(self))
+
+    def __mul__(self, y):
+        x = self
+        if len(x) > len(y):
+            x, y = y, x
+        return sum([x[key] * y[key] for key in x if key in y])
@@ -0,0 +1,52 @@
+# compilePolicies.py
+# ------------------
+# Offline compiler of the defense policy tables of myTeam.py.
+#
+# myDefensiveAgent plays with fixed weights, so its action only depends on its cell, the cell it steers to and
+# the kind of target (see DefensePolicyTable). The agents only load the tables of a layout from layoutCache in
+# registerInitialState(), and play without one otherwise; this script compiles the tables of both teams, e.g.
+#   python compilePolicies.py --contestDir ../pacman-contest --layouts defaultCapture,jumboCapture,RANDOM1,RANDOM2
+
+import argparse, os, sys, time
+
+from trainTeam import MY_TEAM, importCapture
+from benchmark.runBenchmark import runQuietly
+
+
+def compileLayout(capture, myTeam, layoutName, weights):
+    # The layouts are read as capture.py reads them, RANDOM<seed> included
+    options = runQuietly(capture.readCommand, ['-r', MY_TEAM, '-b', MY_TEAM, '-l', layoutName, '-Q'])
+    layout = options['layouts'][0]
+    for red in [True, False]:
+        startTime = time.perf_counter()
+        layoutAnalysis = myTeam.getLayoutAnalysis(layout, red)
+        table = myTeam.getDefensePolicyTable(layoutAnalysis, weights, compile=True)
+        elapsed = time.perf_counter() - startTime
+        if table is None:
+            print('{} {}: no table, the weights do not only break ties with reverse'.format(
+                layoutName, 'red' if red else 'blue'))
+            continue
+        print('{} {}: {} cells, {:.2f}MB in {:.2f}s, {}'.format(
+            layoutName, 'red' if red else 'blue', layoutAnalysis.distanceTable.numCells,
+            table.bestActions.nbytes / 1e6, elapsed, table.fileName))
+
+
+def readCommand(argv):
+    parser = argparse.ArgumentParser(description='Compile the defense policy tables of myTeam.py for some layouts')
+    parser.add_argument('--contestDir', default='.', help='directory of capture.py and its layouts')
+    parser.add_argument('--layouts', default='defaultCapture', help='comma separated layouts')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    options = readCommand(argv)
+    capture = importCapture(os.path.abspath(options.contestDir))
+    import myTeam
+    weights = myTeam.myDefensiveAgent(0).getWeights()
+    for layoutName in options.layouts.split(','):
+        compileLayout(capture, myTeam, layoutName, weights)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
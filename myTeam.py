@@ -15,7 +15,55 @@
 from captureAgents import CaptureAgent
 import random, time, util
 from game import Directions, Actions
-from copy import deepcopy
+from collections import OrderedDict, deque, namedtuple
+import array, ast, csv, gzip, hashlib, json, os
+import numpy as np
+
+# Directory where precomputed layout data is saved, so that later games on the same map can reuse it
+LAYOUT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layoutCache')
+
+# The contest allows 1 second per move. Our agents aim to answer within MOVE_TIME_BUDGET seconds
+# and drop their expensive features once DEGRADE_FRACTION of it is spent.
+MOVE_TIME_BUDGET = 0.8
+DEGRADE_FRACTION = 0.5
+
+# With the moveStats option (e.g. --redOpts moveStats=1), per-game move timing statistics are appended to this file,
+# one JSON line per agent and game
+MOVE_STATS_FILE = 'moveTimeStats'
+
+# Trained weights are loaded at startup from '<agent class>Weights.json' in WEIGHTS_DIR, if it exists.
+# Training rewrites that file and appends to WEIGHT_HISTORY_FILE every CHECKPOINT_EVERY episodes.
+WEIGHTS_DIR = os.path.dirname(os.path.abspath(__file__))
+WEIGHT_HISTORY_FILE = 'weightHistory.jsonl'
+CHECKPOINT_EVERY = 10
+
+# Experience replay is off by default (REPLAY_CAPACITY = 0): each transition is learnt online, once.
+# Otherwise transitions are stored and learnt in mini-batches of REPLAY_BATCH_SIZE, every REPLAY_EVERY
+# transitions and REPLAY_EPISODE_BATCHES times at the end of each episode.
+REPLAY_CAPACITY = 0
+REPLAY_BATCH_SIZE = 32
+REPLAY_EVERY = 0
+REPLAY_EPISODE_BATCHES = 50
+# Prioritized replay samples transitions with probability (|TD error| + epsilon) ** alpha
+REPLAY_PRIORITY_ALPHA = 0.6
+REPLAY_PRIORITY_BETA = 0.4
+REPLAY_PRIORITY_EPSILON = 0.01
+
+# Rewards of myAttackingAgent.getReward(), also given by the model of the MCTS planner. Each can be overridden
+# with the agent option of the same name, e.g. --redOpts rewardPallet=10 (see sweepTeam.py)
+ATTACKER_REWARDS = {
+    'rewardEaten': -100,
+    'rewardReturnPerPallet': 50,
+    'rewardPallet': 5,
+    'rewardCapsule': 30,
+    'rewardStop': -5
+}
+
+# Profiles are appended to PROFILE_FILE + '.jsonl' or '.csv', and to PROFILE_FILE + '.collapsed' for flame graphs
+PROFILE_FILE = 'profile'
+
+# Options of createTeam() that only the first agent gets
+FIRST_AGENT_OPTIONS = ('numTraining',)
 
 #################
 # Team creation #
@@ -38,26 +86,1623 @@ def createTeam(firstIndex, secondIndex, isRed, **kwargs):
     """
 
     # The following line is an example only; feel free to change it.
-    return [myDefendingAttacker(firstIndex, **kwargs), myAttackingDefender(secondIndex)]
+    # The options (e.g. --redOpts profile=csv,planner=mcts,weightsFile=...) reach both agents, but only the
+    # first one learns, so that the two attackers do not write the same weights file.
+    secondOptions = {name: value for name, value in kwargs.items() if name not in FIRST_AGENT_OPTIONS}
+    # Both agents share the facts they derive from the game, and where the opponents are believed to be
+    blackboard = TeamBlackboard()
+    return [myDefendingAttacker(firstIndex, blackboard=blackboard, **kwargs),
+            myAttackingDefender(secondIndex, blackboard=blackboard, **secondOptions)]
+
+##################
+# Maze distances #
+##################
+
+# Distance tables of the layouts seen by this process, shared by all of our agents
+distanceTables = {}
+
+def getDistanceTable(layout):
+    layoutHash = getLayoutHash(layout.walls)
+    if layoutHash not in distanceTables:
+        distanceTables[layoutHash] = DistanceTable(layout.walls, layoutHash)
+    return distanceTables[layoutHash]
+
+def getLayoutHash(walls):
+    wallBits = ''.join(['1' if walls[x][y] else '0' for x in range(walls.width) for y in range(walls.height)])
+    return hashlib.md5('{}x{}:{}'.format(walls.width, walls.height, wallBits).encode()).hexdigest()
+
+class DistanceTable:
+    """
+    Maze distances between every pair of open cells of a layout, computed with one BFS per open cell.
+    Cell ids are looked up in the flat array cellIds[x * height + y] (-1 for walls), and the distance
+    between cells i and j is distances[i * numCells + j], stored as unsigned 16-bit integers.
+    The table takes 2 * numCells^2 bytes, e.g. ~0.5MB for 500 open cells and ~8MB for 2000 open cells.
+    """
+    UNREACHABLE = 0xFFFF
+
+    def __init__(self, walls, layoutHash):
+        self.width = walls.width
+        self.height = walls.height
+        self.cellIds = array.array('i', [-1]) * (self.width * self.height)
+        self.cells = []
+        for x in range(self.width):
+            for y in range(self.height):
+                if not walls[x][y]:
+                    self.cellIds[x * self.height + y] = len(self.cells)
+                    self.cells.append((x, y))
+        self.numCells = len(self.cells)
+        cells = np.array(self.cells, dtype=int).reshape(-1, 2)
+        self.cellXs = cells[:, 0]
+        self.cellYs = cells[:, 1]
+
+        # Ids of the open cells next to each open cell
+        self.neighbors = []
+        for x, y in self.cells:
+            self.neighbors.append([self.getCellId(n) for n in [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+                                   if 0 <= n[0] < self.width and 0 <= n[1] < self.height and self.getCellId(n) >= 0])
+
+        self.layoutHash = layoutHash
+        self.fileName = os.path.join(LAYOUT_CACHE_DIR, 'distances_{}.bin'.format(layoutHash))
+        self.distances = self.load()
+        if self.distances is None:
+            self.distances = self.compute()
+            self.save()
+        # (numCells x numCells) NumPy view of the same memory, for queries over many cells at once
+        self.matrix = np.frombuffer(self.distances, dtype=np.uint16).reshape(self.numCells, self.numCells)
+
+    def getCellId(self, pos):
+        return self.cellIds[int(pos[0]) * self.height + int(pos[1])]
+
+    def getDistance(self, pos1, pos2):
+        height = self.height
+        i = self.cellIds[int(pos1[0]) * height + int(pos1[1])]
+        j = self.cellIds[int(pos2[0]) * height + int(pos2[1])]
+        return self.distances[i * self.numCells + j]
+
+    # Distance from every cell to the nearest of the given positions, as a NumPy array indexed by cell id
+    def getDistanceField(self, positions):
+        if len(positions) == 0:
+            return np.full(self.numCells, self.UNREACHABLE, dtype=np.uint16)
+        return self.matrix[[self.getCellId(pos) for pos in positions]].min(axis=0)
+
+    # Boolean masks over the cell ids, of a Grid of booleans (such as the food) or of a list of positions.
+    # The grids of fastCapture.py hold a NumPy array, which is used as it is.
+    def getGridMask(self, grid):
+        array = getattr(grid, 'array', None)
+        return np.asarray(grid.data if array is None else array, dtype=bool)[self.cellXs, self.cellYs]
+
+    def getPositionMask(self, positions):
+        mask = np.zeros(self.numCells, dtype=bool)
+        mask[[self.getCellId(pos) for pos in positions]] = True
+        return mask
+
+    # Positions of a mask, in cell order (the order of Grid.asList())
+    def getPositions(self, mask):
+        return [self.cells[cell] for cell in np.flatnonzero(mask)]
+
+    # Same as getDistanceField(), for the positions of a mask
+    def getMaskDistanceField(self, mask):
+        if not mask.any():
+            return np.full(self.numCells, self.UNREACHABLE, dtype=np.uint16)
+        return self.matrix[mask].min(axis=0)
+
+    # Index of the nearest of the given positions for every cell (the first one on ties)
+    def getNearestField(self, positions):
+        return self.matrix[[self.getCellId(pos) for pos in positions]].argmin(axis=0)
+
+    def getMemoryUsage(self):
+        return self.distances.itemsize * len(self.distances) + self.cellIds.itemsize * len(self.cellIds)
+
+    def compute(self):
+        neighbors = self.neighbors
+        distances = array.array('H')
+        for source in range(self.numCells):
+            row = array.array('H', [self.UNREACHABLE]) * self.numCells
+            row[source] = 0
+            queue = deque([source])
+            while queue:
+                cell = queue.popleft()
+                nextDist = row[cell] + 1
+                for n in neighbors[cell]:
+                    if row[n] == self.UNREACHABLE:
+                        row[n] = nextDist
+                        queue.append(n)
+            distances.extend(row)
+        return distances
+
+    # The saved table is only reused if it has the expected size for this layout
+    def load(self):
+        try:
+            with open(self.fileName, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        distances = array.array('H')
+        if len(data) != distances.itemsize * self.numCells * self.numCells:
+            return None
+        distances.frombytes(data)
+        return distances
+
+    # Saving is best effort: a read-only directory only means the table is recomputed next game
+    def save(self):
+        tmpFileName = '{}.{}.tmp'.format(self.fileName, os.getpid())
+        try:
+            os.makedirs(LAYOUT_CACHE_DIR, exist_ok=True)
+            with open(tmpFileName, 'wb') as f:
+                self.distances.tofile(f)
+            os.replace(tmpFileName, self.fileName)
+        except OSError:
+            pass
+
+##################
+# Dead-end paths #
+##################
+
+# Dead-end indexes of the layouts seen by this process, keyed by layout hash and half of the layout
+deadEndIndexes = {}
+
+def getDeadEndIndex(layout, startX, endX):
+    key = (getLayoutHash(layout.walls), startX, endX)
+    if key not in deadEndIndexes:
+        deadEndIndexes[key] = DeadEndIndex(layout.walls, startX, endX)
+    return deadEndIndexes[key]
+
+class DeadEndIndex:
+    """
+    Dead-end paths of the columns startX <= x < endX of a layout. An open cell with 3 or more walls around it
+    is a dead end, and is then treated as a wall itself, so the paths are peeled from their closed end with
+    a queue over a bitmap of open cells. For each dead-end cell, depth is the number of steps to escape to
+    the nearest open cell that is not a dead end, and exit is that cell.
+    """
+    NO_EXIT = -1
+
+    def __init__(self, walls, startX, endX):
+        self.width = walls.width
+        self.height = walls.height
+        height = self.height
+
+        isOpen = bytearray(self.width * height)
+        for x in range(self.width):
+            for y in range(height):
+                isOpen[x * height + y] = not walls[x][y]
+
+        # Neighbours outside the layout are not counted as walls
+        def getNeighbors(cell):
+            x, y = divmod(cell, height)
+            return [nx * height + ny for nx, ny in [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+                    if 0 <= nx < self.width and 0 <= ny < height]
+
+        wallCounts = {}
+        queue = deque()
+        for x in range(startX, endX):
+            for y in range(height):
+                cell = x * height + y
+                if isOpen[cell]:
+                    wallCounts[cell] = len([n for n in getNeighbors(cell) if not isOpen[n]])
+                    if wallCounts[cell] >= 3:
+                        queue.append(cell)
+
+        self.deadEnds = bytearray(self.width * height)
+        while queue:
+            cell = queue.popleft()
+            self.deadEnds[cell] = 1
+            isOpen[cell] = 0
+            for n in getNeighbors(cell):
+                if n in wallCounts and isOpen[n]:
+                    wallCounts[n] += 1
+                    if wallCounts[n] == 3:
+                        queue.append(n)
+
+        # Multi-source BFS from the open cells that are not dead ends, through the dead-end cells
+        self.depths = array.array('H', [0]) * (self.width * height)
+        self.exits = array.array('i', [self.NO_EXIT]) * (self.width * height)
+        queue = deque()
+        for cell in range(self.width * height):
+            if isOpen[cell]:
+                self.exits[cell] = cell
+                queue.append(cell)
+        while queue:
+            cell = queue.popleft()
+            for n in getNeighbors(cell):
+                if self.deadEnds[n] and self.exits[n] == self.NO_EXIT:
+                    self.depths[n] = self.depths[cell] + 1
+                    self.exits[n] = self.exits[cell]
+                    queue.append(n)
+
+        self.deadEndPositions = frozenset([divmod(cell, height) for cell in range(self.width * height)
+                                           if self.deadEnds[cell]])
+        self.openPositions = tuple([(x, y) for x in range(startX, endX) for y in range(height)
+                                    if isOpen[x * height + y]])
+
+    def isDeadEnd(self, pos):
+        return self.deadEnds[int(pos[0]) * self.height + int(pos[1])] == 1
+
+    # Number of steps from a dead-end cell to its exit, 0 for the other cells
+    def getDepth(self, pos):
+        return self.depths[int(pos[0]) * self.height + int(pos[1])]
+
+    # Open cell where the dead-end path of pos starts, pos itself if it is not a dead end,
+    # None if it is a wall or its whole region is a dead end
+    def getExit(self, pos):
+        cell = self.exits[int(pos[0]) * self.height + int(pos[1])]
+        if cell == self.NO_EXIT:
+            return None
+        return divmod(cell, self.height)
+
+###################
+# Layout analysis #
+###################
+
+# Layout analyses of the layouts seen by this process, keyed by layout hash and team
+layoutAnalyses = {}
+
+def getLayoutAnalysis(layout, red):
+    key = (getLayoutHash(layout.walls), red)
+    if key not in layoutAnalyses:
+        layoutAnalyses[key] = LayoutAnalysis(layout, red)
+    return layoutAnalyses[key]
+
+class LayoutAnalysis:
+    """
+    Everything our agents precompute about a layout for one team, computed once per process and shared
+    by all of our agents, including the ones wrapped by myAttackingDefender and myDefendingAttacker.
+    Agents get read-only views: positions are tuples and frozensets and must not be modified.
+    """
+    def __init__(self, layout, red):
+        walls = layout.walls
+        self.width = int(layout.width)
+        self.height = int(layout.height)
+        self.distanceTable = getDistanceTable(layout)
+
+        # Red area is on the left of the layout. Position (0,0) is at the bottom-left corner of the layout.
+        # The invasion area of the blue team stops one column before the border, as it always did.
+        if red:
+            self.homeStartX = 0
+            self.homeEndX = int(self.width / 2) - 1
+            self.homeBorderX = self.homeEndX
+            self.invasionStartX = int(self.width / 2)
+            self.invasionEndX = self.width
+        else:
+            self.homeStartX = int(self.width / 2)
+            self.homeEndX = self.width - 1
+            self.homeBorderX = self.homeStartX
+            self.invasionStartX = 0
+            self.invasionEndX = int(self.width / 2) - 1
+
+        # Open positions on our side of the border, from which our agents enter the opponent's area
+        self.doorPositions = tuple([(self.homeBorderX, y) for y in range(self.height)
+                                    if not walls[self.homeBorderX][y]])
+
+        # Open positions of both halves, in column order
+        self.homePositions = tuple([(x, y) for x in range(self.homeStartX, self.homeEndX + 1)
+                                    for y in range(self.height) if not walls[x][y]])
+
+        # Dead-end paths of the invasion area and the other open positions there
+        self.deadEndIndex = getDeadEndIndex(layout, self.invasionStartX, self.invasionEndX)
+        self.deadEndPositions = self.deadEndIndex.deadEndPositions
+        self.openPositions = self.deadEndIndex.openPositions
+        # Distance from every cell to the nearest open position of the invasion area
+        self.openPositionDistances = self.distanceTable.getDistanceField(self.openPositions)
+
+        self.strategicMap = StrategicMap(self.distanceTable, self.homePositions, self.doorPositions)
+        # Keys of the states of this layout, shared by the memoization layers of the agents
+        self.zobristHasher = ZobristHasher(self.distanceTable, len(layout.agentPositions))
+        # Compiled policies of myDefensiveAgent, keyed by weights, see getDefensePolicyTable()
+        self.defensePolicyTables = {}
+
+# Regions that a single cell cuts off from a set of home cells, given as neighbour lists. The search starts from
+# a virtual root next to every home cell, so a subtree cut off by its parent cannot hold a home cell; the region
+# of a choke point is the union of the subtrees it cuts off.
+# Returns, for each cell, the choke point of the smallest such region it is in and the number of cells of
+# that region (-1 and 0 if no single cell cuts it off).
+def getChokeRegions(neighbors, homeCells):
+    root = len(neighbors)
+    homeCells = list(homeCells)
+    isHome = set(homeCells)
+    graph = [list(cellNeighbors) + ([root] if cell in isHome else []) for cell, cellNeighbors in enumerate(neighbors)]
+    graph.append(homeCells)
+
+    order = [-1] * len(graph)
+    low = [0] * len(graph)
+    parents = [-1] * len(graph)
+    subtreeSizes = [1] * len(graph)
+    cutOff = [False] * len(graph)
+    cutOffSizes = [0] * len(graph)
+    preorder = []
+    order[root] = 0
+    counter = 1
+    stack = [(root, -1, iter(graph[root]))]
+    while stack:
+        cell, parent, children = stack[-1]
+        for child in children:
+            if order[child] == -1:
+                order[child] = low[child] = counter
+                counter += 1
+                parents[child] = cell
+                preorder.append(child)
+                stack.append((child, cell, iter(graph[child])))
+                break
+            elif child != parent:
+                low[cell] = min(low[cell], order[child])
+        else:
+            stack.pop()
+            if parent != -1 and parent != root:
+                low[parent] = min(low[parent], low[cell])
+                subtreeSizes[parent] += subtreeSizes[cell]
+                if low[cell] >= order[parent]:
+                    cutOff[cell] = True
+                    cutOffSizes[parent] += subtreeSizes[cell]
+
+    # Parents come before their children in preorder, the deepest cut off subtree is the smallest region
+    chokeCells = np.full(len(neighbors), -1, dtype=np.int32)
+    regionSizes = np.zeros(len(neighbors), dtype=np.int32)
+    for cell in preorder:
+        if cutOff[cell]:
+            chokeCells[cell] = parents[cell]
+            regionSizes[cell] = cutOffSizes[parents[cell]]
+        elif parents[cell] != root:
+            chokeCells[cell] = chokeCells[parents[cell]]
+            regionSizes[cell] = regionSizes[parents[cell]]
+    return chokeCells, regionSizes
+
+##################
+# Strategic maps #
+##################
+
+class StrategicMap:
+    """
+    What makes a cell safe or risky for one team, as arrays indexed by cell id, computed once per layout:
+      - chokeCells, regionSizes: the choke point that cuts each cell off from our home half, and the number of
+        cells cut off with it (the smallest such region; -1 and 0 if the cell can not be cut off by one cell).
+      - doorIds, doorDistances: the nearest home door of each cell (an index into the door positions) and the
+        distance to it.
+      - doorDistanceSums: the total distance from each cell to all the home doors.
+    """
+    def __init__(self, distanceTable, homePositions, doorPositions):
+        self.distanceTable = distanceTable
+        self.doorPositions = doorPositions
+
+        homeCells = [distanceTable.getCellId(pos) for pos in homePositions]
+        self.chokeCells, self.regionSizes = getChokeRegions(distanceTable.neighbors, homeCells)
+
+        if len(doorPositions) > 0:
+            doorCells = [distanceTable.getCellId(door) for door in doorPositions]
+            doorDistances = distanceTable.matrix[doorCells].astype(np.int32)
+            self.doorIds = doorDistances.argmin(axis=0).astype(np.int32)
+            self.doorDistances = doorDistances.min(axis=0)
+            self.doorDistanceSums = doorDistances.sum(axis=0)
+        else:
+            self.doorIds = np.full(distanceTable.numCells, -1, dtype=np.int32)
+            self.doorDistances = np.full(distanceTable.numCells, distanceTable.UNREACHABLE, dtype=np.int32)
+            self.doorDistanceSums = np.zeros(distanceTable.numCells, dtype=np.int32)
+
+    # The choke point that cuts pos off from home and the number of cells cut off with it, or None
+    def getChokeRegion(self, pos):
+        cell = self.distanceTable.getCellId(pos)
+        if self.chokeCells[cell] < 0:
+            return None
+        return self.distanceTable.cells[self.chokeCells[cell]], int(self.regionSizes[cell])
+
+    def getDoorDistance(self, pos):
+        return int(self.doorDistances[self.distanceTable.getCellId(pos)])
+
+    # The nearest home door to pos and the distance to it, or None if there is no door
+    def getNearestDoor(self, pos):
+        cell = self.distanceTable.getCellId(pos)
+        if self.doorIds[cell] < 0:
+            return None
+        return self.doorPositions[self.doorIds[cell]], int(self.doorDistances[cell])
+
+###################
+# Distance fields #
+###################
+
+class DistanceFields:
+    """
+    Multi-source distance fields, each over a named set of target positions (home doors, capsules, ...).
+    A field holds, for every cell, the distance to the nearest target and which target that is,
+    and is only recomputed when its set of targets changes.
+    """
+    def __init__(self, distanceTable):
+        self.distanceTable = distanceTable
+        self.fields = {}
+
+    def getField(self, name, targets):
+        targets = tuple(targets)
+        if name not in self.fields or self.fields[name][0] != targets:
+            self.fields[name] = (targets, self.distanceTable.getDistanceField(targets),
+                                 self.distanceTable.getNearestField(targets) if len(targets) > 0 else None)
+        return self.fields[name]
+
+    def getDistance(self, name, targets, pos):
+        _, distances, _ = self.getField(name, targets)
+        return int(distances[self.distanceTable.getCellId(pos)])
+
+    # Returns the nearest target and the distance to it, or None if there is no target
+    def getNearest(self, name, targets, pos):
+        targets, distances, nearest = self.getField(name, targets)
+        if len(targets) == 0:
+            return None
+        cell = self.distanceTable.getCellId(pos)
+        return targets[nearest[cell]], int(distances[cell])
+
+##############
+# Food index #
+##############
+
+class FoodIndex:
+    """
+    Nearest-pallet queries of myAttackingAgent. Pallets are given as a boolean mask over the cell ids of the
+    distance table. The target pallets and the distance field to them are only recomputed when the pallets
+    change (one is eaten, or dropped back by a dead Pacman), so each query is a single array read.
+    """
+    def __init__(self, layoutAnalysis):
+        self.layoutAnalysis = layoutAnalysis
+        self.distanceTable = layoutAnalysis.distanceTable
+        # Cells not deep in a dead-end path: open positions, or dead-end positions next to one
+        self.shallowMask = ~self.distanceTable.getPositionMask(layoutAnalysis.deadEndPositions) \
+                           | (layoutAnalysis.openPositionDistances < 2)
+        self.palletMask = None
+        self.targetMasks = {}
+        self.distanceFields = {}
+
+    def update(self, palletMask):
+        if self.palletMask is None or not np.array_equal(palletMask, self.palletMask):
+            self.palletMask = palletMask
+            self.targetMasks = {}
+            self.distanceFields = {}
+
+    # Pallets worth going for. When avoidDeadEnds is set, pallets deep in a dead-end path are left out,
+    # unless there is no other pallet.
+    def getTargetMask(self, avoidDeadEnds):
+        if avoidDeadEnds not in self.targetMasks:
+            targetMask = self.palletMask
+            if avoidDeadEnds and (self.palletMask & self.shallowMask).any():
+                targetMask = self.palletMask & self.shallowMask
+            self.targetMasks[avoidDeadEnds] = targetMask
+        return self.targetMasks[avoidDeadEnds]
+
+    def getTargetPallets(self, avoidDeadEnds):
+        return self.distanceTable.getPositions(self.getTargetMask(avoidDeadEnds))
+
+    def getDistanceField(self, avoidDeadEnds):
+        if avoidDeadEnds not in self.distanceFields:
+            self.distanceFields[avoidDeadEnds] = self.distanceTable.getMaskDistanceField(
+                self.getTargetMask(avoidDeadEnds))
+        return self.distanceFields[avoidDeadEnds]
+
+    def getDistToNearestPallet(self, pos, avoidDeadEnds):
+        return int(self.getDistanceField(avoidDeadEnds)[self.distanceTable.getCellId(pos)])
+
+    # The nearest pallet (the first one in cell order on ties), or None if there is none
+    def getNearestPallet(self, pos, avoidDeadEnds):
+        targetCells = np.flatnonzero(self.getTargetMask(avoidDeadEnds))
+        if len(targetCells) == 0:
+            return None
+        distances = self.distanceTable.matrix[targetCells, self.distanceTable.getCellId(pos)]
+        return self.distanceTable.cells[targetCells[int(np.argmin(distances))]]
+
+################
+# Turn context #
+################
+
+# Same as capture.py: a Pacman and a ghost collide when they are within this distance
+COLLISION_TOLERANCE = 0.7
+
+# What the feature extractors need to know about an agent after it takes an action
+AgentSuccessor = namedtuple('AgentSuccessor', ['position', 'isPacman', 'numCarrying', 'eatsPallet'])
+
+class TurnContext:
+    """
+    Things derived once per turn from the game state for one agent: its legal actions and the successor
+    of each of them. Successors are computed with the movement, eating, returning and collision rules of
+    capture.py instead of gameState.generateSuccessor(), which deep-copies the whole game state.
+    """
+    def __init__(self, gameState, index, layoutAnalysis, opponentIndices):
+        self.gameState = gameState
+        self.index = index
+        self.layoutAnalysis = layoutAnalysis
+        self.opponents = [gameState.getAgentState(i) for i in opponentIndices]
+        self.legalActions = gameState.getLegalActions(index)
+        self.successors = {action: self.generateAgentSuccessor(action) for action in self.legalActions}
+
+    def generateAgentSuccessor(self, action):
+        myState = self.gameState.getAgentState(self.index)
+        x, y = myState.getPosition()
+        dx, dy = Actions.directionToVector(action)
+        position = (int(x + dx), int(y + dy))
+
+        # My Agent is a Pacman in the opponent's area, and returns his pallets when he gets home
+        isPacman = not (self.layoutAnalysis.homeStartX <= position[0] <= self.layoutAnalysis.homeEndX)
+        numCarrying = myState.numCarrying if isPacman else 0
+        eatsPallet = isPacman and self.gameState.hasFood(position[0], position[1])
+        if eatsPallet:
+            numCarrying += 1
+
+        # My Agent is eaten if he runs into an active ghost as a Pacman, or into a Pacman while he is scared
+        for opponent in self.opponents:
+            opponentPosition = opponent.getPosition()
+            if opponentPosition is None or opponent.isPacman == isPacman \
+                    or util.manhattanDistance(opponentPosition, position) > COLLISION_TOLERANCE:
+                continue
+            if (isPacman and opponent.scaredTimer <= 0) or (not isPacman and myState.scaredTimer > 0):
+                return AgentSuccessor(myState.start.getPosition(), False, 0, eatsPallet)
+
+        return AgentSuccessor(position, isPacman, numCarrying, eatsPallet)
+
+####################
+# Opponent tracker #
+####################
+
+# Same as capture.py: agents see the opponents within SIGHT_RANGE (Manhattan distance) of any of their team,
+# and otherwise read a distance to them with a uniform noise of at most SONAR_NOISE in either direction
+SIGHT_RANGE = 5
+SONAR_NOISE = 6
+# Beyond this many unobserved moves, an opponent may be anywhere on its side of the layout
+MAX_ELAPSE_STEPS = 20
+
+class OpponentTracker:
+    """
+    Exact belief of where each opponent is: a probability per open cell (indexed by cell id), updated every turn
+    with a uniform random-walk model of its moves, the pallets and capsules it ate, whether it is a Pacman,
+    whether we can see it and the noisy distance to it.
+    An update is a few vectorized operations over the open cells. When the move budget is nearly spent it is
+    deferred, and the opponent moves are caught up with on the next update. Both agents of the team update
+    the same tracker, with the observations they get on their own turns.
+    """
+    def __init__(self, gameState, red, layoutAnalysis, teamIndices, opponentIndices):
+        self.red = red
+        self.layoutAnalysis = layoutAnalysis
+        self.distanceTable = layoutAnalysis.distanceTable
+        self.teamIndices = teamIndices
+        self.opponentIndices = opponentIndices
+        numCells = self.distanceTable.numCells
+
+        self.cellXs = self.distanceTable.cellXs
+        self.cellYs = self.distanceTable.cellYs
+        self.isHomeCell = (layoutAnalysis.homeStartX <= self.cellXs) & (self.cellXs <= layoutAnalysis.homeEndX)
+
+        # Cells an opponent can be in after one move from each cell (its neighbours, or staying), padded with
+        # the cell itself with probability 0, and the probability of each of them
+        self.moveTargets = np.repeat(np.arange(numCells)[:, None], 5, axis=1)
+        self.moveProbabilities = np.zeros((numCells, 5))
+        for cell, neighbors in enumerate(self.distanceTable.neighbors):
+            self.moveTargets[cell, 1:len(neighbors) + 1] = neighbors
+            self.moveProbabilities[cell, :len(neighbors) + 1] = 1.0 / (len(neighbors) + 1)
+
+        self.beliefs = {}
+        for i in opponentIndices:
+            self.beliefs[i] = np.zeros(numCells)
+            self.beliefs[i][self.distanceTable.getCellId(gameState.getInitialAgentPosition(i))] = 1.0
+        # Time left when the last observation was taken into account. The first agent moves when the time left
+        # is the initial one, so every move of the game is after this.
+        self.timeLeft = int(gameState.data.timeleft) + 1
+        self.foodMask = self.getDefendedFoodMask(gameState)
+        self.expectedDistances = {}
+
+    # Pallets and capsules on our side, as a mask over the cell ids
+    def getDefendedFoodMask(self, gameState):
+        if self.red:
+            food, capsules = gameState.getRedFood(), gameState.getRedCapsules()
+        else:
+            food, capsules = gameState.getBlueFood(), gameState.getBlueCapsules()
+        return self.distanceTable.getGridMask(food) | self.distanceTable.getPositionMask(capsules)
+
+    # Observation of the agent index, about to move. A game state is only taken into account once.
+    def update(self, gameState, index, deferrable=False):
+        timeLeft = int(gameState.data.timeleft)
+        if timeLeft == self.timeLeft or deferrable:
+            return
+        numSteps = {i: self.getNumMoves(i, index, timeLeft, gameState.getNumAgents()) for i in self.opponentIndices}
+        self.timeLeft = timeLeft
+
+        foodMask = self.getDefendedFoodMask(gameState)
+        eatenCells = np.flatnonzero(self.foodMask & ~foodMask)
+        self.foodMask = foodMask
+
+        noisyDistances = gameState.getAgentDistances()
+        teamPositions = [gameState.getAgentPosition(i) for i in self.teamIndices]
+        teamPositions = [pos for pos in teamPositions if pos is not None]
+        invisible = np.ones(len(self.cellXs), dtype=bool)
+        for x, y in teamPositions:
+            invisible &= np.abs(self.cellXs - x) + np.abs(self.cellYs - y) > SIGHT_RANGE
+
+        for i in self.opponentIndices:
+            self.beliefs[i] = self.observe(gameState, index, i, numSteps[i], eatenCells, noisyDistances, invisible)
+        self.expectedDistances = {}
+
+    # Agents move in index order and the time left goes down by one with every move, so the agent that moved
+    # when the time left was timeLeft + d is (index - d) % numAgents
+    def getNumMoves(self, opponentIndex, index, timeLeft, numAgents):
+        firstMove = (index - opponentIndex) % numAgents
+        lastMove = self.timeLeft - timeLeft - 1
+        return 0 if lastMove < firstMove else (lastMove - firstMove) // numAgents + 1
+
+    def observe(self, gameState, index, opponentIndex, numSteps, eatenCells, noisyDistances, invisible):
+        opponentState = gameState.getAgentState(opponentIndex)
+        position = opponentState.getPosition()
+        belief = np.zeros(len(self.cellXs))
+        if position is not None:
+            belief[self.distanceTable.getCellId(position)] = 1.0
+            return belief
+
+        belief = self.beliefs[opponentIndex]
+        if numSteps > MAX_ELAPSE_STEPS:
+            belief = np.ones(len(self.cellXs))
+        else:
+            for _ in range(numSteps):
+                belief = np.bincount(self.moveTargets.ravel(), (belief[:, None] * self.moveProbabilities).ravel(),
+                                     minlength=len(belief))
+
+        # An opponent that just ate from our side was there, unless the other opponent is the likelier eater
+        if opponentState.isPacman:
+            for cell in eatenCells:
+                if all([belief[cell] >= self.beliefs[i][cell] for i in self.opponentIndices if i != opponentIndex]):
+                    belief = np.zeros(len(self.cellXs))
+                    belief[cell] = 1.0
+                    break
+
+        likelihood = invisible & (self.isHomeCell == opponentState.isPacman)
+        if noisyDistances is not None:
+            x, y = gameState.getAgentPosition(index)
+            distances = np.abs(self.cellXs - x) + np.abs(self.cellYs - y)
+            likelihood &= np.abs(distances - noisyDistances[opponentIndex]) <= SONAR_NOISE
+
+        posterior = belief * likelihood
+        # The opponent was eaten, or moved in a way the model missed: anywhere the observations allow
+        if posterior.sum() <= 0:
+            posterior = likelihood.astype(float)
+            if posterior.sum() <= 0:
+                posterior = np.ones(len(self.cellXs))
+        return posterior / posterior.sum()
+
+    def getMostLikelyPosition(self, opponentIndex):
+        return self.distanceTable.cells[int(np.argmax(self.beliefs[opponentIndex]))]
+
+    # Expected maze distance from the opponent to each of the given cells, computed once per update
+    def getExpectedDistances(self, opponentIndex, name, cellIds):
+        key = (opponentIndex, name)
+        if key not in self.expectedDistances:
+            self.expectedDistances[key] = self.beliefs[opponentIndex] @ self.distanceTable.matrix[:, cellIds]
+        return self.expectedDistances[key]
+
+##################
+# Team blackboard #
+##################
+
+# Turns of the team whose facts are kept: the current one and the previous one of each agent
+MAX_BLACKBOARD_TURNS = 4
+
+class TeamBlackboard:
+    """
+    Shared by the agents of a team, and the agents wrapped by them. Holds the facts derived from a game state
+    (pallet lists, opponent states, stolen pallets, ...), computed once by whichever agent asks first, the
+    opponent tracker of the team, and the pallet each attacking agent is going for.
+
+    Facts are keyed by game state identity, as the turn caches of QLearningAgent are: the full state given to
+    observationFunction() and registerInitialState() has the same time left as the observation chooseAction() gets,
+    but shows the opponents the observation hides. The agents wrapped by a composite agent are given the same
+    observation, and share its facts. Facts that depend on what the observing agent sees are also keyed by its index.
+    """
+    def __init__(self):
+        self.turns = []
+        self.opponentTracker = None
+        # Agent index -> (time left, pallet) of the last pallet the agent went for
+        self.targetPallets = {}
+
+    # Facts of a game state, keyed by name
+    def getFacts(self, gameState):
+        for turnGameState, facts in self.turns:
+            if turnGameState is gameState:
+                return facts
+        facts = {}
+        self.turns = self.turns[-(MAX_BLACKBOARD_TURNS - 1):] + [(gameState, facts)]
+        return facts
+
+    def getFact(self, gameState, name, compute):
+        facts = self.getFacts(gameState)
+        if name not in facts:
+            facts[name] = compute()
+        return facts[name]
+
+    # A new game starts with more time left than the last observation of the previous one,
+    # the facts of the previous game are dropped with its game states
+    def getOpponentTracker(self, gameState, red, layoutAnalysis, teamIndices, opponentIndices):
+        tracker = self.opponentTracker
+        if tracker is None or tracker.layoutAnalysis is not layoutAnalysis \
+                or int(gameState.data.timeleft) >= tracker.timeLeft:
+            self.opponentTracker = OpponentTracker(gameState, red, layoutAnalysis, teamIndices, opponentIndices)
+            self.targetPallets = {}
+            self.turns = []
+        return self.opponentTracker
+
+    def setTargetPallet(self, index, gameState, pallet):
+        self.targetPallets[index] = (int(gameState.data.timeleft), pallet)
+
+    # Pallets the other agents of the team went for in their last turn
+    def getTeamTargetPallets(self, index, gameState):
+        timeLeft = int(gameState.data.timeleft)
+        return [pallet for i, (targetTime, pallet) in self.targetPallets.items()
+                if i != index and 0 < targetTime - timeLeft <= gameState.getNumAgents()]
+
+###################
+# Zobrist hashing #
+###################
+
+# Entries kept by a transposition table before the least recently used ones are dropped
+TRANSPOSITION_TABLE_SIZE = 50000
+# Same as capture.py: moves a ghost stays scared after a capsule is eaten
+SCARED_TIME = 40
+
+class ZobristHasher:
+    """
+    64-bit Zobrist keys of the game states of one layout: the XOR of a random key for the cell, scared timer and
+    number of pallets carried of each agent, and for each pallet and capsule left. A change to one of them is one
+    XOR on the key, so the key of a successor, in the game or in a simulation, comes from its state's key in O(1).
+    The cell of an agent we cannot see is the extra cell numCells. Keys are the same in every process.
+    """
+    def __init__(self, distanceTable, numAgents, seed=0):
+        self.numCells = distanceTable.numCells
+        rng = np.random.RandomState(seed)
+        def getKeys(*shape):
+            return rng.randint(0, 2 ** 64, size=shape, dtype=np.uint64)
+        self.cellKeys = getKeys(numAgents, self.numCells + 1).tolist()
+        self.scaredTimerKeys = getKeys(numAgents, SCARED_TIME + 1).tolist()
+        self.numCarryingKeys = getKeys(numAgents, self.numCells + 1).tolist()
+        self.palletKeys = getKeys(self.numCells)
+        self.capsuleKeys = getKeys(self.numCells).tolist()
+
+    # Full key, from dictionaries of the agents' cells, scared timers and pallets carried (keyed by agent index),
+    # a boolean mask of the pallets over the cell ids and the capsule cells
+    def getKey(self, cells, scaredTimers, numCarrying, palletMask, capsuleCells):
+        key = int(np.bitwise_xor.reduce(self.palletKeys[palletMask])) if palletMask.any() else 0
+        for index, cell in cells.items():
+            key ^= self.cellKeys[index][self.numCells if cell is None else cell]
+        for index, scaredTimer in scaredTimers.items():
+            key ^= self.scaredTimerKeys[index][min(scaredTimer, SCARED_TIME)]
+        for index, carried in numCarrying.items():
+            key ^= self.numCarryingKeys[index][min(carried, self.numCells)]
+        for cell in capsuleCells:
+            key ^= self.capsuleKeys[cell]
+        return key
+
+    def moveAgent(self, key, index, oldCell, newCell):
+        return key ^ self.cellKeys[index][oldCell] ^ self.cellKeys[index][newCell]
+
+    def changeScaredTimer(self, key, index, oldTimer, newTimer):
+        return key ^ self.scaredTimerKeys[index][min(oldTimer, SCARED_TIME)] \
+                   ^ self.scaredTimerKeys[index][min(newTimer, SCARED_TIME)]
+
+    def changeNumCarrying(self, key, index, oldCarrying, newCarrying):
+        return key ^ self.numCarryingKeys[index][min(oldCarrying, self.numCells)] \
+                   ^ self.numCarryingKeys[index][min(newCarrying, self.numCells)]
+
+    # A pallet or capsule is eaten, or put back
+    def flipPallet(self, key, cell):
+        return key ^ int(self.palletKeys[cell])
+
+    def flipCapsule(self, key, cell):
+        return key ^ self.capsuleKeys[cell]
+
+class TranspositionTable:
+    """
+    Values keyed by Zobrist key, dropping the least recently used ones beyond a capacity, with counters of the
+    lookups that found their key (hits) and those that did not (misses).
+    """
+    def __init__(self, capacity=TRANSPOSITION_TABLE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def getHitRate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups > 0 else 0.0
+
+################
+# MCTS planner #
+################
+
+# Opt-in planning of myAttackingAgent (e.g. --redOpts planner=mcts): each move runs Monte Carlo tree search for
+# at most planTime seconds (PLAN_TIME by default), and never past the point where the move budget is nearly spent.
+# Rollouts are PLAN_DEPTH moves deep. The number of iterations of each move goes to the move time statistics.
+PLAN_TIME = 0.1
+PLAN_DEPTH = 8
+# UCB1 exploration constant, relative to the spread of the returns seen so far
+PLAN_EXPLORATION = 0.5
+# Chance of a random move in a rollout, otherwise the move with the best Q-value is taken
+PLAN_ROLLOUT_EPSILON = 0.0
+# The agent's own choice stands unless the search finds it worse than the best move by more than this
+# (two pallets of reward)
+PLAN_TOLERANCE = 10.0
+
+# What the planner tracks of the game. Cells are cell ids of the distance table, pallets is a boolean mask over
+# them, and key is the Zobrist key of the rest.
+PlanState = namedtuple('PlanState', ['cell', 'numCarrying', 'pallets', 'capsuleCells', 'ghostCells', 'scaredTimers',
+                                     'caught', 'key'])
+
+class PlanNode:
+    __slots__ = ['state', 'children', 'untriedMoves', 'visits', 'value']
+
+    def __init__(self, state, moves):
+        self.state = state
+        # Action -> (reward of the action, node it leads to). States reached in several ways share their node.
+        self.children = {}
+        self.untriedMoves = list(moves)
+        self.visits = 0
+        # Best return found from this node
+        self.value = None
+
+class MCTSPlanner:
+    """
+    Anytime Monte Carlo tree search for myAttackingAgent. The search runs on a model of the game where only my
+    agent and the opponent ghosts move: the ghosts stay on their side and, once they see my agent, chase him or
+    run away from him while scared. Moves are generated on the cell ids of the distance table instead of copying
+    game states. Rewards are those of myAttackingAgent.getReward(). Rollouts follow the agent's weights over the
+    features of getFeatures() that the model can tell, and their last state is valued with the same weights.
+    As the model is deterministic, every rollout is a plan my agent can follow, and a node is worth the best return
+    found below it. The search acts as a check on the agent's one-step choice, which stands unless it leads
+    somewhere worse.
+    Nodes are kept in a transposition table keyed by Zobrist key, so states reached by several paths share their
+    node, and the search of the next move starts from the node of its state if an earlier search reached it.
+    """
+    def __init__(self, agent, gameState, planTime=PLAN_TIME, planDepth=PLAN_DEPTH):
+        self.agent = agent
+        self.planTime = planTime
+        self.planDepth = planDepth
+        self.discount = agent.discount
+        self.rewards = agent.rewards
+
+        layoutAnalysis = agent.layoutAnalysis
+        self.distanceTable = distanceTable = layoutAnalysis.distanceTable
+        self.matrix = distanceTable.matrix
+        self.strategicMap = layoutAnalysis.strategicMap
+        self.hasher = layoutAnalysis.zobristHasher
+        self.table = TranspositionTable()
+        self.homeMask = distanceTable.getPositionMask(layoutAnalysis.homePositions)
+        self.deadEndMask = np.array([layoutAnalysis.deadEndIndex.isDeadEnd(pos) for pos in distanceTable.cells])
+        self.startCell = distanceTable.getCellId(gameState.getInitialAgentPosition(agent.index))
+
+        # Moves of my agent from each cell, and the cells the opponent ghosts can move to without leaving their side
+        self.moves = []
+        self.ghostMoves = []
+        for cell, neighbors in enumerate(distanceTable.neighbors):
+            x, y = distanceTable.cells[cell]
+            self.moves.append([(Actions.vectorToDirection((nx - x, ny - y)), n)
+                               for n, (nx, ny) in [(n, distanceTable.cells[n]) for n in neighbors]]
+                              + [(Directions.STOP, cell)])
+            self.ghostMoves.append([n for n in neighbors if not self.homeMask[n]] or [cell])
+
+        self.ghostIndices = ()
+        self.ghostStartCells = ()
+        self.minReturn = None
+        self.maxReturn = None
+
+    # The state of the game for the planner. Unseen ghosts are where the opponent tracker believes they most likely are.
+    def getRootState(self, gameState):
+        agent = self.agent
+        myState = agent.getMyState(gameState)
+        ghostIndices, ghostCells, scaredTimers = [], [], []
+        for i in agent.getOpponents(gameState):
+            opponentState = gameState.getAgentState(i)
+            if opponentState.isPacman:
+                continue
+            position = opponentState.getPosition() or agent.opponentTracker.getMostLikelyPosition(i)
+            ghostIndices.append(i)
+            ghostCells.append(self.distanceTable.getCellId(position))
+            scaredTimers.append(opponentState.scaredTimer)
+        cell = self.distanceTable.getCellId(myState.getPosition())
+        pallets = agent.getPalletMask(gameState)
+        capsuleCells = frozenset([self.distanceTable.getCellId(capsule) for capsule in agent.getCapsules(gameState)])
+        key = self.hasher.getKey(dict([(agent.index, cell)] + list(zip(ghostIndices, ghostCells))),
+                                 dict(zip(ghostIndices, scaredTimers)), {agent.index: myState.numCarrying},
+                                 pallets, capsuleCells)
+        return PlanState(cell, myState.numCarrying, pallets, capsuleCells, tuple(ghostCells), tuple(scaredTimers),
+                         False, key), tuple(ghostIndices)
+
+    # Keys may collide, the node of a key is used if its state is the observed one
+    def isSameState(self, state, observedState):
+        return state.cell == observedState.cell and state.numCarrying == observedState.numCarrying \
+            and state.capsuleCells == observedState.capsuleCells and state.ghostCells == observedState.ghostCells \
+            and state.scaredTimers == observedState.scaredTimers \
+            and np.array_equal(state.pallets, observedState.pallets)
+
+    def getAction(self, gameState, legalActions):
+        rootState, ghostIndices = self.getRootState(gameState)
+        # The ghosts are part of the keys, in the order of their indices
+        if ghostIndices != self.ghostIndices:
+            self.table = TranspositionTable()
+            self.ghostIndices = ghostIndices
+            self.ghostStartCells = tuple([self.distanceTable.getCellId(gameState.getInitialAgentPosition(i))
+                                          for i in ghostIndices])
+        root = self.table.get(rootState.key)
+        reused = root is not None and self.isSameState(root.state, rootState)
+        if not reused:
+            root = PlanNode(rootState, self.moves[rootState.cell])
+            self.table.put(rootState.key, root)
+        # Only the legal actions of the game are searched at the root
+        root.untriedMoves = [move for move in root.untriedMoves if move[0] in legalActions]
+        root.children = {action: edge for action, edge in root.children.items() if action in legalActions}
+
+        deadline = time.monotonic() + self.planTime
+        iterations = 0
+        hits, misses = self.table.hits, self.table.misses
+        while len(root.untriedMoves) > 0 or len(root.children) > 0:
+            self.runIteration(root)
+            iterations += 1
+            if time.monotonic() >= deadline or self.agent.isMoveBudgetNearlySpent():
+                break
+        self.agent.moveStats.addPlan(iterations, reused, self.table.hits - hits, self.table.misses - misses)
+
+        if len(root.children) == 0:
+            return random.choice(legalActions) if len(legalActions) > 0 else None
+        # Of the actions the search finds about as good as the best one, the one with the best Q-value of the agent
+        values = {action: reward + self.discount * child.value for action, (reward, child) in root.children.items()}
+        bestValue = max(values.values())
+        actions = [action for action in legalActions if values.get(action, -np.inf) >= bestValue - PLAN_TOLERANCE]
+        qValues = self.agent.getQValues(gameState, actions)
+        return actions[int(np.argmax(qValues))]
+
+    # One selection, expansion, rollout and backup pass
+    def runIteration(self, root):
+        node = root
+        # Nodes of the path, with the rewards of the moves into them
+        path = [(root, 0.0)]
+        while not node.state.caught and len(path) <= self.planDepth:
+            if len(node.untriedMoves) > 0:
+                action, nextCell = node.untriedMoves.pop()
+                nextState, reward = self.getSuccessor(node.state, action, nextCell)
+                child = self.table.get(nextState.key) if not nextState.caught else None
+                if child is None or not self.isSameState(child.state, nextState):
+                    child = PlanNode(nextState, self.moves[nextState.cell])
+                    if not nextState.caught:
+                        self.table.put(nextState.key, child)
+                node.children[action] = (reward, child)
+                path.append((child, reward))
+                # A node seen before already has a value, no need for a rollout
+                if child.visits == 0:
+                    break
+                node = child
+                continue
+            reward, node = self.selectChild(node)
+            path.append((node, reward))
+
+        node = path[-1][0]
+        value = node.value if node.visits > 0 else self.rollout(node.state, self.planDepth - len(path) + 1)
+        for node, reward in reversed(path):
+            node.visits += 1
+            if node.value is None or value > node.value:
+                node.value = value
+            value = reward + self.discount * node.value
+
+        if self.minReturn is None or value < self.minReturn:
+            self.minReturn = value
+        if self.maxReturn is None or value > self.maxReturn:
+            self.maxReturn = value
+
+    # UCB1, with the exploration term scaled to the spread of the returns
+    def selectChild(self, node):
+        spread = self.maxReturn - self.minReturn if self.minReturn is not None else 0.0
+        exploration = PLAN_EXPLORATION * spread * np.sqrt(np.log(node.visits))
+        return max(node.children.values(),
+                   key=lambda edge: edge[0] + self.discount * edge[1].value + exploration / np.sqrt(edge[1].visits))
+
+    def rollout(self, state, numMoves):
+        value = 0.0
+        discount = 1.0
+        for _ in range(numMoves):
+            if state.caught:
+                return value
+            successors = [(action, self.getSuccessor(state, action, nextCell))
+                          for action, nextCell in self.moves[state.cell]]
+            if util.flipCoin(PLAN_ROLLOUT_EPSILON):
+                _, (state, reward) = random.choice(successors)
+            else:
+                _, (state, reward) = max(successors, key=lambda successor: self.getQValue(
+                    state, successor[0], successor[1][0]))
+            value += discount * reward
+            discount *= self.discount
+        if not state.caught:
+            value += discount * max([self.getQValue(state, action, self.getSuccessor(state, action, nextCell)[0])
+                                     for action, nextCell in self.moves[state.cell]])
+        return value
+
+    # My agent moves, eats, returns his pallets and may be caught, then the ghosts move, with the rules of capture.py
+    # The key follows every change with one XOR.
+    def getSuccessor(self, state, action, nextCell):
+        hasher = self.hasher
+        index = self.agent.index
+        rewards = self.rewards
+        reward = rewards['rewardStop'] if action == Directions.STOP else 0
+        isPacman = not self.homeMask[nextCell]
+        numCarrying = state.numCarrying
+        pallets = state.pallets
+        capsuleCells = state.capsuleCells
+        ghostCells = list(state.ghostCells)
+        scaredTimers = list(state.scaredTimers)
+        key = hasher.moveAgent(state.key, index, state.cell, nextCell)
+        if isPacman:
+            if pallets[nextCell]:
+                pallets = pallets.copy()
+                pallets[nextCell] = False
+                key = hasher.flipPallet(key, nextCell)
+                numCarrying += 1
+                reward += rewards['rewardPallet']
+            if nextCell in capsuleCells:
+                capsuleCells = capsuleCells - {nextCell}
+                key = hasher.flipCapsule(key, nextCell)
+                for i in range(len(scaredTimers)):
+                    key = hasher.changeScaredTimer(key, self.ghostIndices[i], scaredTimers[i], SCARED_TIME)
+                    scaredTimers[i] = SCARED_TIME
+                reward += rewards['rewardCapsule']
+        elif numCarrying > 0:
+            reward += rewards['rewardReturnPerPallet'] * numCarrying
+            numCarrying = 0
+
+        caught = False
+        for moved in (False, True):
+            for i in range(len(ghostCells)):
+                ghostCell, scaredTimer = ghostCells[i], scaredTimers[i]
+                if moved:
+                    # Ghosts that can see my agent chase him, or run away from him while scared. The others stay.
+                    if self.matrix[ghostCell, nextCell] <= SIGHT_RANGE:
+                        distances = self.matrix[self.ghostMoves[ghostCell], nextCell]
+                        best = distances.argmax() if scaredTimer > 0 else distances.argmin()
+                        ghostCells[i] = self.ghostMoves[ghostCell][best]
+                    scaredTimers[i] = max(scaredTimer - 1, 0)
+                if isPacman and not caught and ghostCells[i] == nextCell:
+                    if scaredTimers[i] > 0:
+                        ghostCells[i] = self.ghostStartCells[i]
+                        scaredTimers[i] = 0
+                    else:
+                        caught = True
+                key = hasher.moveAgent(key, self.ghostIndices[i], ghostCell, ghostCells[i])
+                key = hasher.changeScaredTimer(key, self.ghostIndices[i], scaredTimer, scaredTimers[i])
+            if caught:
+                reward += rewards['rewardEaten']
+                key = hasher.moveAgent(key, index, nextCell, self.startCell)
+                nextCell, numCarrying = self.startCell, 0
+                break
+
+        key = hasher.changeNumCarrying(key, index, state.numCarrying, numCarrying)
+        return PlanState(nextCell, numCarrying, pallets, capsuleCells, tuple(ghostCells), tuple(scaredTimers),
+                         caught, key), reward
+
+    # Q-value of a move with the agent's weights, on the features of myAttackingAgent.getFeatures() the model knows of
+    def getQValue(self, state, action, nextState):
+        agent = self.agent
+        features = {}
+        if action == Directions.STOP:
+            features['stops-moving'] = 1
+        cell = nextState.cell
+        if nextState.caught:
+            features['eaten-by-ghost'] = 1
+        elif not self.homeMask[cell]:
+            ghostDistances = [int(self.matrix[ghostCell, cell]) for ghostCell, scaredTimer
+                              in zip(nextState.ghostCells, nextState.scaredTimers) if scaredTimer <= 5]
+            minDistToGhost = min(ghostDistances) if len(ghostDistances) > 0 else None
+            if nextState.capsuleCells != state.capsuleCells:
+                features['eats-capsule'] = 1
+            if minDistToGhost is not None and minDistToGhost <= 5:
+                features['dist-to-nearest-ghost'] = float(minDistToGhost) / agent.maxMazeDist
+                if minDistToGhost <= 1:
+                    features['eaten-by-ghost'] = 1
+                chokeCell = self.strategicMap.chokeCells[cell]
+                if self.deadEndMask[cell]:
+                    features['dead-end-ahead'] = 1
+                    features['dist-to-nearest-ghost'] = -features['dist-to-nearest-ghost']
+                elif chokeCell >= 0 and min([self.matrix[ghostCell, chokeCell] for ghostCell in nextState.ghostCells]) \
+                        <= self.matrix[cell, chokeCell]:
+                    features['trapped-behind-choke-point'] = 1
+                    features['dist-to-nearest-ghost'] = -features['dist-to-nearest-ghost']
+            else:
+                features['dist-to-nearest-ghost'] = float(6) / agent.maxMazeDist
+                if nextState.numCarrying > state.numCarrying:
+                    features['eats-pallet'] = 1
+                minDistanceToHome = int(self.strategicMap.doorDistances[cell])
+                palletDistances = self.matrix[cell][nextState.pallets]
+                if len(palletDistances) > 2 and state.numCarrying <= agent.totalTargetPallets - 2 \
+                        and (nextState.numCarrying == 0 or palletDistances.min() < minDistanceToHome):
+                    features['dist-to-nearest-pallet'] = float(palletDistances.min()) / agent.maxMazeDist
+                else:
+                    features['dist-to-best-entry-home'] = float(minDistanceToHome) / agent.maxMazeDist
+        else:
+            features['dist-to-best-exit-home'] = float(self.strategicMap.doorDistances[cell]) / agent.maxMazeDist
+            if not self.homeMask[state.cell] and state.numCarrying > 0:
+                features['returns-pallet'] = 1
+
+        qValue = 0.0
+        for feature, value in features.items():
+            if feature in agent.featureIndex:
+                qValue += agent.weightVector[agent.featureIndex[feature]] * value / 10
+        return qValue
+
+#########################
+# Defense policy tables #
+#########################
+
+# The features myDefensiveAgent steers by, each the distance from its next position to the nearest of some targets.
+# In flee mode, an invader closer than FLEE_DISTANCE counts negatively, as my scared agent keeps away from him.
+DEFENSE_TARGET_MODES = [('dist-to-nearest-invader', False), ('dist-to-nearest-invader', True),
+                        ('dist-to-next-pallet', False), ('dist-to-guard-position', False)]
+FLEE_DISTANCE = 3
+# Bit i of a mask of best actions stands for DEFENSE_ACTIONS[i]
+DEFENSE_ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+# Q-value of the actions a wall is in the way of, below any other
+ILLEGAL_Q_VALUE = -(1 << 48)
+
+# Games only load the tables compilePolicies.py saved, compile=True compiles (and saves) the missing ones
+def getDefensePolicyTable(layoutAnalysis, weights, compile=False):
+    key = json.dumps(sorted(weights.items()))
+    tables = layoutAnalysis.defensePolicyTables
+    if key not in tables or (tables[key] is None and compile):
+        table = DefensePolicyTable(layoutAnalysis, weights, compile)
+        tables[key] = table if table.bestActions is not None else None
+    return tables[key]
+
+class DefensePolicyTable:
+    """
+    The best actions of myDefensiveAgent with fixed weights, for every target mode, own cell and target cell of a
+    layout: bestActions[mode, cell, target] is a mask over DEFENSE_ACTIONS of the actions with the maximum Q-value,
+    without the 'reverse' feature. Target numCells stands for no target. The table takes 4 * numCells^2 bytes,
+    e.g. ~1MB for 500 open cells and ~3.5MB for 940 open cells.
+
+    The 'reverse' feature only breaks ties between the best actions, which compile() checks: it gives no table unless
+    the Q-values are integers and the other actions are always more than the 'reverse' weight below the best ones.
+    Compiling takes over 40 * numCells^2 bytes for a while, so it is done ahead of the games by compilePolicies.py, which
+    saves the tables in LAYOUT_CACHE_DIR. The games memory-map the saved tables and never compile them.
+    """
+    def __init__(self, layoutAnalysis, weights, compile=False):
+        self.distanceTable = layoutAnalysis.distanceTable
+        weightsHash = hashlib.md5(json.dumps(sorted(weights.items())).encode()).hexdigest()
+        self.fileName = os.path.join(LAYOUT_CACHE_DIR, 'defense_{}_{}_{}.npy'.format(
+            self.distanceTable.layoutHash, layoutAnalysis.homeStartX, weightsHash))
+        self.bestActions = self.load()
+        if self.bestActions is None and compile:
+            self.bestActions = self.compile(layoutAnalysis, weights)
+            if self.bestActions is not None:
+                self.save()
+
+    def compile(self, layoutAnalysis, weights):
+        if any([value != int(value) for value in weights.values()]):
+            return None
+        distanceTable = self.distanceTable
+        numCells = distanceTable.numCells
+        isHome = (distanceTable.cellXs >= layoutAnalysis.homeStartX) & (distanceTable.cellXs <= layoutAnalysis.homeEndX)
+
+        # Cell reached by every action from every cell, -1 where a wall is in the way
+        nextCells = np.full((len(DEFENSE_ACTIONS), numCells), -1, dtype=int)
+        for i, action in enumerate(DEFENSE_ACTIONS):
+            dx, dy = Actions.directionToVector(action)
+            for cell, (x, y) in enumerate(distanceTable.cells):
+                nx, ny = int(x + dx), int(y + dy)
+                if 0 <= nx < distanceTable.width and 0 <= ny < distanceTable.height:
+                    nextCells[i, cell] = distanceTable.getCellId((nx, ny))
+        isLegal = nextCells >= 0
+        nextCells[~isLegal] = 0
+        # Q-values of the features that do not depend on the target
+        baseValues = int(weights.get('defense-mode', 0)) * isHome[nextCells].astype(np.int64)
+        baseValues[DEFENSE_ACTIONS.index(Directions.STOP)] += int(weights.get('stops-moving', 0))
+
+        maxGap = abs(int(weights.get('reverse', 0)))
+        bits = (1 << np.arange(len(DEFENSE_ACTIONS))).astype(np.uint8)
+        bestActions = np.zeros((len(DEFENSE_TARGET_MODES), numCells, numCells + 1), dtype=np.uint8)
+        for mode, (feature, flee) in enumerate(DEFENSE_TARGET_MODES):
+            qValues = np.zeros((len(DEFENSE_ACTIONS), numCells, numCells + 1), dtype=np.int64)
+            for i in range(len(DEFENSE_ACTIONS)):
+                distances = distanceTable.matrix[nextCells[i]].astype(np.int64)
+                if flee:
+                    distances = np.where(distances <= FLEE_DISTANCE, -distances, distances)
+                qValues[i, :, :numCells] = int(weights.get(feature, 0)) * distances
+                qValues[i] += baseValues[i][:, None]
+            qValues[~isLegal] = ILLEGAL_Q_VALUE
+            maxQValues = qValues.max(axis=0)
+            isBest = qValues == maxQValues
+            if ((maxQValues - qValues)[~isBest & isLegal[:, :, None]] <= maxGap).any():
+                return None
+            bestActions[mode] = (isBest * bits[:, None, None]).sum(axis=0)
+        return bestActions
+
+    def getBestActions(self, mode, cell, targetCell):
+        return self.bestActions[mode, cell, targetCell]
+
+    # The saved table is only reused if it has the expected shape for this layout
+    def load(self):
+        try:
+            bestActions = np.load(self.fileName, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if bestActions.shape != (len(DEFENSE_TARGET_MODES), self.distanceTable.numCells,
+                                 self.distanceTable.numCells + 1):
+            return None
+        return bestActions
+
+    # Saving is best effort, as for the distance tables
+    def save(self):
+        tmpFileName = '{}.{}.tmp'.format(self.fileName, os.getpid())
+        try:
+            os.makedirs(LAYOUT_CACHE_DIR, exist_ok=True)
+            with open(tmpFileName, 'wb') as f:
+                np.save(f, self.bestActions)
+            os.replace(tmpFileName, self.fileName)
+        except OSError:
+            pass
+
+###############
+# Move budget #
+###############
+
+class MoveBudget:
+    """
+    Time budget of one move, measured with a monotonic clock from the moment the agent starts working
+    on the move (its observation or its chooseAction() call, whichever comes first).
+    """
+    def __init__(self, budget):
+        self.startTime = time.monotonic()
+        self.degradeTime = self.startTime + budget * DEGRADE_FRACTION
+        self.deadline = self.startTime + budget
+        self.degraded = False
+        self.exhausted = False
+
+    def getElapsedTime(self):
+        return time.monotonic() - self.startTime
+
+    def isNearlySpent(self):
+        if not self.degraded and time.monotonic() >= self.degradeTime:
+            self.degraded = True
+        return self.degraded
+
+    def isExhausted(self):
+        if not self.exhausted and time.monotonic() >= self.deadline:
+            self.exhausted = True
+        return self.exhausted
+
+class MoveStats:
+    """
+    Move times of one agent during a game, and how many moves ran out of budget.
+    With the MCTS planner, also the search iterations of each move, how many moves reused an earlier search, and the
+    hits and misses of its transposition table. With a defense policy table, also how many moves were looked up in it.
+    The stats are only written if they are given a file.
+    """
+    def __init__(self, fileName=None):
+        self.fileName = fileName
+        self.moveTimes = []
+        self.degradedMoves = 0
+        self.exhaustedMoves = 0
+        self.planIterations = []
+        self.reusedPlans = 0
+        self.transpositionHits = 0
+        self.transpositionMisses = 0
+        self.compiledMoves = 0
+
+    def addMove(self, moveBudget):
+        self.moveTimes.append(moveBudget.getElapsedTime())
+        self.degradedMoves += int(moveBudget.degraded)
+        self.exhaustedMoves += int(moveBudget.exhausted)
+
+    def addPlan(self, iterations, reused, transpositionHits=0, transpositionMisses=0):
+        self.planIterations.append(iterations)
+        self.reusedPlans += int(reused)
+        self.transpositionHits += transpositionHits
+        self.transpositionMisses += transpositionMisses
+
+    def addCompiledMove(self):
+        self.compiledMoves += 1
+
+    # Writing is best effort, the stats must never cost a game
+    def write(self, agentName, index):
+        if self.fileName is not None and len(self.moveTimes) > 0:
+            stats = {
+                'agent': agentName,
+                'index': index,
+                'moves': len(self.moveTimes),
+                'meanMoveTime': sum(self.moveTimes) / len(self.moveTimes),
+                'maxMoveTime': max(self.moveTimes),
+                'degradedMoves': self.degradedMoves,
+                'exhaustedMoves': self.exhaustedMoves,
+                'moveTimes': [round(t, 6) for t in self.moveTimes]
+            }
+            if len(self.planIterations) > 0:
+                stats['meanPlanIterations'] = sum(self.planIterations) / len(self.planIterations)
+                stats['reusedPlans'] = self.reusedPlans
+                stats['transpositionHits'] = self.transpositionHits
+                stats['transpositionMisses'] = self.transpositionMisses
+                stats['planIterations'] = self.planIterations
+            if self.compiledMoves > 0:
+                stats['compiledMoves'] = self.compiledMoves
+            try:
+                with open(self.fileName, 'a') as f:
+                    print(json.dumps(stats), file=f)
+            except OSError:
+                pass
+        self.__init__(self.fileName)
+
+#############
+# Profiling #
+#############
+
+def getMoveStatsFile(moveStats):
+    return MOVE_STATS_FILE if str(moveStats).lower() in ('1', 'true', 'yes') else None
+
+def makeProfiler(profile):
+    if profile in (None, '', False, 'none', 'off', 'False', '0'):
+        return NullProfiler()
+    return Profiler('csv' if profile == 'csv' else 'json')
+
+class NullProfiler:
+    """
+    Profiler used when profiling is off. Methods are not wrapped at all, and laps cost one empty call.
+    """
+    enabled = False
+
+    def wrap(self, name, function):
+        return function
+
+    def lap(self, name):
+        pass
+
+    def write(self, agentName):
+        pass
+
+class Profiler:
+    """
+    Wall time and call counts of nested sections, aggregated over a game by call stack.
+    Sections are wrapped functions (see wrap()) or laps: lap(name) ends the previous lap of the current
+    section and starts a new one, so that the blocks of a long function can be timed one after another.
+    """
+    enabled = True
+
+    def __init__(self, outputFormat):
+        self.outputFormat = outputFormat
+        self.stack = []         # [stack, startTime, childTime, isLap] of the open sections
+        self.sections = {}      # stack -> [calls, totalTime, childTime]
+
+    def wrap(self, name, function):
+        def profiledFunction(*args, **kwargs):
+            self.start(name)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.stop()
+        return profiledFunction
+
+    def start(self, name, isLap=False):
+        parentStack = self.stack[-1][0] if len(self.stack) > 0 else ()
+        self.stack.append([parentStack + (name,), time.perf_counter(), 0.0, isLap])
+
+    # Ends the innermost section that is not a lap, together with its open lap
+    def stop(self):
+        while self.endSection():
+            pass
+
+    def lap(self, name):
+        if len(self.stack) > 0 and self.stack[-1][3]:
+            self.endSection()
+        self.start(name, isLap=True)
+
+    # Returns True if the ended section was a lap
+    def endSection(self):
+        stack, startTime, childTime, isLap = self.stack.pop()
+        elapsed = time.perf_counter() - startTime
+        section = self.sections.setdefault(stack, [0, 0.0, 0.0])
+        section[0] += 1
+        section[1] += elapsed
+        section[2] += childTime
+        if len(self.stack) > 0:
+            self.stack[-1][2] += elapsed
+        return isLap
+
+    def getRows(self):
+        return [{'stack': ';'.join(stack), 'calls': calls, 'totalTime': totalTime, 'selfTime': totalTime - childTime}
+                for stack, (calls, totalTime, childTime) in sorted(self.sections.items())]
+
+    # Writing is best effort, the profile must never cost a game
+    def write(self, agentName):
+        rows = self.getRows()
+        try:
+            if self.outputFormat == 'csv':
+                fileName = PROFILE_FILE + '.csv'
+                writeHeader = not os.path.exists(fileName)
+                with open(fileName, 'a', newline='') as f:
+                    writer = csv.DictWriter(f, ['agent', 'stack', 'calls', 'totalTime', 'selfTime'])
+                    if writeHeader:
+                        writer.writeheader()
+                    for row in rows:
+                        writer.writerow(dict(row, agent=agentName))
+            else:
+                with open(PROFILE_FILE + '.jsonl', 'a') as f:
+                    print(json.dumps({'agent': agentName, 'sections': rows}), file=f)
+
+            # Collapsed stacks with self times in microseconds, e.g. for flamegraph.pl or speedscope
+            with open(PROFILE_FILE + '.collapsed', 'a') as f:
+                for row in rows:
+                    print('{};{} {}'.format(agentName, row['stack'], int(round(row['selfTime'] * 1e6))), file=f)
+        except OSError:
+            pass
+        self.sections = {}
+
+###############
+# Checkpoints #
+###############
+
+def getWeightsFile(agentName):
+    return os.path.join(WEIGHTS_DIR, agentName + 'Weights.json')
+
+def loadWeights(fileName):
+    """
+    Returns the weights of the last checkpoint of a file: a weights file, a JSON-lines weight history (gzipped
+    if the name ends with .gz), or one of the printed dictionaries of the old allEpisodesWeights_old and
+    lastepisodesWeights files. Returns None if the file does not exist or is empty, and with a warning if its last
+    checkpoint can not be read (e.g. a training run was killed while writing it), so that the agent keeps its
+    initial weights.
+    """
+    opener = gzip.open if fileName.endswith('.gz') else open
+    try:
+        with opener(fileName, 'rt') as f:
+            lines = [line for line in f if line.strip()]
+        if len(lines) == 0:
+            return None
+        try:
+            checkpoint = json.loads(lines[-1])
+        except ValueError:
+            checkpoint = ast.literal_eval(lines[-1])
+        if not isinstance(checkpoint, dict):
+            raise ValueError('not a dictionary of weights')
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, SyntaxError) as e:
+        print('Warning: cannot read the weights of {} ({}: {}), using the initial weights'.format(
+            fileName, type(e).__name__, e))
+        return None
+    if isinstance(checkpoint.get('weights'), dict):
+        return checkpoint['weights']
+    return checkpoint
+
+class WeightCheckpointer:
+    """
+    Buffers one checkpoint per episode and writes them every flushEvery episodes: all of them are appended to
+    the JSON-lines history (gzipped if compress is set), and the last one replaces the latest file atomically.
+    """
+    def __init__(self, latestFile, historyFile=WEIGHT_HISTORY_FILE, flushEvery=CHECKPOINT_EVERY, compress=False):
+        self.latestFile = latestFile
+        self.historyFile = historyFile + '.gz' if compress else historyFile
+        self.flushEvery = max(1, flushEvery)
+        self.buffer = []
+
+    def add(self, episode, weights):
+        self.buffer.append({'episode': episode, 'time': time.time(), 'weights': dict(weights)})
+        if len(self.buffer) >= self.flushEvery:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        lines = ''.join([json.dumps(checkpoint) + '\n' for checkpoint in self.buffer])
+        opener = gzip.open if self.historyFile.endswith('.gz') else open
+        with opener(self.historyFile, 'at') as f:
+            f.write(lines)
+
+        # Readers of the latest file see either the previous or the new checkpoint, never a partial one
+        tmpFileName = '{}.{}.tmp'.format(self.latestFile, os.getpid())
+        with open(tmpFileName, 'w') as f:
+            f.write(json.dumps(self.buffer[-1]) + '\n')
+        os.replace(tmpFileName, self.latestFile)
+        self.buffer = []
+
+#####################
+# Experience replay #
+#####################
+
+class ReplayBuffer:
+    """
+    Fixed-capacity ring buffer of transitions, held in NumPy arrays: the feature vector of each (state, action),
+    its reward, and the feature matrix of the legal actions of the next state. The max Q-value of the next
+    state is recomputed with the current weights whenever a transition is learnt again.
+    """
+    # Actions of a Pacman agent: the four directions and STOP
+    MAX_ACTIONS = 5
+
+    def __init__(self, capacity, prioritized=False):
+        self.capacity = capacity
+        self.prioritized = prioritized
+        self.numFeatures = None
+        self.size = 0
+        self.nextIndex = 0
+
+    def allocate(self, numFeatures):
+        self.numFeatures = numFeatures
+        self.features = np.zeros((self.capacity, numFeatures))
+        self.rewards = np.zeros(self.capacity)
+        self.nextFeatures = np.zeros((self.capacity, self.MAX_ACTIONS, numFeatures))
+        self.nextActionMask = np.zeros((self.capacity, self.MAX_ACTIONS), dtype=bool)
+        self.priorities = np.zeros(self.capacity)
+        self.maxPriority = 1.0
+        self.size = 0
+        self.nextIndex = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, featureVector, reward, nextFeatureMatrix):
+        # The buffer is emptied if the weights of the agent changed to another set of features
+        if self.numFeatures != len(featureVector):
+            self.allocate(len(featureVector))
+
+        i = self.nextIndex
+        numNextActions = len(nextFeatureMatrix)
+        self.features[i] = featureVector
+        self.rewards[i] = reward
+        self.nextFeatures[i, :numNextActions] = nextFeatureMatrix
+        self.nextFeatures[i, numNextActions:] = 0.0
+        self.nextActionMask[i] = np.arange(self.MAX_ACTIONS) < numNextActions
+        # New transitions are sampled at least once with the highest priority seen so far
+        self.priorities[i] = self.maxPriority
+
+        self.nextIndex = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    # Returns the indices of the sampled transitions and their importance-sampling weights
+    def sample(self, batchSize):
+        if not self.prioritized:
+            return np.random.randint(0, self.size, size=batchSize), np.ones(batchSize)
+
+        probabilities = self.priorities[:self.size] ** REPLAY_PRIORITY_ALPHA
+        probabilities /= probabilities.sum()
+        indices = np.random.choice(self.size, size=batchSize, p=probabilities)
+        isWeights = (self.size * probabilities[indices]) ** -REPLAY_PRIORITY_BETA
+        return indices, isWeights / isWeights.max()
+
+    # TD errors of the given transitions, with the current weights
+    def getTDErrors(self, indices, weightVector, discount):
+        nextQValues = np.where(self.nextActionMask[indices], self.nextFeatures[indices] @ weightVector, -np.inf)
+        maxNextQValues = nextQValues.max(axis=1)
+        # The next state of a transition without legal actions is worth 0, as in getmaxQValue()
+        maxNextQValues[~self.nextActionMask[indices].any(axis=1)] = 0.0
+        return self.rewards[indices] + discount * maxNextQValues - self.features[indices] @ weightVector
+
+    def updatePriorities(self, indices, tdErrors):
+        self.priorities[indices] = np.abs(tdErrors) + REPLAY_PRIORITY_EPSILON
+        self.maxPriority = max(self.maxPriority, self.priorities[indices].max())
 
 ##########
 # Agents #
 ##########
 
 class QLearningAgent(CaptureAgent):
+    PROFILED_METHODS = ['chooseAction', 'observationFunction', 'getPolicy', 'getFeatures', 'getTurnContext',
+                        'getMazeDistance', 'updateOpponentTracker']
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args)
 
         if kwargs.get('numTraining') is not None:
             self.numTraining = int(kwargs['numTraining'])
             # Exploration
-            self.epsilon = 0.1
+            self.epsilon = float(kwargs.get('epsilon', 0.1))
 
             # Learning rate
-            self.alpha = 0.1
+            self.alpha = float(kwargs.get('alpha', 0.1))
 
             # Discount factor for future rewards
-            self.discount = 0.9
+            self.discount = float(kwargs.get('discount', 0.9))
         else:
             self.numTraining = 0
 
@@ -68,14 +1713,46 @@ class QLearningAgent(CaptureAgent):
             self.alpha = 0.0
 
             # Discount factor for future rewards
-            self.discount = 0.9
+            self.discount = float(kwargs.get('discount', 0.9))
 
         self.episodeSoFar = 0
 
-        self.weights = {
+        # Time budget of each move, in seconds
+        self.moveTimeBudget = float(kwargs.get('moveTimeBudget', MOVE_TIME_BUDGET))
+        self.moveBudget = None
+        self.moveStats = MoveStats(getMoveStatsFile(kwargs.get('moveStats')))
+
+        # Opt-in profiling, the composite agents share their profiler with the agents they wrap
+        self.profiler = kwargs.get('profiler') or makeProfiler(kwargs.get('profile'))
+        for name in self.PROFILED_METHODS:
+            setattr(self, name, self.profiler.wrap(name, getattr(self, name)))
+
+        # Shared with the other agents of the team, if createTeam() made one
+        self.blackboard = kwargs.get('blackboard') or TeamBlackboard()
+
+        # Checkpoints of the weights learnt in training
+        self.weightsFile = kwargs.get('weightsFile') or getWeightsFile(self.__class__.__name__)
+        self.checkpointer = WeightCheckpointer(
+            self.weightsFile, flushEvery=int(kwargs.get('checkpointEvery', CHECKPOINT_EVERY)),
+            compress=str(kwargs.get('compressCheckpoints', False)).lower() in ('1', 'true', 'yes'))
+
+        # Experience replay, see REPLAY_CAPACITY
+        replayCapacity = int(kwargs.get('replayCapacity', REPLAY_CAPACITY))
+        self.replayBuffer = ReplayBuffer(replayCapacity, str(kwargs.get('replayPrioritized', False)).lower()
+                                         in ('1', 'true', 'yes')) if replayCapacity > 0 else None
+        self.replayBatchSize = int(kwargs.get('replayBatchSize', REPLAY_BATCH_SIZE))
+        self.replayEvery = int(kwargs.get('replayEvery', REPLAY_EVERY))
+        self.replayEpisodeBatches = int(kwargs.get('replayEpisodeBatches', REPLAY_EPISODE_BATCHES))
+        self.numTransitions = 0
+
+        # Initial weights, overridden by those of the weights file if it exists
+        weights = {
             # Greatly discourage Pacman
             'eaten-by-ghost': -9982.008997143268,
             'dead-end-ahead': -970.2881242681565,
+            # Not learnt yet: a region behind a choke point is left through the choke point, and is bigger than a
+            # dead end, so it starts at half the weight of a dead end
+            'trapped-behind-choke-point': -485.0,
             'stops-moving': -50.02661041131593,
 
             # Slightly discourage Pacman
@@ -101,13 +1778,20 @@ class QLearningAgent(CaptureAgent):
             # 'bias': 0
 
         }
+        weights.update(loadWeights(self.weightsFile) or {})
+        self.setWeights(weights)
 
     # Overriding parent's method in captureAgents.py
     def registerInitialState(self, gameState):
         CaptureAgent.registerInitialState(self, gameState)
+        self.layoutAnalysis = getLayoutAnalysis(gameState.data.layout, self.red)
+        self.distanceTable = self.layoutAnalysis.distanceTable
         self.prevGameState = None
         self.prevAction = None
         self.prevActionSequence = []
+        self.turnCaches = []
+        self.opponentTracker = self.blackboard.getOpponentTracker(gameState, self.red, self.layoutAnalysis,
+                                                                  self.getTeam(gameState), self.getOpponents(gameState))
         self.startEpisode()
 
     # Start Training episode
@@ -118,15 +1802,28 @@ class QLearningAgent(CaptureAgent):
 
     # End Training episode
     def endEpisode(self):
+        if self.replayBuffer is not None and self.alpha > 0:
+            for _ in range(self.replayEpisodeBatches):
+                self.replayBatch()
         self.episodeSoFar += 1
         if self.numTraining > 0:
             self.printStatistics()
+            if self.episodeSoFar == self.numTraining:
+                self.checkpointer.flush()
         if self.episodeSoFar >= self.numTraining:
             # Stop Training ---> reset epsilon (exploration) and alpha (learning)
             self.epsilon = 0.0
             self.alpha = 0.0
 
     def chooseAction(self, gameState):
+        self.startMove()
+        try:
+            self.updateOpponentTracker(gameState)
+            return self.selectAction(gameState)
+        finally:
+            self.finishMove()
+
+    def selectAction(self, gameState):
         legalActions = self.getLegalActions(gameState)
         if len(legalActions) == 0:
             return None
@@ -151,6 +1848,47 @@ class QLearningAgent(CaptureAgent):
         actions = gameState.getLegalActions(self.index)
         return actions
 
+    # The opponent tracker is left behind for this move if the observation already took most of its budget
+    def updateOpponentTracker(self, gameState):
+        self.opponentTracker.update(gameState, self.index, deferrable=self.isMoveBudgetNearlySpent())
+
+    # Most likely positions of the opponents we cannot see that are Pacmen (or ghosts, if isPacman is False)
+    # and are scared for at most maxScaredTimer moves
+    def getBelievedPositions(self, gameState, isPacman, maxScaredTimer=None):
+        positions = []
+        for i in self.getOpponents(gameState):
+            opponentState = gameState.getAgentState(i)
+            if opponentState.getPosition() is None and opponentState.isPacman == isPacman \
+                    and (maxScaredTimer is None or opponentState.scaredTimer <= maxScaredTimer):
+                positions.append(self.opponentTracker.getMostLikelyPosition(i))
+        return positions
+
+    def startMove(self):
+        if self.moveBudget is None:
+            self.moveBudget = MoveBudget(self.moveTimeBudget)
+
+    def finishMove(self):
+        self.moveStats.addMove(self.moveBudget)
+        self.moveBudget = None
+
+    # Expensive features are dropped when this is True
+    def isMoveBudgetNearlySpent(self):
+        return self.moveBudget is not None and self.moveBudget.isNearlySpent()
+
+    def isMoveBudgetExhausted(self):
+        return self.moveBudget is not None and self.moveBudget.isExhausted()
+
+    # Keep going in the current direction first, turn back next, and stop last
+    def getActionsByPriority(self, gameState, actions):
+        direction = self.getMyState(gameState).getDirection()
+        def getPriority(action):
+            if action == Directions.STOP:
+                return 3
+            if action == Directions.REVERSE[direction]:
+                return 2
+            return 0 if action == direction else 1
+        return sorted(actions, key=getPriority)
+
     def executeAction(self, gameState, action):
         self.prevGameState = gameState
         self.prevAction = action
@@ -172,8 +1910,20 @@ class QLearningAgent(CaptureAgent):
 
     def getPolicy(self, gameState):
         actions = self.getLegalActions(gameState)
-        maxQValue = self.getmaxQValue(gameState)
-        bestActions = [action for action in actions if self.getQValue(gameState, action) == maxQValue]
+
+        # Actions are evaluated in priority order, until the move budget runs out.
+        # Ties are still broken among the evaluated actions in their original order.
+        evaluatedActions = set()
+        for action in self.getActionsByPriority(gameState, actions):
+            if len(evaluatedActions) > 0 and self.isMoveBudgetExhausted():
+                break
+            self.getTurnFeatures(gameState, action)
+            evaluatedActions.add(action)
+        actions = [action for action in actions if action in evaluatedActions]
+
+        qValues = self.getQValues(gameState, actions)
+        maxQValue = max(qValues) if len(qValues) > 0 else 0.0
+        bestActions = [action for action, qValue in zip(actions, qValues) if qValue == maxQValue]
 
         if len(bestActions) > 0:
             return random.choice(bestActions)
@@ -183,10 +1933,46 @@ class QLearningAgent(CaptureAgent):
             return None
 
     def update(self, gameState, action, nextGameState, reward):
-        features = self.getFeatures(gameState, action)
-        for feature, value in features.items():
-            delta = (reward + self.discount * self.getmaxQValue(nextGameState)) - self.getQValue(gameState, action)
-            self.weights[feature] = self.weights[feature] + self.alpha * delta * value
+        # Nothing is learnt with alpha 0 (evaluation and contest games), so the previous state and the successors of
+        # the next one are not evaluated for it
+        if self.alpha == 0:
+            return
+        if self.replayBuffer is not None:
+            self.storeTransition(gameState, action, nextGameState, reward)
+            return
+
+        featureVector = self.getTurnFeatures(gameState, action)
+        # TD error is computed once, with the weights before this update
+        delta = (reward + self.discount * self.getmaxQValue(nextGameState)) - self.getQValue(gameState, action)
+        self.weightVector += self.alpha * delta * featureVector
+
+        # Cached Q-values were computed with the old weights
+        for turnCache in self.turnCaches:
+            turnCache['qValues'].clear()
+
+    # With experience replay, transitions are stored during play and learnt in mini-batches
+    def storeTransition(self, gameState, action, nextGameState, reward):
+        nextActions = self.getLegalActions(nextGameState)
+        nextFeatureMatrix = self.getFeatureMatrix(nextGameState, nextActions) if len(nextActions) > 0 \
+            else np.zeros((0, len(self.featureNames)))
+        self.replayBuffer.add(self.getTurnFeatures(gameState, action), reward, nextFeatureMatrix)
+
+        self.numTransitions += 1
+        if self.replayEvery > 0 and self.numTransitions % self.replayEvery == 0:
+            self.replayBatch()
+
+    # One vectorized gradient step on a mini-batch of stored transitions
+    def replayBatch(self):
+        if len(self.replayBuffer) < self.replayBatchSize:
+            return
+        indices, isWeights = self.replayBuffer.sample(self.replayBatchSize)
+        tdErrors = self.replayBuffer.getTDErrors(indices, self.weightVector, self.discount)
+        self.weightVector += self.alpha / len(indices) * ((isWeights * tdErrors) @ self.replayBuffer.features[indices])
+        if self.replayBuffer.prioritized:
+            self.replayBuffer.updatePriorities(indices, tdErrors)
+
+        for turnCache in self.turnCaches:
+            turnCache['qValues'].clear()
 
     def updateWeights(self, gameState):
         if not self.prevGameState is None:
@@ -194,49 +1980,128 @@ class QLearningAgent(CaptureAgent):
             self.update(self.prevGameState, self.prevAction, gameState, reward)
 
     def getQValue(self, gameState, action):
-        features = self.getFeatures(gameState, action)
-        weights = self.getWeights()
-        # Return dot product of the two dictionaries, in which `features` is created using util.Counter()
-        return features * weights
+        qValues = self.getTurnCache(gameState)['qValues']
+        if action not in qValues:
+            qValues[action] = float(np.dot(self.getTurnFeatures(gameState, action), self.weightVector))
+        return qValues[action]
+
+    # Q-values of all the given actions, as one product of the (actions x features) matrix with the weight vector
+    def getQValues(self, gameState, actions):
+        qValues = self.getTurnCache(gameState)['qValues']
+        missingActions = [action for action in actions if action not in qValues]
+        if len(missingActions) > 0:
+            featureMatrix = self.getFeatureMatrix(gameState, missingActions)
+            qValues.update(zip(missingActions, (featureMatrix @ self.weightVector).tolist()))
+        return [qValues[action] for action in actions]
 
     def getmaxQValue(self, gameState):
         actions = self.getLegalActions(gameState)
         if len(actions) > 0:
-            return max([self.getQValue(gameState, action) for action in actions])
+            return max(self.getQValues(gameState, actions))
         return 0.0
 
+    # Feature names are mapped to fixed indices of the weight vector.
+    # Weights are imported and exported as dictionaries, the format of the printed weight files.
+    def setWeights(self, weights):
+        self.featureNames = list(weights.keys())
+        self.featureIndex = {feature: i for i, feature in enumerate(self.featureNames)}
+        self.weightVector = np.array([weights[feature] for feature in self.featureNames], dtype=float)
+
     def getWeights(self):
-        return self.weights
+        return dict(zip(self.featureNames, self.weightVector.tolist()))
+
+    # Features without a weight do not contribute to the Q-value, as in the dot product of util.Counter
+    def getFeatureVector(self, features):
+        featureVector = np.zeros(len(self.featureNames))
+        for feature, value in features.items():
+            if feature in self.featureIndex:
+                featureVector[self.featureIndex[feature]] = value
+        return featureVector
+
+    def getFeatureMatrix(self, gameState, actions):
+        return np.array([self.getTurnFeatures(gameState, action) for action in actions])
 
     def getFeatures(self, gameState, action):
         features = util.Counter()
         return features
 
+    # Per-turn cache of features and Q-values, keyed by game state identity and action.
+    # getFeatures() generates a successor and runs many maze distance lookups, so it is evaluated
+    # at most once per (gameState, action) however many times getPolicy() and update() ask for it.
+    def getTurnCache(self, gameState):
+        for turnCache in self.turnCaches:
+            if turnCache['gameState'] is gameState:
+                return turnCache
+
+        # A new turn has started. Only the previous game state can still be needed, by update().
+        self.turnCaches = [c for c in self.turnCaches if c['gameState'] is self.prevGameState]
+        turnCache = {'gameState': gameState, 'context': None, 'features': {}, 'qValues': {}}
+        self.turnCaches.append(turnCache)
+        return turnCache
+
+    def getTurnContext(self, gameState):
+        turnCache = self.getTurnCache(gameState)
+        if turnCache['context'] is None:
+            turnCache['context'] = TurnContext(gameState, self.index, self.layoutAnalysis,
+                                               self.getOpponents(gameState))
+        return turnCache['context']
+
+    # Lightweight successor of my Agent, generated with those of all the other legal actions once per turn
+    def getAgentSuccessor(self, gameState, action):
+        return self.getTurnContext(gameState).successors[action]
+
+    def getTurnFeatures(self, gameState, action):
+        features = self.getTurnCache(gameState)['features']
+        if action not in features:
+            features[action] = self.getFeatureVector(self.getFeatures(gameState, action))
+        return features[action]
+
     def getReward(self, gameState):
         return gameState.getScore()
 
     # Overriding method observationFunction() from captureAgents.py
+    # The observation counts towards the move time, so the move budget starts here. The weights are learnt from
+    # the observation, not the full game state, so that they only depend on what my agent can see in play.
     def observationFunction(self, gameState):
-        self.updateWeights(gameState)
-        return gameState.makeObservation(self.index)
+        self.startMove()
+        observation = gameState.makeObservation(self.index)
+        self.updateWeights(observation)
+        return observation
 
     def getSuccessor(self, gameState, action):
         successor = gameState.generateSuccessor(self.index, action)
         return successor
 
+    # Overriding method getMazeDistance() from captureAgents.py with an O(1) lookup in the shared table
+    def getMazeDistance(self, pos1, pos2):
+        return self.distanceTable.getDistance(pos1, pos2)
+
     def getMyState(self, gameState):
         return gameState.getAgentState(self.index)
 
     def getOpponentsState(self, gameState):
-        # Using getOpponents() method from captureAgents
-        return [gameState.getAgentState(i) for i in self.getOpponents(gameState)]
+        # Using getOpponents() method from captureAgents. What the opponents show depends on the observer.
+        return self.blackboard.getFact(gameState, ('opponents', self.index),
+                                       lambda: [gameState.getAgentState(i) for i in self.getOpponents(gameState)])
+
+    # Pallets we can eat, and those we defend, as boolean masks over the cell ids of the distance table.
+    # Counting, differences and distance queries on them are array operations.
+    def getPalletMask(self, gameState):
+        return self.blackboard.getFact(gameState, 'palletMask',
+                                       lambda: self.distanceTable.getGridMask(self.getFood(gameState)))
+
+    def getDefendedPalletMask(self, gameState):
+        return self.blackboard.getFact(gameState, 'defendedPalletMask',
+                                       lambda: self.distanceTable.getGridMask(self.getFoodYouAreDefending(gameState)))
 
     def final(self, gameState):
         """
           Called by Pacman game at the terminal state
         """
-        self.updateWeights(gameState)
+        self.updateWeights(gameState.makeObservation(self.index))
         self.endEpisode()
+        self.moveStats.write(self.__class__.__name__, self.index)
+        self.profiler.write('{}-{}'.format(self.__class__.__name__, self.index))
 
         if self.episodeSoFar == self.numTraining and self.numTraining != 0:
             mes = 'Training Done (turning off epsilon and alpha)'
@@ -246,75 +2111,62 @@ class QLearningAgent(CaptureAgent):
         print('{}. Score: {}'.format(self.episodeSoFar, self.getScore(gameState)))
 
     def printStatistics(self):
-        with open('allEpisodesWeights_old', 'a') as f1:
-            print(self.weights, file=f1)
-        with open('lastepisodesWeights', 'w') as f2:
-            print(self.weights, file=f2)
+        self.checkpointer.add(self.episodeSoFar, self.getWeights())
 
 
 class myAttackingAgent(QLearningAgent):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Opt-in tree search on top of the Q-function, see MCTSPlanner
+        self.plannerName = kwargs.get('planner')
+        self.planTime = float(kwargs.get('planTime', PLAN_TIME))
+        self.planDepth = int(kwargs.get('planDepth', PLAN_DEPTH))
+        self.planner = None
+        self.rewards = {name: float(kwargs.get(name, reward)) for name, reward in ATTACKER_REWARDS.items()}
+
     def registerInitialState(self, gameState):
         QLearningAgent.registerInitialState(self, gameState)
-        layout = deepcopy(gameState.data.layout)
+        layout = gameState.data.layout
         self.layoutWidth = layout.width
         self.layoutHeight = layout.height
         self.maxMazeDist = layout.width * layout.height
         self.walls = gameState.getWalls()
-        self.totalTargetPallets = int(len(self.getFood(gameState).asList()) / 2)
+        self.totalTargetPallets = int(np.count_nonzero(self.getPalletMask(gameState)) / 2)
         self.myStartPosition = gameState.getAgentState(self.index).getPosition()
         self.nearest1sGhostBelief = None
 
-        # Red area is on the left of the layout. Position (0,0) is at the bottom-left corner of the layout.
-        if self.red:
-            opponentBorderX = int(self.layoutWidth/2)
-            myBorderX = int(self.layoutWidth/ 2) - 1
-            myInvasionStartX = opponentBorderX
-            myInvasionEndX = self.layoutWidth
-        else:
-            opponentBorderX = int(self.layoutWidth/2) - 1
-            myBorderX = int(self.layoutWidth/2)
-            myInvasionStartX = 0
-            myInvasionEndX = opponentBorderX
-
-        self.doorPositions = []
-        for myBorderY in range(0, self.layoutHeight):
-            if not layout.isWall((myBorderX, myBorderY)):
-                self.doorPositions.append((myBorderX, myBorderY))
-
-        # List of positions that lead to dead-end situation (dead-end paths)
-        self.deadEndPositions = []
-
-        while True:
-            prevLen = len(self.deadEndPositions)
-            newWalls = deepcopy(layout.walls)
-            for x in range(myInvasionStartX, myInvasionEndX):
-                for y in range(0, self.layoutHeight):
-                    if not layout.walls[x][y] and self.isBlockedByWalls((x, y), layout.walls):
-                        self.deadEndPositions.append((x, y))
-                        # Set the dead-end position as new wall
-                        newWalls[x][y] = True
-            layout.walls = newWalls
-            # Stop when all dead-end positions have been appended
-            if prevLen == len(self.deadEndPositions):
-                break
+        self.doorPositions = self.layoutAnalysis.doorPositions
 
-        self.openPositions = []
-        for x in range(myInvasionStartX, myInvasionEndX):
-            for y in range(0, self.layoutHeight):
-                if not layout.walls[x][y] and (x, y) not in self.deadEndPositions:
-                    self.openPositions.append((x, y))
+        # Positions that lead to dead-end situation (dead-end paths), and the other open positions
+        self.deadEndIndex = self.layoutAnalysis.deadEndIndex
+        self.deadEndPositions = self.layoutAnalysis.deadEndPositions
+        self.openPositions = self.layoutAnalysis.openPositions
+        self.strategicMap = self.layoutAnalysis.strategicMap
 
+        self.foodIndex = FoodIndex(self.layoutAnalysis)
+        self.distanceFields = DistanceFields(self.distanceTable)
+        self.doorIds = np.array([self.distanceTable.getCellId(door) for door in self.doorPositions], dtype=int)
 
-    #------------------- Helper Methods-------------------
-    def isBlockedByWalls(self, position, walls):
-        x, y = position
-        wallCount = sum([walls[nx][ny] for nx, ny in [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)] if
-                          0 <= nx < walls.width and 0 <= ny < walls.height])
-        return wallCount >= 3
+        if self.plannerName == 'mcts':
+            self.planner = MCTSPlanner(self, gameState, self.planTime, self.planDepth)
+
+    # With the planner, the action comes from a tree search instead of the one-step Q-values
+    def getPolicy(self, gameState):
+        if self.planner is None:
+            return QLearningAgent.getPolicy(self, gameState)
+        return self.planner.getAction(gameState, self.getLegalActions(gameState))
 
+    #------------------- Helper Methods-------------------
     def isDeadEnd(self, pos):
-        x, y = pos
-        return (int(x), int(y)) in self.deadEndPositions
+        return self.deadEndIndex.isDeadEnd(pos)
+
+    # pos is cut off from home by a choke point that the ghost reaches no later than my agent
+    def isTrapped(self, pos, ghostPosition):
+        chokeRegion = self.strategicMap.getChokeRegion(pos)
+        if chokeRegion is None:
+            return False
+        chokePoint, _ = chokeRegion
+        return self.getMazeDistance(ghostPosition, chokePoint) <= self.getMazeDistance(pos, chokePoint)
 
     def getNearestGhost(self, myNextPosition, opponents, scaredTimer):
         nearestGhost = None
@@ -337,28 +2189,71 @@ class myAttackingAgent(QLearningAgent):
 
     # Get best door position.
     # The further from the opponent ghost and the closer to the nearest pallet, the better.
-    def getBestDoorPosition(self, nearestGhost, pallets):
-        maxDiff = -999999999
-        bestDoorPosition = None
-        for door in self.doorPositions:
-            minDistDoorToGhost = self.getMazeDistance(door, nearestGhost) if nearestGhost else 0
-            minDistDoorToPallet = min([self.getMazeDistance(door, pallet) for pallet in pallets.asList()]) \
-                if len(pallets.asList()) > 0 else 0
-            if minDistDoorToGhost - minDistDoorToPallet > maxDiff:
-                maxDiff = minDistDoorToGhost - minDistDoorToPallet
-                bestDoorPosition = door
-        return bestDoorPosition
-
-    def getBestPalletPosition(self, myNewPosition, nearestGhost, pallets):
-        maxDiff = -999999999
-        bestPalletPosition = None
-        for pallet in pallets.asList():
-            minDistGhostToPallet = self.getMazeDistance(pallet, nearestGhost) if nearestGhost else 0
-            minDistToPallet = self.getMazeDistance(pallet, myNewPosition)
-            if minDistGhostToPallet - minDistToPallet > maxDiff:
-                maxDiff = minDistGhostToPallet - minDistToPallet
-                bestPalletPosition = pallet
-        return bestPalletPosition
+    # Evaluated for all doors at once, with the distance field to the pallets (first best door on ties).
+    # Without an observed ghost, the expected distance from the believed positions of the unseen active ghosts is used.
+    def getBestDoorPosition(self, nearestGhost, palletMask, ghostIndices=()):
+        if len(self.doorPositions) == 0:
+            return None
+        self.foodIndex.update(palletMask)
+
+        minDistDoorToGhost = np.zeros(len(self.doorIds), dtype=int)
+        if nearestGhost:
+            minDistDoorToGhost = self.distanceTable.matrix[self.distanceTable.getCellId(nearestGhost), self.doorIds]
+        elif len(ghostIndices) > 0:
+            minDistDoorToGhost = np.min([self.opponentTracker.getExpectedDistances(i, 'doors', self.doorIds)
+                                         for i in ghostIndices], axis=0).round().astype(int)
+        minDistDoorToPallet = np.zeros(len(self.doorIds), dtype=int)
+        if palletMask.any():
+            minDistDoorToPallet = self.foodIndex.getDistanceField(False)[self.doorIds]
+
+        diff = minDistDoorToGhost.astype(int) - minDistDoorToPallet.astype(int)
+        return self.doorPositions[int(np.argmax(diff))]
+
+    # When the move budget is nearly spent, the door nearest to the position is good enough
+    def getDoorPosition(self, position, nearestGhost, palletMask, ghostIndices=()):
+        if self.isMoveBudgetNearlySpent():
+            nearestDoor, _ = self.strategicMap.getNearestDoor(position) or (None, None)
+            return nearestDoor
+        return self.getBestDoorPosition(nearestGhost, palletMask, ghostIndices)
+
+    # Pallets to go for: all of them but those the teammate is going for, unless there are no others
+    def getTargetPalletMask(self, gameState):
+        def getTargetPallets():
+            palletMask = self.getPalletMask(gameState)
+            teamTargetPallets = self.blackboard.getTeamTargetPallets(self.index, gameState)
+            if len(teamTargetPallets) == 0:
+                return palletMask
+            targetMask = palletMask & ~self.distanceTable.getPositionMask(teamTargetPallets)
+            return targetMask if targetMask.any() else palletMask
+        return self.blackboard.getFact(gameState, ('targetPalletMask', self.index), getTargetPallets)
+
+    # Tells the teammate which pallet my Agent is going for, when he is a Pacman after the action
+    def executeAction(self, gameState, action):
+        QLearningAgent.executeAction(self, gameState, action)
+        myNextState = self.getAgentSuccessor(gameState, action)
+        if myNextState.isPacman:
+            self.foodIndex.update(self.getTargetPalletMask(gameState))
+            self.blackboard.setTargetPallet(self.index, gameState,
+                                            self.foodIndex.getNearestPallet(myNextState.position, False))
+
+    # The believed position of the unseen ghost nearest to the position, whose scaredTimer <= scaredTimer
+    def getBelievedNearestGhost(self, gameState, position, scaredTimer):
+        ghostPositions = self.getBelievedPositions(gameState, False, scaredTimer)
+        if len(ghostPositions) == 0:
+            return None
+        return min(ghostPositions, key=lambda ghostPosition: self.getMazeDistance(position, ghostPosition))
+
+    # The further from the ghost and the closer to my Agent, the better (first best pallet on ties)
+    def getBestPalletPosition(self, myNewPosition, nearestGhost, palletMask):
+        palletCells = np.flatnonzero(palletMask)
+        if len(palletCells) == 0:
+            return None
+        matrix = self.distanceTable.matrix
+        minDistToPallet = matrix[self.distanceTable.getCellId(myNewPosition), palletCells].astype(int)
+        minDistGhostToPallet = 0
+        if nearestGhost:
+            minDistGhostToPallet = matrix[self.distanceTable.getCellId(nearestGhost), palletCells].astype(int)
+        return self.distanceTable.cells[palletCells[int(np.argmax(minDistGhostToPallet - minDistToPallet))]]
 
     def getFeatures(self, gameState, action):
         myCurrentState = self.getMyState(gameState)
@@ -370,13 +2265,13 @@ class myAttackingAgent(QLearningAgent):
 
         opponents = self.getOpponentsState(gameState)       # A list of Opponent objects
 
-        nextGameState = self.getSuccessor(gameState, action)
-        myNextState = self.getMyState(nextGameState)
-        myNextPosition = myNextState.getPosition()
+        myNextState = self.getAgentSuccessor(gameState, action)
+        myNextPosition = myNextState.position
 
         timeLeft = int(gameState.data.timeleft)
 
-        pallets = self.getFood(gameState)
+        pallets = self.getPalletMask(gameState)
+        targetPallets = self.getTargetPalletMask(gameState)
         capsules = self.getCapsules(gameState)
 
         features = util.Counter()
@@ -386,9 +2281,12 @@ class myAttackingAgent(QLearningAgent):
         if action == Directions.STOP:
             features['stops-moving'] = 1
 
+        self.profiler.lap('nearest-ghosts')
+
         # Finding the nearest ghost (in our BELIEF) whose scaredTimer <= 1 and the distance between my Agent and that ghost
-        # If None, use the most recently observed nearest 1s ghost position
-        self.nearest1sGhostBelief, _ = self.getNearestGhost(myNextPosition, opponents, 1) or (self.nearest1sGhostBelief, None)
+        # If None, use the most likely position of the nearest unseen 1s ghost, or the most recently believed one
+        self.nearest1sGhostBelief, _ = self.getNearestGhost(myNextPosition, opponents, 1) \
+            or (self.getBelievedNearestGhost(gameState, myNextPosition, 1) or self.nearest1sGhostBelief, None)
 
         #------------------ My Agent is in opponent's area after taking action ------------------
         if myNextState.isPacman:
@@ -400,26 +2298,38 @@ class myAttackingAgent(QLearningAgent):
 
             # Finding the best door position.
             # The further from the opponent ghost and the closer to the nearest pallet, the better.
-            bestDoorPosition = self.getBestDoorPosition(nearest1sGhost, pallets)
+            self.profiler.lap('best-door')
+            unseen1sGhostIndices = [i for i in self.getOpponents(gameState)
+                                    if not gameState.getAgentState(i).isPacman and gameState.getAgentState(i).scaredTimer <= 1
+                                    and gameState.getAgentState(i).getPosition() is None]
+            bestDoorPosition = self.getDoorPosition(myCurrentPosition, nearest1sGhost, targetPallets,
+                                                    unseen1sGhostIndices)
 
             # My Agent is at home, next to the best exit before taking action
             if not myCurrentState.isPacman and self.getMazeDistance(myCurrentPosition, bestDoorPosition) <= 1:
                 features['attack-mode'] = 1
 
             # Calculating min distance from my agent to door positions after he takes action
-            minDistanceToHome = min([self.getMazeDistance(myNextPosition, p) for p in self.doorPositions])
+            self.profiler.lap('home-distance')
+            minDistanceToHome = self.strategicMap.getDoorDistance(myNextPosition)
 
             # There is an active ghost within a distance of 5 whose scaredTimer <= 5
             if nearest5sGhost is not None:
+                self.profiler.lap('ghost-escape')
                 features['dist-to-nearest-ghost'] = float(minDistTo5sGhost) / (self.maxMazeDist)
                 if minDistTo5sGhost <= 1:
                     features['eaten-by-ghost'] = 1
 
                 # If my agent is moving towards a dead-end since he wants to hide from the nearest ghost,
-                # reverse dist-to-nearest-ghost feature so he can get out of the dead-end and move towards the ghost
+                # reverse dist-to-nearest-ghost feature so he can get out of the dead-end and move towards the ghost.
+                # The same goes for a region behind a choke point that the ghost can close first, which has a
+                # feature of its own as 'dead-end-ahead' was learnt for dead ends only.
                 if self.isDeadEnd(myNextPosition):
                     features['dead-end-ahead'] = 1
                     features['dist-to-nearest-ghost'] = -features['dist-to-nearest-ghost']
+                elif self.isTrapped(myNextPosition, nearest5sGhost):
+                    features['trapped-behind-choke-point'] = 1
+                    features['dist-to-nearest-ghost'] = -features['dist-to-nearest-ghost']
 
                 # If there are more than (shortestDistanceHome + 10) moves left,
                 # and there is one or more capsules available,
@@ -428,18 +2338,14 @@ class myAttackingAgent(QLearningAgent):
                 # My agent needs to move towards the nearest capsule then come back home, and he just can sensor ghosts
                 # within 5 distance, hence the threshold (shortestDistanceHome + 10).
                 if timeLeft / 4 >= minDistanceToHome + 10 and len(capsules) > 0:
+                    self.profiler.lap('capsules')
                     # If my Agent is in the capsule position after taking an action, that means he has eaten it
                     if myNextPosition in capsules:
                         features['eats-capsule'] = 1
 
                     # Finding the nearest capsule
-                    minDistanceToCapsule = 999999999
-                    nearestCapsule = None
-                    for capsule in capsules:
-                        distanceToCapsule = self.getMazeDistance(myNextPosition, capsule)
-                        if distanceToCapsule < minDistanceToCapsule:
-                            minDistanceToCapsule = distanceToCapsule
-                            nearestCapsule = capsule
+                    nearestCapsule, minDistanceToCapsule = \
+                        self.distanceFields.getNearest('capsules', capsules, myNextPosition) or (None, None)
                     if nearestCapsule:
                         features['dist-to-nearest-capsule'] = float(minDistanceToCapsule) / (self.maxMazeDist)
 
@@ -454,6 +2360,7 @@ class myAttackingAgent(QLearningAgent):
                         if lastMinDistToCapsule > minDistanceToCapsule and self.isDeadEnd(nearestCapsule) \
                                 and minDistGhostToCapsule > minDistanceToCapsule:
                             features['dead-end-ahead'] = 0
+                            features['trapped-behind-choke-point'] = 0
                             features['dist-to-nearest-ghost'] = -features['dist-to-nearest-ghost']
 
                 # If there is no capsule available or there is not many moves left,
@@ -464,6 +2371,7 @@ class myAttackingAgent(QLearningAgent):
 
             # There is no dangerous ghost whose scaredTimer <= 5 nearby (within a distance of 5).
             else:
+                self.profiler.lap('pallets')
                 # If there are more than (shortestDistanceHome + 10) moves left,
                 # and there is one or more pallets available,
                 # and my agent is not carrying all the pallets
@@ -474,27 +2382,21 @@ class myAttackingAgent(QLearningAgent):
                 # My agent needs to move towards the nearest pallet then come back home, and he just can sensor ghosts
                 # within 5 distance, hence the threshold (shortestDistanceHome + 10).
 
-                if timeLeft / 4 >= minDistanceToHome + 10 and len(pallets.asList()) > 2:
+                if timeLeft / 4 >= minDistanceToHome + 10 and np.count_nonzero(pallets) > 2:
                     # If my Agent is in the pallet position after taking an action, that means he has eaten it
-                    x, y = myNextPosition
-                    if pallets[int(x)][int(y)]:
+                    if myNextState.eatsPallet:
                         features['eats-pallet'] = 1
 
-                    # Finding the distance to the nearest pallet position
+                    # Finding the distance to the nearest pallet position.
+                    # Pallets in dead-end paths are avoided unless the opponents are invading or scared,
+                    # or the move budget is nearly spent.
                     numberOfInvaders = len([o for o in opponents if o.isPacman])
                     scaredOpponents = True if len([o for o in opponents if o.scaredTimer > 5]) > 0 else False
-                    targetPallets = []
-                    if numberOfInvaders < 2 and scaredOpponents is False:
-                        for pallet in pallets.asList():
-                            distToNearestOpenPos = min([self.getMazeDistance(pallet, pos) for pos in self.openPositions])
-                            if pallet not in self.deadEndPositions or distToNearestOpenPos < 2:
-                                targetPallets.append(pallet)
-                    else:
-                        targetPallets = pallets.asList()
+                    avoidDeadEnds = numberOfInvaders < 2 and scaredOpponents is False \
+                                    and not self.isMoveBudgetNearlySpent()
 
-                    if len(targetPallets) == 0: targetPallets = pallets.asList()
-
-                    distToNearestPallet = min([self.getMazeDistance(myNextPosition, pallet) for pallet in targetPallets])
+                    self.foodIndex.update(targetPallets)
+                    distToNearestPallet = self.foodIndex.getDistToNearestPallet(myNextPosition, avoidDeadEnds)
 
                     if myCurrentState.numCarrying <= self.totalTargetPallets - 2 \
                             and (myNextState.numCarrying == 0 or distToNearestPallet < minDistanceToHome):
@@ -518,9 +2420,11 @@ class myAttackingAgent(QLearningAgent):
 
             # Finding the best door position.
             # The further from the opponent ghost and the closer to the nearest pallet, the better.
-            bestDoorPosition = self.getBestDoorPosition(self.nearest1sGhostBelief, pallets)
+            self.profiler.lap('best-door')
+            bestDoorPosition = self.getDoorPosition(myNextPosition, self.nearest1sGhostBelief, targetPallets)
 
             # Calculate distance to best exit home position.
+            self.profiler.lap('home-features')
             features['dist-to-best-exit-home'] = float(self.getMazeDistance(myNextPosition, bestDoorPosition)) \
                                                  / (self.maxMazeDist)
 
@@ -569,57 +2473,58 @@ class myAttackingAgent(QLearningAgent):
 
         # My Agent was killed
         if myCurrentPosition == self.myStartPosition and myPrevState.isPacman and not myCurrentState.isPacman:
-            reward -= 100
+            reward += self.rewards['rewardEaten']
 
         # My Agent returned pallets and got the score
         if myCurrentPosition != self.myStartPosition and myCurrentState.numCarrying == 0 and myPrevState.numCarrying > 0:
-            reward += 50 * myPrevState.numCarrying
+            reward += self.rewards['rewardReturnPerPallet'] * myPrevState.numCarrying
 
         # My Agent ate a pallet
         x, y = myCurrentPosition
         if prevPallets[int(x)][int(y)]:
-            reward += 5
+            reward += self.rewards['rewardPallet']
 
         # My Agent ate a capsule
         if myCurrentPosition in preCapsules:
-            reward += 30
+            reward += self.rewards['rewardCapsule']
 
         # My Agent stops moving
         if myCurrentPosition == myPrevPosition:
-            reward -= 5
+            reward += self.rewards['rewardStop']
 
         return reward
 
 class myDefensiveAgent(QLearningAgent):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Actions are looked up in the compiled DefensePolicyTable of the layout when it applies, unless this is off
+        self.useCompiledPolicy = str(kwargs.get('compiledPolicy', True)).lower() in ('1', 'true', 'yes')
+
     def registerInitialState(self, gameState):
         QLearningAgent.registerInitialState(self, gameState)
-        self.map = deepcopy(gameState.data.layout)
-        self.layoutWidth = int(self.map.width)
-        self.layoutHeight = int(self.map.height)
+        self.layoutWidth = self.layoutAnalysis.width
+        self.layoutHeight = self.layoutAnalysis.height
         self.nextPalletToBeGuarded = None
         self.nextPalletToGuard = None
         self.nextCapsuleToGuard = None
-        self.weights = self.getWeights()
+        self.setWeights(self.getWeights())
         self.prevGameState = None
         self.guardPosition = None
-
-        # Red area is on the left of the layout. Position (0,0) is at the bottom-left corner of the layout.
-        if self.red:
-            self.myEndX = int(self.layoutWidth/ 2) - 1
-            self.myStartX = 0
-            myBorderX = self.myEndX
-        else:
-            self.myStartX = int(self.layoutWidth/2)
-            self.myEndX = int(self.layoutWidth - 1)
-            myBorderX = self.myStartX
-
-        self.doorPositions = []
-        for myBorderY in range(0, self.layoutHeight):
-            if not self.map.isWall((myBorderX, myBorderY)):
-                self.doorPositions.append((myBorderX, myBorderY))
-
-
-    def chooseAction(self, gameState):
+        self.guardPositions = {}
+
+        self.myStartX = self.layoutAnalysis.homeStartX
+        self.myEndX = self.layoutAnalysis.homeEndX
+        self.doorPositions = self.layoutAnalysis.doorPositions
+        self.homePositions = self.layoutAnalysis.homePositions
+        self.homeCellIds = [self.distanceTable.getCellId(pos) for pos in self.homePositions]
+        self.strategicMap = self.layoutAnalysis.strategicMap
+        # The table holds the actions of these weights, it is of no use if they are being learnt. Without a table
+        # compiled by compilePolicies.py for this layout, the agent evaluates its features as usual.
+        self.policyTable = None
+        if self.useCompiledPolicy and self.numTraining == 0:
+            self.policyTable = getDefensePolicyTable(self.layoutAnalysis, self.getWeights())
+
+    def selectAction(self, gameState):
         legalActions = self.getLegalActions(gameState)
         if len(legalActions) == 0:
             return None
@@ -634,12 +2539,87 @@ class myDefensiveAgent(QLearningAgent):
     def executeAction(self, gameState):
         self.prevGameState = gameState
 
+    def getPolicy(self, gameState):
+        action = self.getCompiledAction(gameState)
+        if action is None:
+            action = QLearningAgent.getPolicy(self, gameState)
+        return action
+
+    # The action of the policy table, chosen among the best actions as getPolicy() would, or None if the table
+    # does not apply: my agent may collide with an opponent, or it steers towards more than one target.
+    def getCompiledAction(self, gameState):
+        if self.policyTable is None:
+            return None
+        myState = self.getMyState(gameState)
+        myPosition = myState.getPosition()
+        for opponent in self.getOpponentsState(gameState):
+            position = opponent.getPosition()
+            if position is not None and util.manhattanDistance(position, myPosition) <= 1:
+                return None
+        mode, targets = self.getDefenseTarget(gameState)
+        targets = set(targets)
+        if len(targets) > 1:
+            return None
+
+        # Without a target, the target column numCells is the same in every mode
+        if mode is None:
+            mode = 0
+        targetCell = self.distanceTable.getCellId(targets.pop()) if len(targets) > 0 else self.distanceTable.numCells
+        bestActions = self.policyTable.getBestActions(mode, self.distanceTable.getCellId(myPosition), targetCell)
+        actions = [action for action in self.getLegalActions(gameState)
+                   if bestActions & (1 << DEFENSE_ACTIONS.index(action))]
+        # Turning back only loses ties
+        reverse = Directions.REVERSE[myState.configuration.direction]
+        if len(actions) > 1 and reverse in actions:
+            actions.remove(reverse)
+        if len(actions) == 0:
+            return None
+        self.moveStats.addCompiledMove()
+        return random.choice(actions)
+
+    # The mode of DEFENSE_TARGET_MODES my agent steers by this turn and the positions it steers to
+    def getDefenseTarget(self, gameState):
+        opponents = self.getOpponentsState(gameState)
+        nearbyInvaders = [o.getPosition() for o in opponents if o.isPacman and o.getPosition() is not None]
+
+        self.profiler.lap('guard-position')
+        # The guard position only depends on the capsules being defended, so it is recomputed only when one is eaten
+        self.guardPosition = self.getGuardPosition(self.getCapsulesYouAreDefending(gameState))
+
+        if len(nearbyInvaders) > 0:
+            self.profiler.lap('invaders')
+            self.nextPalletToBeGuarded = None
+            # If my agent has a scaredTimer >= 1, he keeps away from the invaders that are close to him
+            if self.getMyState(gameState).scaredTimer > 0:
+                return DEFENSE_TARGET_MODES.index(('dist-to-nearest-invader', True)), nearbyInvaders
+            return DEFENSE_TARGET_MODES.index(('dist-to-nearest-invader', False)), nearbyInvaders
+
+        self.profiler.lap('stolen-pallets')
+        if self.prevGameState:
+            # Same for every action, and for the other agent wrapped with this one
+            nextPalletToBeGuarded = self.blackboard.getFact(
+                gameState, ('nextPalletToBeGuarded', int(self.prevGameState.data.timeleft)),
+                lambda: self.getNextPalletToBeGuarded(self.prevGameState, gameState))
+            if nextPalletToBeGuarded is not None:
+                self.nextPalletToBeGuarded = nextPalletToBeGuarded
+
+        self.profiler.lap('patrol')
+        # Invaders we cannot see are chased at their most likely positions
+        believedInvaders = self.getBelievedPositions(gameState, True)
+        if self.nextPalletToBeGuarded:
+            return DEFENSE_TARGET_MODES.index(('dist-to-next-pallet', False)), [self.nextPalletToBeGuarded]
+        elif len(believedInvaders) > 0:
+            return DEFENSE_TARGET_MODES.index(('dist-to-nearest-invader', False)), believedInvaders
+        elif self.guardPosition:
+            # If there is no invader nearby, encourage my agent to move towards guardPosition.
+            return DEFENSE_TARGET_MODES.index(('dist-to-guard-position', False)), [self.guardPosition]
+        return None, []
+
     def getFeatures(self, gameState, action):
         myCurrentState = self.getMyState(gameState)
         opponents = self.getOpponentsState(gameState)
-        nextGameState = self.getSuccessor(gameState, action)
-        myNextState = self.getMyState(nextGameState)
-        myNextPosition = myNextState.getPosition()
+        myNextState = self.getAgentSuccessor(gameState, action)
+        myNextPosition = myNextState.position
 
         features = util.Counter()
 
@@ -653,7 +2633,44 @@ class myDefensiveAgent(QLearningAgent):
         nearbyInvaders = [o for o in opponents if o.isPacman and o.getPosition() is not None]
         features['number-of-invaders'] = len(nearbyInvaders)
 
-        capsules = self.getCapsulesYouAreDefending(gameState)
+        mode, targets = self.getDefenseTarget(gameState)
+        if mode is not None:
+            feature, flee = DEFENSE_TARGET_MODES[mode]
+            distance = min([self.getMazeDistance(myNextPosition, target) for target in targets])
+            # If my agent is <= 3 distance away from the nearest invader and has a scaredTimer >= 1
+            # discourage him from moving towards the invader.
+            # Otherwise, encourage him to move towards the invader.
+            features[feature] = -distance if flee and distance <= FLEE_DISTANCE else distance
+
+        # If my agent reverses its current direction tendency
+        if action == Directions.REVERSE[myCurrentState.configuration.direction]:
+            features['reverse'] = 1
+
+        return features
+
+    # The remaining pallet nearest to those stolen since the previous game state (the first one on ties),
+    # or None if no pallet was stolen
+    def getNextPalletToBeGuarded(self, prevGameState, gameState):
+        curPalletMask = self.getDefendedPalletMask(gameState)
+        stolenCells = np.flatnonzero(self.getDefendedPalletMask(prevGameState) & ~curPalletMask)
+        curCells = np.flatnonzero(curPalletMask)
+        if len(stolenCells) == 0 or len(curCells) == 0:
+            return None
+        distToStolenPallets = self.distanceTable.matrix[np.ix_(stolenCells, curCells)].min(axis=0)
+        return self.distanceTable.cells[curCells[int(np.argmin(distToStolenPallets))]]
+
+    # When the move budget is nearly spent, a new capsule layout keeps the previous guard position for this move
+    def getGuardPosition(self, capsules):
+        key = tuple(sorted(capsules))
+        if key not in self.guardPositions:
+            if self.guardPosition is not None and self.isMoveBudgetNearlySpent():
+                return self.guardPosition
+            self.guardPositions[key] = self.computeGuardPosition(capsules)
+        return self.guardPositions[key]
+
+    # The position with the minimum total distance to the doors,
+    # or with the minimum average distance to the doors and the capsules next to them.
+    def computeGuardPosition(self, capsules):
         adjacentDoorCapsules = []
         for door in self.doorPositions:
             for capsule in capsules:
@@ -661,69 +2678,19 @@ class myDefensiveAgent(QLearningAgent):
                 if distDoorToCapsule <= 2:
                     adjacentDoorCapsules.append(capsule)
 
+        # Total distances to the doors come from the strategic map, first minimum wins as before
+        homeCells = self.homeCellIds
+        totalDistToDoor = self.strategicMap.doorDistanceSums[homeCells]
         if len(adjacentDoorCapsules) == 0:
-            minDistToDoor = 999999
-            for x in range(self.myStartX, self.myEndX + 1):
-                for y in range(0, self.layoutHeight):
-                    if not self.map.isWall((x, y)):
-                        totalDistToDoor = sum([self.getMazeDistance((x, y), door) for door in self.doorPositions])
-                        if totalDistToDoor < minDistToDoor:
-                            minDistToDoor = totalDistToDoor
-                            self.guardPosition = (x, y)
+            guardPosition = self.homePositions[int(totalDistToDoor.argmin())]
         else:
-            minDistToDoorCapsule = 999999
-            for x in range(self.myStartX, self.myEndX + 1):
-                for y in range(0, self.layoutHeight):
-                    if not self.map.isWall((x, y)):
-                        avrDistToDoor = float(
-                            sum([self.getMazeDistance((x, y), door) for door in self.doorPositions]) \
-                            / len(self.doorPositions))
-                        avrDistToAdjCapsules = float(
-                            sum([self.getMazeDistance((x, y), cap) for cap in adjacentDoorCapsules]) \
-                            / len(adjacentDoorCapsules)) if adjacentDoorCapsules else 0
-                        if avrDistToDoor + avrDistToAdjCapsules < minDistToDoorCapsule:
-                            minDistToDoorCapsule = avrDistToDoor + avrDistToAdjCapsules
-                            self.guardPosition = (x, y)
+            capsuleCells = [self.distanceTable.getCellId(cap) for cap in adjacentDoorCapsules]
+            avrDistToDoor = totalDistToDoor / float(len(self.doorPositions))
+            avrDistToAdjCapsules = self.distanceTable.matrix[capsuleCells][:, homeCells].astype(int).sum(axis=0) \
+                                   / float(len(adjacentDoorCapsules))
+            guardPosition = self.homePositions[int((avrDistToDoor + avrDistToAdjCapsules).argmin())]
 
-        if len(nearbyInvaders) > 0:
-            self.nextPalletToBeGuarded = None
-            minDistToInvader = min([self.getMazeDistance(myNextPosition, i.getPosition()) for i in nearbyInvaders])
-
-            # If my agent is <= 3 distance away from the nearest invader and has a scaredTimer >= 1
-            # discourage him from moving towards the invader.
-            # Otherwise, encourage him to move towards the invader.
-            if minDistToInvader <= 3 and myCurrentState.scaredTimer > 0:
-                features['dist-to-nearest-invader'] = - minDistToInvader
-            else:
-                features['dist-to-nearest-invader'] = minDistToInvader
-
-        else:
-            if self.prevGameState:
-                prevPalletsToBeGuarded = self.getFoodYouAreDefending(self.prevGameState).asList()
-                curPalletsToBeGuarded = self.getFoodYouAreDefending(gameState).asList()
-
-                stolenPallets = set(prevPalletsToBeGuarded).difference(curPalletsToBeGuarded)
-
-                minDistToStolenPallets = 999999999
-                if len(stolenPallets) > 0:
-                    for p in curPalletsToBeGuarded:
-                        distToStolenPallets = min([self.getMazeDistance(p, sp) for sp in stolenPallets])
-                        if distToStolenPallets < minDistToStolenPallets:
-                            minDistToStolenPallets = distToStolenPallets
-                            self.nextPalletToBeGuarded = p
-
-            if self.nextPalletToBeGuarded:
-                features['dist-to-next-pallet'] = self.getMazeDistance(myNextPosition, self.nextPalletToBeGuarded)
-            elif myNextPosition and self.guardPosition:
-                features['dist-to-guard-position'] = self.getMazeDistance(myNextPosition, self.guardPosition)
-
-        # If there is no invader nearby, encourage my agent to move towards guardPosition.
-
-        # If my agent reverses its current direction tendency
-        if action == Directions.REVERSE[myCurrentState.configuration.direction]:
-            features['reverse'] = 1
-
-        return features
+        return guardPosition
 
     def getWeights(self):
         weights = {
@@ -740,12 +2707,19 @@ class myDefensiveAgent(QLearningAgent):
 class myAttackingDefender(CaptureAgent):
     def __init__(self, *args, **kwargs):
         super().__init__(*args)
-        self.attacker = myAttackingAgent(*args, **kwargs)
-        self.defender = myDefensiveAgent(*args, **kwargs)
+        self.profiler = makeProfiler(kwargs.get('profile'))
+        self.moveStatsFile = getMoveStatsFile(kwargs.get('moveStats'))
+        self.blackboard = kwargs.get('blackboard') or TeamBlackboard()
+        kwargs = dict(kwargs, blackboard=self.blackboard)
+        self.attacker = myAttackingAgent(*args, profiler=self.profiler, **kwargs)
+        self.defender = myDefensiveAgent(*args, profiler=self.profiler, **kwargs)
 
     def registerInitialState(self, gameState):
         self.attacker.registerInitialState(gameState)
         self.defender.registerInitialState(gameState)
+        # One set of move statistics for the moves of both wrapped agents
+        self.moveStats = MoveStats(self.moveStatsFile)
+        self.attacker.moveStats = self.defender.moveStats = self.moveStats
 
     def chooseAction(self, gameState):
         myCurrentState = gameState.getAgentState(self.index)
@@ -755,48 +2729,45 @@ class myAttackingDefender(CaptureAgent):
         else:
             return self.defender.chooseAction(gameState)
 
+    def final(self, gameState):
+        CaptureAgent.final(self, gameState)
+        self.moveStats.write(self.__class__.__name__, self.index)
+        self.profiler.write('{}-{}'.format(self.__class__.__name__, self.index))
+
 class myDefendingAttacker(CaptureAgent):
     def __init__(self, *args, **kwargs):
         super().__init__(*args)
-        self.attacker = myAttackingAgent(*args, **kwargs)
-        self.defender = myDefensiveAgent(*args, **kwargs)
+        self.profiler = makeProfiler(kwargs.get('profile'))
+        self.moveStatsFile = getMoveStatsFile(kwargs.get('moveStats'))
+        self.blackboard = kwargs.get('blackboard') or TeamBlackboard()
+        kwargs = dict(kwargs, blackboard=self.blackboard)
+        self.attacker = myAttackingAgent(*args, profiler=self.profiler, **kwargs)
+        self.defender = myDefensiveAgent(*args, profiler=self.profiler, **kwargs)
 
     def registerInitialState(self, gameState):
         self.attacker.registerInitialState(gameState)
         self.defender.registerInitialState(gameState)
+        # One set of move statistics for the moves of both wrapped agents
+        self.moveStats = MoveStats(self.moveStatsFile)
+        self.attacker.moveStats = self.defender.moveStats = self.moveStats
         self.prevGameState = None
-        layout = deepcopy(gameState.data.layout)
-        self.layoutWidth = int(layout.width)
-        self.layoutHeight = int(layout.height)
-
-        # Red area is on the left of the layout. Position (0,0) is at the bottom-left corner of the layout.
-        if self.red:
-            myEndX = int(self.layoutWidth / 2) - 1
-            myStartX = 0
-            myBorderX = myEndX
-        else:
-            myStartX = int(self.layoutWidth / 2)
-            myEndX = int(self.layoutWidth - 1)
-            myBorderX = myStartX
-
-        self.doorPositions = []
-        for myBorderY in range(0, self.layoutHeight):
-            if not layout.isWall((myBorderX, myBorderY)):
-                self.doorPositions.append((myBorderX, myBorderY))
+        # Shared with the wrapped agents, which have already analysed the layout
+        layoutAnalysis = self.attacker.layoutAnalysis
+        self.layoutWidth = layoutAnalysis.width
+        self.layoutHeight = layoutAnalysis.height
+        self.doorPositions = layoutAnalysis.doorPositions
 
         # Finding the optimal guardPosition - the position that has the minimum average distance to door positions
         self.guardPosition = None
         self.avrDistGuardToDoor = 0
         if self.prevGameState:
             minAvrDistToDoor = 999999
-            for x in range(myStartX, myEndX + 1):
-                for y in range(0, self.layoutHeight):
-                    if not layout.isWall((x, y)):
-                        avrDistToDoor = sum([self.getMazeDistance((x, y), door) for door in self.doorPositions])\
-                                          /len(self.doorPositions)
-                        if avrDistToDoor < minAvrDistToDoor:
-                            minAvrDistToDoor = avrDistToDoor
-                            self.guardPosition = (x, y)
+            for pos in layoutAnalysis.homePositions:
+                avrDistToDoor = sum([self.getMazeDistance(pos, door) for door in self.doorPositions])\
+                                  /len(self.doorPositions)
+                if avrDistToDoor < minAvrDistToDoor:
+                    minAvrDistToDoor = avrDistToDoor
+                    self.guardPosition = pos
 
             self.avrDistGuardToDoor = sum([self.getMazeDistance(self.guardPosition, door) for door in self.doorPositions])\
                                       /len(self.doorPositions)
@@ -833,3 +2804,8 @@ class myDefendingAttacker(CaptureAgent):
                 return self.attacker.chooseAction(gameState)
         else:
             return self.attacker.chooseAction(gameState)
+
+    def final(self, gameState):
+        CaptureAgent.final(self, gameState)
+        self.moveStats.write(self.__class__.__name__, self.index)
+        self.profiler.write('{}-{}'.format(self.__class__.__name__, self.index))
@@ -0,0 +1,294 @@
+# runTournament.py
+# ----------------
+# Parallel tournament of the createTeam() team of myTeam.py against a list of opponent teams.
+#
+# Every opponent plays our team on every layout, once with our team as red and once as blue on the same
+# layout and seed, in worker processes. Each finished game is appended to a JSON-lines file as soon as it is
+# known (score and winner from our side, moves, latency of our chooseAction() calls). The win rate against
+# each opponent is reported with a Wilson confidence interval, a tie counting as half a win, and the games
+# against an opponent stop early once its interval is entirely above or below --threshold.
+#
+# Run it from the directory that holds capture.py and the layouts, e.g.
+#   python runTournament.py --contestDir ../pacman-contest --workers 8 --opponents baselineTeam,staffTeam \
+#       --layouts defaultCapture,RANDOM --maxGames 60 --teamOpts planner=mcts,planTime=0.05
+
+import argparse, json, math, os, random, sys, time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from statistics import NormalDist
+
+from trainTeam import MY_TEAM, importCapture
+from benchmark.runBenchmark import getPercentile, runQuietly
+
+# Points of a game for the win rate
+OUTCOME_POINTS = {'win': 1.0, 'tie': 0.5, 'loss': 0.0}
+
+
+def playGame(contestDir, opponents, layout, isRed, seed, teamOpts, engine):
+    """
+    Plays one game of our team against the opponents in this worker process and returns its record.
+    The score is from the side of our team, and the latency is that of the getAction() calls of our agents.
+    """
+    capture = importCapture(contestDir)
+    import numpy as np
+
+    random.seed(seed)
+    np.random.seed(seed)
+    red, blue = (MY_TEAM, opponents) if isRed else (opponents, MY_TEAM)
+    argv = ['-r', red, '-b', blue, '-l', layout, '-Q']
+    if teamOpts:
+        argv += ['--redOpts' if isRed else '--blueOpts', teamOpts]
+    options = capture.readCommand(argv)
+
+    moveTimes = []
+    for index, agent in enumerate(options['agents']):
+        if (index % 2 == 0) != isRed:
+            continue
+
+        def timedGetAction(gameState, getAction=agent.getAction):
+            startTime = time.perf_counter()
+            action = getAction(gameState)
+            moveTimes.append(time.perf_counter() - startTime)
+            return action
+
+        agent.getAction = timedGetAction
+
+    if engine == 'fast':
+        import fastCapture
+        engineModule = fastCapture
+    else:
+        engineModule = capture
+    startTime = time.perf_counter()
+    game = runQuietly(engineModule.runGames, **options)[0]
+    elapsed = time.perf_counter() - startTime
+
+    score = game.state.data.score if isRed else -game.state.data.score
+    record = {
+        'opponents': opponents,
+        'layout': layout,
+        'color': 'red' if isRed else 'blue',
+        'seed': seed,
+        'score': score,
+        'outcome': 'win' if score > 0 else 'loss' if score < 0 else 'tie',
+        'moves': len(game.moveHistory),
+        'crashed': bool(getattr(game, 'agentCrashed', False)),
+        'seconds': elapsed
+    }
+    if len(moveTimes) > 0:
+        record['latency'] = {
+            'mean': sum(moveTimes) / len(moveTimes),
+            'p50': getPercentile(moveTimes, 50),
+            'p95': getPercentile(moveTimes, 95),
+            'p99': getPercentile(moveTimes, 99),
+            'max': max(moveTimes)
+        }
+    return record
+
+
+def getCrashRecord(task, error):
+    """
+    Record of a game whose worker raised an exception (e.g. an opponent team that fails to load).
+    It counts as a crashed loss, so that the tournament goes on and the crash shows in the summary.
+    """
+    _, opponents, layout, isRed, seed, _, _ = task
+    return {
+        'opponents': opponents,
+        'layout': layout,
+        'color': 'red' if isRed else 'blue',
+        'seed': seed,
+        'score': 0,
+        'outcome': 'loss',
+        'moves': 0,
+        'crashed': True,
+        'seconds': 0.0,
+        'error': '{}: {}'.format(type(error).__name__, error)
+    }
+
+
+def getWilsonInterval(points, numGames, z):
+    if numGames == 0:
+        return 0.0, 1.0
+    winRate = points / numGames
+    denominator = 1 + z * z / numGames
+    centre = (winRate + z * z / (2 * numGames)) / denominator
+    halfWidth = z * math.sqrt(winRate * (1 - winRate) / numGames + z * z / (4 * numGames * numGames)) / denominator
+    return max(0.0, centre - halfWidth), min(1.0, centre + halfWidth)
+
+
+def getZ(confidence):
+    return NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+
+
+def summarize(records, z):
+    points = sum([OUTCOME_POINTS[record['outcome']] for record in records])
+    lower, upper = getWilsonInterval(points, len(records), z)
+    summary = {
+        'games': len(records),
+        'wins': len([record for record in records if record['outcome'] == 'win']),
+        'ties': len([record for record in records if record['outcome'] == 'tie']),
+        'losses': len([record for record in records if record['outcome'] == 'loss']),
+        'crashes': len([record for record in records if record['crashed']]),
+        'winRate': points / len(records) if len(records) > 0 else None,
+        'interval': [lower, upper],
+        'meanScore': sum([record['score'] for record in records]) / len(records) if len(records) > 0 else None
+    }
+    latencies = [record['latency'] for record in records if 'latency' in record]
+    if len(latencies) > 0:
+        summary['meanLatency'] = sum([latency['mean'] for latency in latencies]) / len(latencies)
+        summary['p95Latency'] = getPercentile([latency['p95'] for latency in latencies], 50)
+        summary['maxLatency'] = max([latency['max'] for latency in latencies])
+    return summary
+
+
+class TournamentDriver:
+    def __init__(self, options):
+        self.options = options
+        self.contestDir = os.path.abspath(options.contestDir)
+        self.opponents = options.opponents.split(',')
+        # Every layout is played as red and as blue with the same seed, the colours of a layout are not equal
+        self.pairings = [(layout, isRed) for layout in options.layouts.split(',') for isRed in [True, False]]
+        self.records = {opponents: [] for opponents in self.opponents}
+        # Finished games of every opponent on each pairing
+        self.pairingCounts = {opponents: [0] * len(self.pairings) for opponents in self.opponents}
+        self.numSubmitted = {opponents: 0 for opponents in self.opponents}
+        self.decisions = {opponents: None for opponents in self.opponents}
+        self.z = getZ(options.confidence)
+        # The interval is looked at after every round of pairings, so the error of the early stop is split
+        # over all the looks it may take (Bonferroni) to keep the stopping decision at the confidence asked for
+        numLooks = max(1, -(-options.maxGames // len(self.pairings)))
+        self.stoppingZ = getZ(1 - (1 - options.confidence) / numLooks)
+
+    def makeTask(self, opponents):
+        gameNumber = self.numSubmitted[opponents]
+        self.numSubmitted[opponents] += 1
+        pairing = gameNumber % len(self.pairings)
+        layout, isRed = self.pairings[pairing]
+        # The same seeds for every opponent, so that the opponents are compared on the same games
+        seed = self.options.seed + gameNumber // 2
+        if layout == 'RANDOM':
+            layout = 'RANDOM{}'.format(seed)
+        return pairing, (self.contestDir, opponents, layout, isRed, seed, self.options.teamOpts, self.options.engine)
+
+    def getNextOpponents(self):
+        # The undecided opponents with the fewest games so far
+        candidates = [opponents for opponents in self.opponents
+                      if self.decisions[opponents] is None and self.numSubmitted[opponents] < self.options.maxGames]
+        if len(candidates) == 0:
+            return None
+        return min(candidates, key=lambda opponents: self.numSubmitted[opponents])
+
+    def decide(self, opponents):
+        # Games finish out of order, the interval is only looked at when every pairing has as many games,
+        # so that the layouts and colours weigh the same
+        records = self.records[opponents]
+        if len(records) < self.options.minGames or len(set(self.pairingCounts[opponents])) != 1:
+            return None
+        points = sum([OUTCOME_POINTS[record['outcome']] for record in records])
+        lower, upper = getWilsonInterval(points, len(records), self.stoppingZ)
+        if lower > self.options.threshold:
+            return 'better'
+        if upper < self.options.threshold:
+            return 'worse'
+        return None
+
+    def run(self):
+        startTime = time.time()
+        with open(self.options.output, 'w') as output, ProcessPoolExecutor(self.options.workers) as pool:
+            pending = {}
+            while True:
+                while len(pending) < self.options.workers:
+                    opponents = self.getNextOpponents()
+                    if opponents is None:
+                        break
+                    pairing, task = self.makeTask(opponents)
+                    pending[pool.submit(playGame, *task)] = pairing, task
+                if len(pending) == 0:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pairing, task = pending.pop(future)
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        record = getCrashRecord(task, e)
+                    opponents = record['opponents']
+                    print(json.dumps(record), file=output, flush=True)
+                    self.records[opponents].append(record)
+                    self.pairingCounts[opponents][pairing] += 1
+                    self.reportGame(record, startTime)
+                    if self.decisions[opponents] is None:
+                        self.decisions[opponents] = self.decide(opponents)
+                        if self.decisions[opponents] is not None:
+                            print('{}: decided {} than {} after {} games'.format(
+                                opponents, self.decisions[opponents], self.options.threshold,
+                                len(self.records[opponents])))
+        return self.summarize()
+
+    def summarize(self):
+        summary = {'opponents': {}, 'confidence': self.options.confidence, 'threshold': self.options.threshold}
+        for opponents in self.opponents:
+            summary['opponents'][opponents] = summarize(self.records[opponents], self.z)
+            summary['opponents'][opponents]['decision'] = self.decisions[opponents]
+        summary['overall'] = summarize([record for records in self.records.values() for record in records], self.z)
+        return summary
+
+    def reportGame(self, record, startTime):
+        print('{} {} as {}: score {}, {} ({:.1f}s, {} games in {:.0f}s)'.format(
+            record['opponents'], record['layout'], record['color'], record['score'], record['outcome'],
+            record['seconds'], sum([len(records) for records in self.records.values()]), time.time() - startTime))
+
+
+def report(summary):
+    print('Win rates with {:.0f}% confidence intervals (ties count half):'.format(summary['confidence'] * 100))
+    rows = list(summary['opponents'].items()) + [('overall', summary['overall'])]
+    for opponents, stats in rows:
+        if stats['games'] == 0:
+            continue
+        line = '{:20} {:4} games  {:3}W {:3}T {:3}L  win rate {:.3f} [{:.3f}, {:.3f}]  mean score {:7.2f}'.format(
+            opponents, stats['games'], stats['wins'], stats['ties'], stats['losses'], stats['winRate'],
+            stats['interval'][0], stats['interval'][1], stats['meanScore'])
+        if 'meanLatency' in stats:
+            line += '  move {:.1f}ms (p95 {:.1f}ms, max {:.1f}ms)'.format(
+                stats['meanLatency'] * 1000, stats['p95Latency'] * 1000, stats['maxLatency'] * 1000)
+        if stats.get('crashes'):
+            line += '  {} crashed'.format(stats['crashes'])
+        print(line)
+
+
+def readCommand(argv):
+    parser = argparse.ArgumentParser(description='Play a tournament of myTeam.py against opponent teams in parallel')
+    parser.add_argument('--contestDir', default='.', help='directory of capture.py and its layouts')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--opponents', default='baselineTeam', help='comma separated opponent teams')
+    parser.add_argument('--layouts', default='defaultCapture',
+                        help='comma separated layouts, RANDOM picks a random layout for each pair of games')
+    parser.add_argument('--teamOpts', default='', help='options of our team, as --redOpts of capture.py')
+    parser.add_argument('--minGames', type=int, default=10, help='games against an opponent before it may stop')
+    parser.add_argument('--maxGames', type=int, default=60, help='games against each opponent at most')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence of the win rate intervals')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='stop against an opponent once the win rate is known to be above or below this')
+    parser.add_argument('--engine', choices=['capture', 'fast'], default='capture',
+                        help='play the games with capture.py, or with the headless simulator fastCapture.py')
+    parser.add_argument('--output', default='tournament.jsonl', help='JSON-lines file of the game records')
+    parser.add_argument('--summary', default=None, help='write the win rates to this JSON file')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    options = readCommand(argv)
+    options.output = os.path.abspath(options.output)
+    if options.summary is not None:
+        options.summary = os.path.abspath(options.summary)
+
+    summary = TournamentDriver(options).run()
+    report(summary)
+    if options.summary is not None:
+        with open(options.summary, 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
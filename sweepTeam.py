@@ -0,0 +1,308 @@
+# sweepTeam.py
+# ------------
+# Sweep of the learning rates, rewards and initial weights of the myTeam.py attacker, with successive halving.
+#
+# Trials are configurations sampled from a search space over the agent options of myAttackingAgent (alpha,
+# epsilon, discount and the rewards of ATTACKER_REWARDS) and over initial weights ('weight:<feature>'). Each rung
+# of the sweep trains every surviving trial up to its episode budget, with trainTeam.py's training tasks, then
+# plays evaluation games of our team with the trial's weights, with runTournament.py's games. The best 1 / eta of
+# the trials, by win rate then mean score, go on to the next rung, whose budget is eta times larger.
+#
+# Every trial is saved in the --store directory as soon as one of its tasks finishes: its config, learning curve
+# (the score of every training episode), evaluations and weights. Running the same command again resumes the sweep.
+#
+# Run it from the directory that holds capture.py and the layouts, e.g.
+#   python sweepTeam.py --contestDir ../pacman-contest --workers 8 --trials 27 --eta 3 --rungs 3 \
+#       --minEpisodes 10 --opponents baselineTeam --layouts defaultCapture,RANDOM --engine fast
+
+import argparse, json, math, os, random, sys, time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from trainTeam import ATTACKER_INDEX, importCapture, runTrainingTask
+from runTournament import OUTCOME_POINTS, getCrashRecord, playGame
+from benchmark.runBenchmark import runQuietly
+
+# Values of an option are drawn uniformly between low and high (log-uniformly if log is set), or among choices.
+# Options named 'weight:<feature>' set the initial weight of the feature, the others are agent options.
+DEFAULT_SEARCH_SPACE = {
+    'alpha': {'low': 0.01, 'high': 0.3, 'log': True},
+    'epsilon': {'low': 0.02, 'high': 0.3, 'log': True},
+    'discount': {'low': 0.7, 'high': 0.99},
+    'rewardEaten': {'low': -300, 'high': -30},
+    'rewardReturnPerPallet': {'low': 10, 'high': 100},
+    'rewardPallet': {'low': 1, 'high': 20},
+    'rewardCapsule': {'low': 5, 'high': 60},
+    'rewardStop': {'low': -20, 'high': 0},
+    'weight:eats-pallet': {'low': 50, 'high': 300},
+    'weight:returns-pallet': {'low': 200, 'high': 800},
+    'weight:dist-to-nearest-ghost': {'low': 0, 'high': 16}
+}
+WEIGHT_PREFIX = 'weight:'
+
+
+# The learning attacker prints a line per episode
+def runQuietTrainingTask(*args):
+    return runQuietly(runTrainingTask, *args)
+
+
+def sampleValue(space, rng):
+    if 'choices' in space:
+        return rng.choice(space['choices'])
+    if space.get('log'):
+        return math.exp(rng.uniform(math.log(space['low']), math.log(space['high'])))
+    return rng.uniform(space['low'], space['high'])
+
+
+def sampleConfig(searchSpace, seed, trialId):
+    # Each trial has its own random generator, so a resumed sweep samples the same configs
+    rng = random.Random('{}-{}'.format(seed, trialId))
+    return {name: sampleValue(space, rng) for name, space in sorted(searchSpace.items())}
+
+
+def splitConfig(config):
+    agentOptions = {name: value for name, value in config.items() if not name.startswith(WEIGHT_PREFIX)}
+    weights = {name[len(WEIGHT_PREFIX):]: value for name, value in config.items() if name.startswith(WEIGHT_PREFIX)}
+    return agentOptions, weights
+
+
+def getEpisodeBudget(options, rung):
+    return options.minEpisodes * options.eta ** rung
+
+
+def getPoints(trial, rung):
+    evaluation = trial['rungs'][rung]
+    return evaluation['winRate'], evaluation['meanScore']
+
+
+class SweepStore:
+    """
+    The sweep directory: sweep.json holds the search space and the options the sweep was started with, and
+    trial-<id>.json each trial. trial-<id>.weights.json holds the current weights of a trial, as a weights file of
+    myTeam.py, for the evaluation games. Files are replaced atomically, so an interrupted sweep can be resumed.
+    """
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def getPath(self, name):
+        return os.path.join(self.directory, name)
+
+    def getWeightsFile(self, trialId):
+        return self.getPath('trial-{}.weights.json'.format(trialId))
+
+    def read(self, name):
+        try:
+            with open(self.getPath(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write(self, name, value, indent=2):
+        tmpFileName = '{}.{}.tmp'.format(self.getPath(name), os.getpid())
+        with open(tmpFileName, 'w') as f:
+            json.dump(value, f, indent=indent, sort_keys=True)
+        os.replace(tmpFileName, self.getPath(name))
+
+    def loadTrial(self, trialId):
+        return self.read('trial-{}.json'.format(trialId))
+
+    def saveTrial(self, trial):
+        self.write('trial-{}.json'.format(trial['id']), trial)
+        # loadWeights() reads the last line of a weights file
+        self.write('trial-{}.weights.json'.format(trial['id']), trial['weights'], indent=None)
+
+
+class SweepDriver:
+    def __init__(self, options, searchSpace, initialWeights):
+        self.options = options
+        self.contestDir = os.path.abspath(options.contestDir)
+        self.opponents = options.opponents.split(',')
+        self.layouts = options.layouts.split(',')
+        self.evalOpponents = (options.evalOpponents or options.opponents).split(',')
+        self.evalLayouts = (options.evalLayouts or options.layouts).split(',')
+        self.store = SweepStore(options.store)
+
+        # A resumed sweep keeps the search space it was started with
+        sweep = self.store.read('sweep.json')
+        if sweep is None:
+            sweep = {'searchSpace': searchSpace, 'seed': options.seed, 'initialWeights': initialWeights}
+            self.store.write('sweep.json', sweep)
+        self.searchSpace = sweep['searchSpace']
+        self.seed = sweep['seed']
+
+        self.trials = []
+        for trialId in range(options.trials):
+            trial = self.store.loadTrial(trialId)
+            if trial is None:
+                config = sampleConfig(self.searchSpace, self.seed, trialId)
+                weights = dict(sweep['initialWeights'])
+                weights.update(splitConfig(config)[1])
+                trial = {'id': trialId, 'config': config, 'status': 'running', 'episodes': 0, 'trainingTasks': 0,
+                         'learningCurve': [], 'rungs': [], 'weights': weights}
+                self.store.saveTrial(trial)
+            self.trials.append(trial)
+
+    def makeTrainingTask(self, trial, budget):
+        # The tasks of a trial cycle through every (opponents, layout) pair, each with its own random seed
+        taskNumber = trial['trainingTasks']
+        opponents = self.opponents[taskNumber % len(self.opponents)]
+        layout = self.layouts[(taskNumber // len(self.opponents)) % len(self.layouts)]
+        seed = self.seed + 1000 * trial['id'] + taskNumber
+        if layout == 'RANDOM':
+            layout = 'RANDOM{}'.format(seed)
+        numEpisodes = min(self.options.taskEpisodes, budget - trial['episodes'])
+        return (self.contestDir, dict(trial['weights']), opponents, layout, numEpisodes, seed,
+                splitConfig(trial['config'])[0], self.options.engine)
+
+    def makeEvaluationTasks(self, trial, rung):
+        # Every trial of a rung plays the same games, as red and as blue with the same seed
+        teamOpts = 'weightsFile={}'.format(self.store.getWeightsFile(trial['id']))
+        tasks = []
+        for gameNumber in range(self.options.evalGames):
+            pairing = gameNumber // 2
+            opponents = self.evalOpponents[pairing % len(self.evalOpponents)]
+            layout = self.evalLayouts[(pairing // len(self.evalOpponents)) % len(self.evalLayouts)]
+            seed = self.seed + 1000000 * (rung + 1) + pairing
+            if layout == 'RANDOM':
+                layout = 'RANDOM{}'.format(seed)
+            tasks.append((self.contestDir, opponents, layout, gameNumber % 2 == 0, seed, teamOpts,
+                          self.options.engine))
+        return tasks
+
+    def run(self):
+        survivors = self.trials
+        with ProcessPoolExecutor(self.options.workers) as pool:
+            for rung in range(self.options.rungs):
+                if rung > 0:
+                    survivors = self.promote(survivors, rung - 1)
+                self.runRung(pool, survivors, rung)
+        for trial in survivors:
+            if trial['status'] == 'running':
+                trial['status'] = 'finished'
+                self.store.saveTrial(trial)
+        return max(survivors, key=lambda trial: getPoints(trial, self.options.rungs - 1))
+
+    def promote(self, trials, rung):
+        numSurvivors = max(1, len(trials) // self.options.eta)
+        ranked = sorted(trials, key=lambda trial: getPoints(trial, rung), reverse=True)
+        for trial in ranked[numSurvivors:]:
+            if trial['status'] == 'running':
+                trial['status'] = 'pruned'
+                self.store.saveTrial(trial)
+        print('Rung {}: {} of {} trials promoted'.format(rung, numSurvivors, len(trials)))
+        return ranked[:numSurvivors]
+
+    def runRung(self, pool, trials, rung):
+        """
+        Trains every trial up to the episode budget of the rung and evaluates it, skipping the work a previous run of
+        the sweep has saved. Training tasks and evaluation games of different trials run side by side in the pool.
+        """
+        budget = getEpisodeBudget(self.options, rung)
+        startTime = time.time()
+        pending = {}
+        evaluations = {}
+
+        def submitNext(trial):
+            if trial['episodes'] < budget:
+                pending[pool.submit(runQuietTrainingTask, *self.makeTrainingTask(trial, budget))] = (trial, None)
+            elif len(trial['rungs']) <= rung:
+                evaluations[trial['id']] = []
+                for task in self.makeEvaluationTasks(trial, rung):
+                    pending[pool.submit(playGame, *task)] = (trial, task)
+
+        for trial in trials:
+            submitNext(trial)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                trial, task = pending.pop(future)
+                if task is None:
+                    trial['weights'], scores = future.result()
+                    trial['episodes'] += len(scores)
+                    trial['trainingTasks'] += 1
+                    trial['learningCurve'].extend(scores)
+                    self.store.saveTrial(trial)
+                    submitNext(trial)
+                    continue
+
+                # A game that crashed is a loss of the trial, as in the tournament
+                records = evaluations[trial['id']]
+                try:
+                    records.append(future.result())
+                except Exception as e:
+                    records.append(getCrashRecord(task, e))
+                    print('Rung {} trial {}: game crashed, {}'.format(rung, trial['id'], records[-1]['error']))
+                if len(records) == self.options.evalGames:
+                    trial['rungs'].append({
+                        'episodes': trial['episodes'],
+                        'games': len(records),
+                        'winRate': sum([OUTCOME_POINTS[record['outcome']] for record in records]) / len(records),
+                        'meanScore': sum([record['score'] for record in records]) / len(records),
+                        'crashes': len([record for record in records if record['crashed']])
+                    })
+                    self.store.saveTrial(trial)
+                    self.reportTrial(trial, rung, startTime)
+
+    def reportTrial(self, trial, rung, startTime):
+        evaluation = trial['rungs'][rung]
+        recentScores = trial['learningCurve'][-self.options.taskEpisodes:]
+        print('Rung {} trial {}: {} episodes (last {} mean {:.2f}), win rate {:.3f}, mean score {:.2f} ({:.0f}s)'
+              .format(rung, trial['id'], trial['episodes'], len(recentScores),
+                      sum(recentScores) / max(1, len(recentScores)), evaluation['winRate'], evaluation['meanScore'],
+                      time.time() - startTime))
+
+
+def readCommand(argv):
+    parser = argparse.ArgumentParser(description='Sweep the myTeam.py attacker hyperparameters with successive halving')
+    parser.add_argument('--contestDir', default='.', help='directory of capture.py and its layouts')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--space', default=None,
+                        help='JSON file of the search space, see DEFAULT_SEARCH_SPACE for its format')
+    parser.add_argument('--trials', type=int, default=27, help='trials sampled for the first rung')
+    parser.add_argument('--eta', type=int, default=3, help='1 / eta of the trials go on to the next rung')
+    parser.add_argument('--rungs', type=int, default=3, help='number of rungs')
+    parser.add_argument('--minEpisodes', type=int, default=10,
+                        help='training episodes of the first rung, multiplied by eta at every rung')
+    parser.add_argument('--taskEpisodes', type=int, default=10, help='training episodes per task')
+    parser.add_argument('--opponents', default='baselineTeam', help='comma separated training opponent teams')
+    parser.add_argument('--layouts', default='defaultCapture',
+                        help='comma separated training layouts, RANDOM picks a new random layout for every task')
+    parser.add_argument('--evalGames', type=int, default=10, help='evaluation games of every trial at every rung')
+    parser.add_argument('--evalOpponents', default=None,
+                        help='evaluation opponent teams, the training ones if not given')
+    parser.add_argument('--evalLayouts', default=None, help='evaluation layouts, the training ones if not given')
+    parser.add_argument('--weights', default=None,
+                        help='start from the last weights of this weights file or weight history, '
+                             'instead of those the attacker loads at startup')
+    parser.add_argument('--engine', choices=['capture', 'fast'], default='capture',
+                        help='play the games with capture.py, or with the headless simulator fastCapture.py')
+    parser.add_argument('--store', default='sweepResults', help='directory of the trials, to resume the sweep from')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    options = readCommand(argv)
+    workingDir = os.getcwd()
+    options.store = os.path.abspath(options.store)
+    if options.weights is not None:
+        options.weights = os.path.abspath(options.weights)
+    searchSpace = DEFAULT_SEARCH_SPACE
+    if options.space is not None:
+        with open(options.space) as f:
+            searchSpace = json.load(f)
+
+    importCapture(os.path.abspath(options.contestDir))
+    import myTeam
+    initialWeights = myTeam.myAttackingAgent(ATTACKER_INDEX, weightsFile=options.weights).getWeights()
+
+    os.chdir(workingDir)
+    best = SweepDriver(options, searchSpace, initialWeights).run()
+    print('Best trial {}: win rate {:.3f}, mean score {:.2f}'.format(best['id'], *getPoints(best, options.rungs - 1)))
+    print('Config: {}'.format(json.dumps(best['config'], sort_keys=True)))
+    print('Weights: {}'.format(os.path.join(options.store, 'trial-{}.weights.json'.format(best['id']))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,36 @@
+# Tests run against the Berkeley engine if PACMAN_CONTEST_DIR names its directory, and otherwise against the
+# stub engine of the benchmark (with stand-in layouts of the same names).
+
+import os, sys
+import pytest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_ENGINE_DIR = os.path.join(PACKAGE_DIR, 'benchmark', 'stubEngine')
+ENGINE_DIR = os.path.abspath(os.environ.get('PACMAN_CONTEST_DIR') or STUB_ENGINE_DIR)
+IS_STUB_ENGINE = ENGINE_DIR == STUB_ENGINE_DIR
+MY_TEAM = os.path.join(PACKAGE_DIR, 'myTeam.py')
+
+for path in [ENGINE_DIR, PACKAGE_DIR]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def capture(monkeypatch):
+    # capture.py loads layouts relative to the working directory
+    monkeypatch.chdir(ENGINE_DIR)
+    import capture
+    return capture
+
+
+@pytest.fixture
+def myTeam(capture):
+    import myTeam
+    return myTeam
+
+
+def getLayout(capture, layoutName):
+    if hasattr(capture, 'getLayout'):
+        return capture.getLayout(layoutName)
+    import layout
+    return layout.getLayout(layoutName)
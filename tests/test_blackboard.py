@@ -0,0 +1,36 @@
+import random
+import numpy as np
+
+from conftest import MY_TEAM
+
+
+# A learning attacker, as trainTeam.runTrainingTask() plays it, also evaluates the states it learns from. The
+# opponents it finds in an observation must be those of the observation, never the hidden ones of the full state.
+def test_observation_never_shows_hidden_opponents(capture, myTeam, tmp_path):
+    random.seed(0)
+    np.random.seed(0)
+    options = capture.readCommand(['-r', MY_TEAM, '-b', MY_TEAM, '-l', 'jumboCapture', '-n', '1', '-Q'])
+    blackboard = options['agents'][0].blackboard
+    attacker = myTeam.myAttackingAgent(0, numTraining=1, blackboard=blackboard,
+                                       weightsFile=str(tmp_path / 'weights.json'))
+    attacker.printStatistics = lambda: None
+    options['agents'][0] = attacker
+
+    hiddenOpponents = []
+    chooseAction, getOpponentsState = attacker.chooseAction, attacker.getOpponentsState
+
+    def checkedGetOpponentsState(gameState):
+        opponents = getOpponentsState(gameState)
+        assert [opponent.getPosition() for opponent in opponents] \
+            == [gameState.getAgentState(i).getPosition() for i in attacker.getOpponents(gameState)]
+        return opponents
+
+    def checkedChooseAction(gameState):
+        hiddenOpponents.extend([i for i in attacker.getOpponents(gameState)
+                                if gameState.getAgentState(i).getPosition() is None])
+        return chooseAction(gameState)
+
+    attacker.getOpponentsState = checkedGetOpponentsState
+    attacker.chooseAction = checkedChooseAction
+    capture.runGames(**options)
+    assert len(hiddenOpponents) > 0
@@ -0,0 +1,66 @@
+import gzip, json
+import pytest
+
+
+def getCheckpoints(weights, numEpisodes):
+    return [(episode, {feature: value * episode for feature, value in weights.items()})
+            for episode in range(1, numEpisodes + 1)]
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_checkpoints_round_trip(myTeam, tmp_path, compress):
+    latestFile = str(tmp_path / 'myAttackingAgentWeights.json')
+    historyFile = str(tmp_path / 'weightHistory.jsonl')
+    checkpointer = myTeam.WeightCheckpointer(latestFile, historyFile, flushEvery=3, compress=compress)
+    checkpoints = getCheckpoints({'eats-pallet': 176.90001376709728, 'dead-end-ahead': -970.25}, 7)
+
+    for episode, weights in checkpoints[:3]:
+        checkpointer.add(episode, weights)
+    # Flushed every 3 episodes, in full precision
+    assert myTeam.loadWeights(latestFile) == checkpoints[2][1]
+    for episode, weights in checkpoints[3:]:
+        checkpointer.add(episode, weights)
+    assert myTeam.loadWeights(latestFile) == checkpoints[5][1]
+    checkpointer.flush()
+
+    history = checkpointer.historyFile
+    assert history.endswith('.gz') == compress
+    assert myTeam.loadWeights(latestFile) == checkpoints[-1][1]
+    assert myTeam.loadWeights(history) == checkpoints[-1][1]
+    opener = gzip.open if compress else open
+    with opener(history, 'rt') as f:
+        assert [(checkpoint['episode'], checkpoint['weights']) for checkpoint in map(json.loads, f)] == checkpoints
+
+
+# The agents load the weights file of their class at startup, over their initial weights
+def test_agent_loads_latest_checkpoint(myTeam, tmp_path):
+    weightsFile = str(tmp_path / 'weights.json')
+    checkpointer = myTeam.WeightCheckpointer(weightsFile, str(tmp_path / 'weightHistory.jsonl'))
+    weights = dict(myTeam.myAttackingAgent(0).getWeights(), **{'eats-pallet': 1.5})
+    checkpointer.add(1, weights)
+    checkpointer.flush()
+    assert myTeam.myAttackingAgent(0, weightsFile=weightsFile).getWeights() == weights
+
+
+def test_missing_or_empty_weights_file(myTeam, tmp_path):
+    assert myTeam.loadWeights(str(tmp_path / 'missing.json')) is None
+    (tmp_path / 'empty.json').write_text('\n')
+    assert myTeam.loadWeights(str(tmp_path / 'empty.json')) is None
+
+
+# A checkpoint cut short or garbled leaves the agent with its initial weights, with a warning
+@pytest.mark.parametrize('content', ['{"eats-pallet": 176.9, "dead-', '{eats-pallet: 1}', '[1.0, 2.0]'])
+def test_unreadable_weights_file(myTeam, tmp_path, capsys, content):
+    weightsFile = tmp_path / 'weights.json'
+    weightsFile.write_text(content + '\n')
+    assert myTeam.loadWeights(str(weightsFile)) is None
+    assert 'cannot read the weights of {}'.format(weightsFile) in capsys.readouterr().out
+    assert myTeam.myAttackingAgent(0, weightsFile=str(weightsFile)).getWeights() \
+        == myTeam.myAttackingAgent(0, weightsFile=str(tmp_path / 'missing.json')).getWeights()
+
+
+def test_truncated_compressed_history(myTeam, tmp_path, capsys):
+    history = tmp_path / 'weightHistory.jsonl.gz'
+    history.write_bytes(gzip.compress(b'{"episode": 1, "weights": {"eats-pallet": 1.5}}\n' * 100)[:-20])
+    assert myTeam.loadWeights(str(history)) is None
+    assert 'cannot read the weights' in capsys.readouterr().out
@@ -0,0 +1,62 @@
+import pytest
+
+from conftest import getLayout
+
+
+# The fixed-point loop of the original myAttackingAgent.registerInitialState(): every pass turns the open cells
+# of the columns startX <= x < endX with 3 or more walls around them into walls, until a pass finds none
+def getDeadEndsByLoop(walls, startX, endX):
+    walls = [[walls[x][y] for y in range(walls.height)] for x in range(walls.width)]
+    width, height = len(walls), len(walls[0])
+
+    def isBlockedByWalls(position, walls):
+        x, y = position
+        wallCount = sum([walls[nx][ny] for nx, ny in [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)] if
+                         0 <= nx < width and 0 <= ny < height])
+        return wallCount >= 3
+
+    deadEndPositions = []
+    while True:
+        prevLen = len(deadEndPositions)
+        newWalls = [list(column) for column in walls]
+        for x in range(startX, endX):
+            for y in range(height):
+                if not walls[x][y] and isBlockedByWalls((x, y), walls):
+                    deadEndPositions.append((x, y))
+                    newWalls[x][y] = True
+        walls = newWalls
+        if prevLen == len(deadEndPositions):
+            break
+
+    openPositions = [(x, y) for x in range(startX, endX) for y in range(height)
+                     if not walls[x][y] and (x, y) not in deadEndPositions]
+    return deadEndPositions, openPositions
+
+
+@pytest.mark.parametrize('layoutName', ['defaultCapture', 'mediumCapture', 'jumboCapture'])
+def test_dead_ends_match_loop(capture, myTeam, layoutName):
+    walls = getLayout(capture, layoutName).walls
+    for startX, endX in [(0, walls.width // 2), (walls.width // 2, walls.width), (0, walls.width)]:
+        deadEndIndex = myTeam.DeadEndIndex(walls, startX, endX)
+        deadEndPositions, openPositions = getDeadEndsByLoop(walls, startX, endX)
+        assert deadEndIndex.deadEndPositions == frozenset(deadEndPositions)
+        assert list(deadEndIndex.openPositions) == openPositions
+        for x in range(walls.width):
+            for y in range(walls.height):
+                assert deadEndIndex.isDeadEnd((x, y)) == ((x, y) in deadEndPositions)
+
+
+# Each step out of a dead end goes one step closer to the same exit
+@pytest.mark.parametrize('layoutName', ['defaultCapture', 'jumboCapture'])
+def test_dead_end_depths_lead_to_exit(capture, myTeam, layoutName):
+    walls = getLayout(capture, layoutName).walls
+    deadEndIndex = myTeam.DeadEndIndex(walls, 0, walls.width)
+    for x, y in deadEndIndex.deadEndPositions:
+        exit, depth = deadEndIndex.getExit((x, y)), deadEndIndex.getDepth((x, y))
+        if exit is None:
+            continue
+        assert depth > 0 and not deadEndIndex.isDeadEnd(exit)
+        steps = [(nx, ny) for nx, ny in [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+                 if 0 <= nx < walls.width and 0 <= ny < walls.height and not walls[nx][ny]
+                 and deadEndIndex.getDepth((nx, ny)) == depth - 1 and deadEndIndex.getExit((nx, ny)) == exit]
+        assert len(steps) > 0
@@ -0,0 +1,45 @@
+import random
+import numpy as np
+
+from conftest import MY_TEAM
+
+
+# The compiled table gives the actions the features and weights of myDefensiveAgent give, in every state of a game
+# where it applies: the best actions of the table are those with the maximum Q-value, 'reverse' feature included
+def test_compiled_actions_match_live_policy(capture, myTeam, monkeypatch, tmp_path):
+    monkeypatch.setattr(myTeam, 'LAYOUT_CACHE_DIR', str(tmp_path))
+    random.seed(0)
+    np.random.seed(0)
+    options = capture.readCommand(['-r', MY_TEAM, '-b', MY_TEAM, '-l', 'defaultCapture', '-n', '1', '-Q'])
+    defender = myTeam.myDefensiveAgent(0, blackboard=options['agents'][0].blackboard)
+    options['agents'][0] = defender
+
+    comparedStates = []
+    registerInitialState, getCompiledAction = defender.registerInitialState, defender.getCompiledAction
+
+    def compilingRegisterInitialState(gameState):
+        registerInitialState(gameState)
+        defender.policyTable = myTeam.getDefensePolicyTable(defender.layoutAnalysis, defender.getWeights(),
+                                                            compile=True)
+        assert defender.policyTable is not None
+
+    def checkedGetCompiledAction(gameState):
+        # The actions the compiled action is chosen among
+        choice, compiledActions = random.choice, []
+        random.choice = lambda actions: compiledActions.extend(actions) or choice(actions)
+        try:
+            action = getCompiledAction(gameState)
+        finally:
+            random.choice = choice
+        if action is not None:
+            actions = defender.getLegalActions(gameState)
+            qValues = defender.getQValues(gameState, actions)
+            liveActions = [a for a, qValue in zip(actions, qValues) if qValue == max(qValues)]
+            assert sorted(compiledActions) == sorted(liveActions)
+            comparedStates.append(gameState)
+        return action
+
+    defender.registerInitialState = compilingRegisterInitialState
+    defender.getCompiledAction = checkedGetCompiledAction
+    capture.runGames(**options)
+    assert len(comparedStates) > 100
@@ -0,0 +1,45 @@
+from collections import deque
+import pytest
+
+from conftest import getLayout
+
+
+# Maze distances from one position, by a search over the wall grid
+def getDistancesByBFS(walls, source):
+    distances = {source: 0}
+    queue = deque([source])
+    while queue:
+        x, y = queue.popleft()
+        for n in [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]:
+            if 0 <= n[0] < walls.width and 0 <= n[1] < walls.height and not walls[n[0]][n[1]] \
+                    and n not in distances:
+                distances[n] = distances[(x, y)] + 1
+                queue.append(n)
+    return distances
+
+
+@pytest.mark.parametrize('layoutName', ['defaultCapture', 'mediumCapture', 'jumboCapture'])
+def test_distances_match_bfs(capture, myTeam, monkeypatch, tmp_path, layoutName):
+    monkeypatch.setattr(myTeam, 'LAYOUT_CACHE_DIR', str(tmp_path))
+    walls = getLayout(capture, layoutName).walls
+    distanceTable = myTeam.DistanceTable(walls, myTeam.getLayoutHash(walls))
+    assert distanceTable.numCells == len(walls.asList(False))
+    for source in distanceTable.cells:
+        distances = getDistancesByBFS(walls, source)
+        for target in distanceTable.cells:
+            expected = distances.get(target, myTeam.DistanceTable.UNREACHABLE)
+            assert distanceTable.getDistance(source, target) == expected
+            assert distanceTable.matrix[distanceTable.getCellId(source), distanceTable.getCellId(target)] == expected
+
+
+# The table is saved keyed by the layout hash, and a later game reads it back instead of computing it
+def test_saved_table_is_reused(capture, myTeam, monkeypatch, tmp_path):
+    monkeypatch.setattr(myTeam, 'LAYOUT_CACHE_DIR', str(tmp_path))
+    walls = getLayout(capture, 'defaultCapture').walls
+    layoutHash = myTeam.getLayoutHash(walls)
+    computed = myTeam.DistanceTable(walls, layoutHash)
+    assert (tmp_path / 'distances_{}.bin'.format(layoutHash)).exists()
+
+    monkeypatch.setattr(myTeam.DistanceTable, 'compute', lambda self: pytest.fail('the saved table was not used'))
+    loaded = myTeam.DistanceTable(walls, layoutHash)
+    assert loaded.distances == computed.distances
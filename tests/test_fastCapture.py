@@ -0,0 +1,39 @@
+import random
+import numpy as np
+import pytest
+
+import fastCapture
+from conftest import IS_STUB_ENGINE, MY_TEAM, getLayout
+
+
+def playGame(capture, engine, layoutName, seed):
+    options = capture.readCommand(['-r', MY_TEAM, '-b', MY_TEAM, '-l', layoutName, '-Q'])
+    random.seed(seed)
+    np.random.seed(seed)
+    game = engine.runGames(**options)[0]
+    return game.moveHistory, game.state.data.score
+
+
+# The stub engine only approximates the rules of capture.py, so the simulator can only be held to the real one
+@pytest.mark.skipif(IS_STUB_ENGINE, reason='needs the Berkeley engine, set PACMAN_CONTEST_DIR')
+@pytest.mark.parametrize('layoutName', ['defaultCapture', 'jumboCapture'])
+def test_same_game_as_capture(capture, layoutName):
+    moveHistory, score = playGame(capture, capture, layoutName, 1)
+    fastMoveHistory, fastScore = playGame(capture, fastCapture, layoutName, 1)
+    assert fastMoveHistory == moveHistory
+    assert fastScore == score
+
+
+# As in capture.py, a side eaten down to MIN_FOOD pallets does not end the game, returning them does
+def test_eating_down_to_min_food_does_not_end_the_game(capture):
+    layout = getLayout(capture, 'defaultCapture')
+    state = fastCapture.FastGameState()
+    state.initialize(layout, 1200)
+    redPacman = state.data.agentStates[state.redTeam[0]]
+    redPacman.isPacman = True
+    blueFood = [(int(x), int(y)) for x, y in zip(*np.nonzero(state.data.foodArray))
+                if not state.data.rules.isRed((x, y))]
+    for pos in blueFood[fastCapture.MIN_FOOD:]:
+        fastCapture.consume(state, redPacman, pos, True)
+    assert state.getBlueFood().count() == fastCapture.MIN_FOOD
+    assert not state.isOver()
@@ -0,0 +1,88 @@
+import pytest
+
+import fastCapture
+from conftest import getLayout
+
+
+# A red attacker on defaultCapture, and the states after it ate more and more of the blue pallets
+@pytest.fixture
+def gameStates(capture, myTeam, monkeypatch, tmp_path):
+    monkeypatch.setattr(myTeam, 'LAYOUT_CACHE_DIR', str(tmp_path))
+    gameState = fastCapture.FastGameState()
+    gameState.initialize(getLayout(capture, 'defaultCapture'), 1200)
+    agent = myTeam.myAttackingAgent(0)
+    agent.registerInitialState(gameState)
+
+    gameStates = [gameState]
+    for numEaten in [1, 5, len(gameState.getBlueFood().asList()) - 1]:
+        state = gameState.deepCopy()
+        for pos in gameState.getBlueFood().asList()[:numEaten]:
+            fastCapture.consume(state, state.data.agentStates[0], pos, True)
+        gameStates.append(state)
+    return agent, gameStates
+
+
+# The per-pallet loops of myAttackingAgent, before the food index
+def getDistToNearestPallet(agent, pos, pallets):
+    return min([agent.getMazeDistance(pos, pallet) for pallet in pallets])
+
+
+def getNearestPallet(agent, pos, pallets):
+    return min(pallets, key=lambda pallet: agent.getMazeDistance(pos, pallet))
+
+
+def test_food_index_matches_loops(myTeam, gameStates):
+    agent, gameStates = gameStates
+    foodIndex = myTeam.FoodIndex(agent.layoutAnalysis)
+    numPallets = []
+    for gameState in gameStates:
+        pallets = agent.getFood(gameState).asList()
+        foodIndex.update(agent.getPalletMask(gameState))
+        assert foodIndex.getTargetPallets(False) == pallets
+        numPallets.append(len(pallets))
+        for pos in agent.distanceTable.cells:
+            assert foodIndex.getDistToNearestPallet(pos, False) == getDistToNearestPallet(agent, pos, pallets)
+            assert foodIndex.getNearestPallet(pos, False) == getNearestPallet(agent, pos, pallets)
+
+        # Pallets deep in a dead-end path are left out, as long as there are others
+        targetPallets = foodIndex.getTargetPallets(True)
+        assert set(targetPallets) <= set(pallets) and len(targetPallets) > 0
+        for pos in agent.distanceTable.cells:
+            assert foodIndex.getDistToNearestPallet(pos, True) == getDistToNearestPallet(agent, pos, targetPallets)
+    assert numPallets == [numPallets[0] - numEaten for numEaten in [0, 1, 5, numPallets[0] - 1]]
+
+
+# Door and capsule fields, the capsule one recomputed as capsules are eaten
+def test_distance_fields_match_loops(myTeam, gameStates):
+    agent, gameStates = gameStates
+    distanceFields = myTeam.DistanceFields(agent.distanceTable)
+    capsules = agent.getCapsules(gameStates[0])
+    assert len(capsules) > 0
+    for name, targets in [('doors', agent.doorPositions)] + [('capsules', capsules[i:]) for i in range(len(capsules))]:
+        for pos in agent.distanceTable.cells:
+            distances = [agent.getMazeDistance(pos, target) for target in targets]
+            assert distanceFields.getDistance(name, targets, pos) == min(distances)
+            assert distanceFields.getNearest(name, targets, pos) == (targets[distances.index(min(distances))],
+                                                                     min(distances))
+
+    pos = agent.distanceTable.cells[0]
+    assert distanceFields.getNearest('capsules', [], pos) is None
+    assert distanceFields.getDistance('capsules', [], pos) == myTeam.DistanceTable.UNREACHABLE
+
+
+# The pallet masks hold the pallets of the food grids, and the field minimum over a mask is the distance to its
+# nearest pallet
+def test_pallet_masks_match_food_grids(myTeam, gameStates):
+    agent, gameStates = gameStates
+    distanceTable = agent.distanceTable
+    for gameState in gameStates:
+        pallets = agent.getFood(gameState).asList()
+        palletMask = agent.getPalletMask(gameState)
+        assert distanceTable.getPositions(palletMask) == pallets
+        assert palletMask.sum() == len(pallets)
+        assert distanceTable.getPositions(agent.getDefendedPalletMask(gameState)) \
+            == agent.getFoodYouAreDefending(gameState).asList()
+
+        field = distanceTable.getMaskDistanceField(palletMask)
+        for pos in distanceTable.cells:
+            assert field[distanceTable.getCellId(pos)] == getDistToNearestPallet(agent, pos, pallets)
@@ -0,0 +1,79 @@
+import random
+import numpy as np
+
+import fastCapture
+from conftest import getLayout
+
+# Agent indices of the teams of defaultCapture, red on the left
+RED_TEAM, BLUE_TEAM = [0, 2], [1, 3]
+
+
+def getTracker(capture, myTeam, monkeypatch, tmp_path):
+    monkeypatch.setattr(myTeam, 'LAYOUT_CACHE_DIR', str(tmp_path))
+    random.seed(0)
+    layout = getLayout(capture, 'defaultCapture')
+    state = fastCapture.FastGameState()
+    state.initialize(layout, 1200)
+    layoutAnalysis = myTeam.getLayoutAnalysis(layout, True)
+    return state, myTeam.OpponentTracker(state, True, layoutAnalysis, RED_TEAM, BLUE_TEAM)
+
+
+def moveAgent(state, index, position, isPacman):
+    agentState = state.data.agentStates[index]
+    agentState.configuration = fastCapture.Configuration(position, fastCapture.Directions.STOP)
+    agentState.isPacman = isPacman
+
+
+# Observation of red agent 0 with the given time left
+def observe(state, tracker, timeLeft):
+    state.data.timeleft = timeLeft
+    observation = state.makeObservation(0)
+    tracker.update(observation, 0)
+    return observation
+
+
+def test_belief_collapses_to_observed_position(capture, myTeam, monkeypatch, tmp_path):
+    state, tracker = getTracker(capture, myTeam, monkeypatch, tmp_path)
+    moveAgent(state, 1, (4, 1), True)
+    observation = observe(state, tracker, 1200)
+    assert observation.getAgentPosition(1) == (4, 1)
+    expected = np.zeros(tracker.distanceTable.numCells)
+    expected[tracker.distanceTable.getCellId((4, 1))] = 1.0
+    assert (tracker.beliefs[1] == expected).all()
+    assert tracker.getMostLikelyPosition(1) == (4, 1)
+
+
+# After more than MAX_ELAPSE_STEPS unobserved moves, the opponent is wherever the noisy distance, what the team
+# sees and the side of the layout allow
+def test_noisy_distance_eliminates_cells(capture, myTeam, monkeypatch, tmp_path):
+    state, tracker = getTracker(capture, myTeam, monkeypatch, tmp_path)
+    observation = observe(state, tracker, 1200 - 4 * (myTeam.MAX_ELAPSE_STEPS + 1))
+    assert observation.getAgentPosition(3) is None
+
+    distanceTable = tracker.distanceTable
+    myPosition, noisyDistance = observation.getAgentPosition(0), observation.getAgentDistances()[3]
+    possibleCells = [cell for cell, position in enumerate(distanceTable.cells)
+                     if not tracker.isHomeCell[cell]
+                     and abs(myTeam.util.manhattanDistance(position, myPosition) - noisyDistance) <= myTeam.SONAR_NOISE
+                     and all([myTeam.util.manhattanDistance(position, observation.getAgentPosition(i))
+                              > myTeam.SIGHT_RANGE for i in RED_TEAM])]
+    belief = tracker.beliefs[3]
+    assert list(np.flatnonzero(belief)) == possibleCells
+    assert np.allclose(belief[possibleCells], 1.0 / len(possibleCells))
+    assert belief[distanceTable.getCellId(state.getAgentPosition(3))] > 0
+    assert len(possibleCells) < (~tracker.isHomeCell).sum()
+
+
+# An invader eaten on our side starts over from his start position, which his belief must not rule out
+def test_belief_resets_on_capture(capture, myTeam, monkeypatch, tmp_path):
+    state, tracker = getTracker(capture, myTeam, monkeypatch, tmp_path)
+    moveAgent(state, 1, (4, 1), True)
+    observe(state, tracker, 1200)
+    fastCapture.killAgent(state.data.agentStates[1])
+    observation = observe(state, tracker, 1196)
+    assert observation.getAgentPosition(1) is None
+
+    belief = tracker.beliefs[1]
+    assert np.isclose(belief.sum(), 1.0)
+    assert belief[tracker.distanceTable.getCellId(state.getInitialAgentPosition(1))] > 0
+    assert (belief[tracker.isHomeCell] == 0).all()
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+import fastCapture
+from conftest import getLayout
+
+
+# Transitions with one feature, learnt with weight 1: the TD error of transition i is rewards[i] - features[i]
+def getBuffer(myTeam, rewards, capacity=8):
+    replayBuffer = myTeam.ReplayBuffer(capacity, prioritized=True)
+    for reward in rewards:
+        replayBuffer.add(np.array([1.0]), reward, np.zeros((0, 1)))
+    return replayBuffer
+
+
+def test_priorities_follow_td_errors(myTeam):
+    replayBuffer = getBuffer(myTeam, [1.0, 3.0, -9.0, 1.0])
+    indices = np.arange(len(replayBuffer))
+    tdErrors = replayBuffer.getTDErrors(indices, np.array([1.0]), 0.9)
+    assert tdErrors == pytest.approx([0.0, 2.0, -10.0, 0.0])
+    replayBuffer.updatePriorities(indices, tdErrors)
+    assert replayBuffer.priorities[:4] == pytest.approx(np.abs(tdErrors) + myTeam.REPLAY_PRIORITY_EPSILON)
+
+    # Transitions are sampled by the size of their TD error, and the likelier ones weigh less
+    np.random.seed(0)
+    sampled, isWeights = replayBuffer.sample(10000)
+    counts = np.bincount(sampled, minlength=4)
+    assert counts[2] > counts[1] > max(counts[0], counts[3])
+    assert isWeights[sampled == 2].max() < isWeights[sampled == 1].min()
+
+    # A new transition is sampled with the highest priority seen so far
+    replayBuffer.add(np.array([1.0]), 1.0, np.zeros((0, 1)))
+    assert replayBuffer.priorities[4] == replayBuffer.priorities[2]
+
+
+def getAgent(myTeam, gameState, tmp_path, **kwargs):
+    agent = myTeam.myAttackingAgent(0, numTraining=1, alpha=0.01, weightsFile=str(tmp_path / 'weights.json'),
+                                    **kwargs)
+    agent.registerInitialState(gameState)
+    return agent
+
+
+# A replayed batch of one transition is the online update of that transition
+@pytest.mark.parametrize('prioritized', [False, True])
+def test_replayed_transition_matches_online_update(capture, myTeam, monkeypatch, tmp_path, prioritized):
+    monkeypatch.setattr(myTeam, 'LAYOUT_CACHE_DIR', str(tmp_path))
+    gameState = fastCapture.FastGameState()
+    gameState.initialize(getLayout(capture, 'defaultCapture'), 1200)
+    onlineAgent = getAgent(myTeam, gameState, tmp_path)
+    replayAgent = getAgent(myTeam, gameState, tmp_path, replayCapacity=4, replayBatchSize=1, replayEvery=1,
+                           replayPrioritized=prioritized)
+    assert onlineAgent.replayBuffer is None and replayAgent.replayBuffer is not None
+
+    action = gameState.getLegalActions(0)[0]
+    nextGameState = gameState.generateSuccessor(0, action)
+    initialWeights = onlineAgent.weightVector.copy()
+    assert (replayAgent.weightVector == initialWeights).all()
+    for agent in [onlineAgent, replayAgent]:
+        agent.update(gameState, action, nextGameState, 5.0)
+    assert len(replayAgent.replayBuffer) == 1
+    assert (onlineAgent.weightVector != initialWeights).any()
+    assert replayAgent.weightVector == pytest.approx(onlineAgent.weightVector)
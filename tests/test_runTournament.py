@@ -0,0 +1,55 @@
+import pytest
+
+from runTournament import TournamentDriver, getCrashRecord, getWilsonInterval, getZ, readCommand
+
+
+def test_wilson_interval():
+    z = getZ(0.95)
+    assert z == pytest.approx(1.959964, abs=1e-6)
+    assert getWilsonInterval(0, 0, z) == (0.0, 1.0)
+    assert getWilsonInterval(5, 10, z) == pytest.approx((0.236593, 0.763407), abs=1e-6)
+    assert getWilsonInterval(8.5, 10, z) == pytest.approx((0.541154, 0.964573), abs=1e-6)
+    # Unlike the normal approximation, the interval of a perfect record is not a single point
+    lower, upper = getWilsonInterval(10, 10, z)
+    assert lower == pytest.approx(10 / (10 + z * z)) and upper == 1.0
+    assert getWilsonInterval(0, 10, z) == pytest.approx((0.0, 1 - lower))
+
+
+def test_wilson_interval_narrows_with_games():
+    z = getZ(0.95)
+    widths = [upper - lower for lower, upper in [getWilsonInterval(0.6 * n, n, z) for n in [10, 100, 1000]]]
+    assert widths[0] > widths[1] > widths[2]
+
+
+def getDriver(*argv):
+    return TournamentDriver(readCommand(['--layouts', 'defaultCapture,jumboCapture', '--minGames', '4'] + list(argv)))
+
+
+# The games of a pairing may finish before those of another, the driver waits until every pairing has as many
+def test_decides_only_on_balanced_pairings():
+    driver = getDriver('--threshold', '0.1')
+    opponents = driver.opponents[0]
+    tasks = [driver.makeTask(opponents) for _ in range(8)]
+
+    def addWin(pairing, task):
+        driver.records[opponents].append(dict(getCrashRecord(task, None), outcome='win', crashed=False))
+        driver.pairingCounts[opponents][pairing] += 1
+
+    # As many wins as pairings, but two on the first pairing and none on the last one
+    for pairing, task in [tasks[0], tasks[1], tasks[2], tasks[4]]:
+        addWin(pairing, task)
+    assert driver.pairingCounts[opponents] == [2, 1, 1, 0]
+    assert driver.decide(opponents) is None
+
+    for pairing, task in [tasks[3], tasks[5], tasks[6], tasks[7]]:
+        addWin(pairing, task)
+    assert driver.decide(opponents) == 'better'
+
+
+def test_crashed_game_is_a_loss():
+    driver = getDriver()
+    _, task = driver.makeTask(driver.opponents[0])
+    record = getCrashRecord(task, ValueError('no such team'))
+    assert record['crashed'] and record['outcome'] == 'loss'
+    assert record['error'] == 'ValueError: no such team'
+    assert (record['layout'], record['color']) == ('defaultCapture', 'red')
@@ -0,0 +1,42 @@
+from collections import deque
+import pytest
+
+from conftest import getLayout
+
+
+# Cells that removing the cell cuts off from every home cell, by a search from home without it
+def getCutOffCells(neighbors, homeCells, removedCell):
+    reached = set([cell for cell in homeCells if cell != removedCell])
+    queue = deque(reached)
+    while queue:
+        cell = queue.popleft()
+        for n in neighbors[cell]:
+            if n != removedCell and n not in reached:
+                reached.add(n)
+                queue.append(n)
+    return set(range(len(neighbors))) - reached - {removedCell}
+
+
+@pytest.mark.parametrize('layoutName', ['defaultCapture', 'mediumCapture', 'jumboCapture'])
+@pytest.mark.parametrize('red', [True, False])
+def test_choke_regions_match_cell_removal(capture, myTeam, monkeypatch, tmp_path, layoutName, red):
+    monkeypatch.setattr(myTeam, 'LAYOUT_CACHE_DIR', str(tmp_path))
+    layoutAnalysis = myTeam.getLayoutAnalysis(getLayout(capture, layoutName), red)
+    distanceTable = layoutAnalysis.distanceTable
+    strategicMap = layoutAnalysis.strategicMap
+    neighbors = distanceTable.neighbors
+    homeCells = [distanceTable.getCellId(pos) for pos in layoutAnalysis.homePositions]
+
+    # The regions of a cell are nested, its choke point is that of the smallest one
+    expectedChokeCells = [-1] * len(neighbors)
+    expectedSizes = [0] * len(neighbors)
+    for chokeCell in range(len(neighbors)):
+        region = getCutOffCells(neighbors, homeCells, chokeCell)
+        for cell in region:
+            if expectedChokeCells[cell] == -1 or len(region) < expectedSizes[cell]:
+                expectedChokeCells[cell] = chokeCell
+                expectedSizes[cell] = len(region)
+
+    assert strategicMap.chokeCells.tolist() == expectedChokeCells
+    assert strategicMap.regionSizes.tolist() == expectedSizes
+    assert any([cell >= 0 for cell in expectedChokeCells])
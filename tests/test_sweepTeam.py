@@ -0,0 +1,28 @@
+from concurrent.futures import Future
+
+from runTournament import getCrashRecord
+from sweepTeam import SweepDriver, getEpisodeBudget, readCommand
+
+
+# Runs nothing: the evaluation games of red (even game numbers) are won, those of blue crash
+class FakePool:
+    def submit(self, fn, *task):
+        future = Future()
+        _, _, _, isRed, _, _, _ = task
+        if isRed:
+            future.set_result(dict(getCrashRecord(task, None), outcome='win', crashed=False, score=3))
+        else:
+            future.set_exception(ValueError('no such team'))
+        return future
+
+
+def test_crashed_evaluation_game_is_a_loss(tmp_path):
+    options = readCommand(['--store', str(tmp_path), '--trials', '1', '--evalGames', '4'])
+    driver = SweepDriver(options, {}, {'eats-pallet': 1.0})
+    trial = driver.trials[0]
+    trial['episodes'] = getEpisodeBudget(options, 0)
+    driver.runRung(FakePool(), [trial], 0)
+
+    assert trial['rungs'] == [{'episodes': trial['episodes'], 'games': 4, 'winRate': 0.5, 'meanScore': 1.5,
+                               'crashes': 2}]
+    assert driver.store.loadTrial(0)['rungs'] == trial['rungs']
@@ -0,0 +1,45 @@
+import random
+import numpy as np
+import pytest
+
+from conftest import IS_STUB_ENGINE, MY_TEAM
+
+
+# The successors of TurnContext follow the rules of capture.py, so they are held to gameState.generateSuccessor() of
+# the real engine, for every legal action of every agent in every turn of a game
+@pytest.mark.skipif(IS_STUB_ENGINE, reason='needs the Berkeley engine, set PACMAN_CONTEST_DIR')
+@pytest.mark.parametrize('layoutName', ['defaultCapture', 'jumboCapture'])
+def test_successors_match_generate_successor(capture, myTeam, layoutName):
+    random.seed(0)
+    np.random.seed(0)
+    options = capture.readCommand(['-r', MY_TEAM, '-b', MY_TEAM, '-l', layoutName, '-n', '1', '-Q'])
+    layout = options['layouts'][0]
+    comparedActions = []
+
+    def checkSuccessors(agent, gameState):
+        red = gameState.isOnRedTeam(agent.index)
+        opponentIndices = gameState.getBlueTeamIndices() if red else gameState.getRedTeamIndices()
+        context = myTeam.TurnContext(gameState, agent.index, myTeam.getLayoutAnalysis(layout, red), opponentIndices)
+        myPosition = gameState.getAgentState(agent.index).getPosition()
+        for action in gameState.getLegalActions(agent.index):
+            successor = context.successors[action]
+            nextGameState = gameState.generateSuccessor(agent.index, action)
+            nextState = nextGameState.getAgentState(agent.index)
+            assert successor.position == nextState.getPosition()
+            assert successor.isPacman == nextState.isPacman
+            assert successor.numCarrying == nextState.numCarrying
+            # The pallets an eaten Pacman carried go back onto the layout, which the successors leave out
+            if myTeam.util.manhattanDistance(myPosition, nextState.getPosition()) > 1:
+                continue
+            food = gameState.getRedFood() if not red else gameState.getBlueFood()
+            nextFood = nextGameState.getRedFood() if not red else nextGameState.getBlueFood()
+            eatenFood = [position for position in food.asList() if not nextFood[position[0]][position[1]]]
+            assert eatenFood == ([successor.position] if successor.eatsPallet else [])
+            assert nextFood.count() == food.count() - len(eatenFood)
+            comparedActions.append(action)
+
+    for agent in options['agents']:
+        agent.chooseAction = (lambda agent, chooseAction: lambda gameState:
+                              checkSuccessors(agent, gameState) or chooseAction(gameState))(agent, agent.chooseAction)
+    capture.runGames(**options)
+    assert len(comparedActions) > 0
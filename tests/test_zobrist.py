@@ -0,0 +1,46 @@
+import random
+import pytest
+
+import fastCapture
+from conftest import getLayout
+
+
+def getFullKey(planner, state):
+    agentIndex = planner.agent.index
+    cells = dict([(agentIndex, state.cell)] + list(zip(planner.ghostIndices, state.ghostCells)))
+    return planner.hasher.getKey(cells, dict(zip(planner.ghostIndices, state.scaredTimers)),
+                                 {agentIndex: state.numCarrying}, state.pallets, state.capsuleCells)
+
+
+# The key the planner carries along with XORs is the key of the state it reaches
+@pytest.mark.parametrize('layoutName', ['defaultCapture', 'jumboCapture'])
+@pytest.mark.parametrize('index', [0, 1])
+def test_successor_keys_match_full_keys(capture, myTeam, monkeypatch, tmp_path, layoutName, index):
+    monkeypatch.setattr(myTeam, 'LAYOUT_CACHE_DIR', str(tmp_path))
+    gameState = fastCapture.FastGameState()
+    gameState.initialize(getLayout(capture, layoutName), 1200)
+    agent = myTeam.myAttackingAgent(index)
+    agent.registerInitialState(gameState)
+    planner = myTeam.MCTSPlanner(agent, gameState)
+    rootState, planner.ghostIndices = planner.getRootState(gameState)
+    planner.ghostStartCells = rootState.ghostCells
+    assert rootState.key == getFullKey(planner, rootState)
+
+    rng = random.Random(index)
+    eatenCapsules = eatenPallets = caught = 0
+    for _ in range(200):
+        # Rollouts start anywhere, to run into pallets, capsules and ghosts
+        state = rootState._replace(cell=rng.randrange(len(planner.moves)))
+        state = state._replace(key=getFullKey(planner, state))
+        for _ in range(100):
+            action, nextCell = rng.choice(planner.moves[state.cell])
+            nextState, _ = planner.getSuccessor(state, action, nextCell)
+            assert nextState.key == getFullKey(planner, nextState)
+            eatenCapsules += len(state.capsuleCells) - len(nextState.capsuleCells)
+            eatenPallets += int(state.pallets.sum() - nextState.pallets.sum())
+            state = nextState
+            if state.caught:
+                caught += 1
+                break
+    # The rollouts went through every kind of change to the key
+    assert eatenPallets > 0 and eatenCapsules > 0 and caught > 0
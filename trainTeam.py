@@ -0,0 +1,197 @@
+# trainTeam.py
+# ------------
+# Parallel training of the attacker weights of myTeam.py.
+#
+# Each worker process plays capture games with a learning myAttackingAgent against the given opponent
+# teams, starting from the current weights. The driver merges the weights learnt by the workers and
+# sends them back out, either after every round (average) or as soon as each worker finishes (async).
+# The merged weights are checkpointed like those of QLearningAgent.printStatistics(), so that the
+# attacker loads them at startup.
+#
+# Run it from the directory that holds capture.py and the layouts, e.g.
+#   python trainTeam.py --contestDir ../pacman-contest --workers 8 --rounds 50 --episodes 10 \
+#       --opponents baselineTeam,myTeam --layouts defaultCapture,RANDOM --engine fast
+
+import argparse, os, random, sys, time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+MY_TEAM = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'myTeam.py')
+
+# Our attacker plays as red agent 0, the red agent 2 is the second agent of our createTeam()
+ATTACKER_INDEX = 0
+
+
+def importCapture(contestDir):
+    # capture.py loads layouts relative to the working directory
+    os.chdir(contestDir)
+    for path in [contestDir, os.path.dirname(MY_TEAM)]:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    import capture
+    return capture
+
+
+def runTrainingTask(contestDir, weights, opponents, layout, numEpisodes, seed, agentOptions, engine):
+    """
+    Plays numEpisodes training games in this worker process and returns the learnt weights and the scores.
+    The learning attacker is made with the agent options (e.g. replay or learning rate options).
+    The games are played by capture.py, or by the headless simulator fastCapture.py if engine is 'fast'.
+    """
+    capture = importCapture(contestDir)
+    import myTeam
+    import numpy as np
+
+    random.seed(seed)
+    # Experience replay samples with NumPy
+    np.random.seed(seed)
+    options = capture.readCommand(['-r', MY_TEAM, '-b', opponents, '-l', layout, '-n', str(numEpisodes), '-Q'])
+
+    # The learning attacker replaces our first agent, and shares its blackboard with the second one
+    blackboard = options['agents'][ATTACKER_INDEX].blackboard
+    attacker = myTeam.myAttackingAgent(ATTACKER_INDEX, numTraining=numEpisodes, blackboard=blackboard, **agentOptions)
+    attacker.setWeights(weights)
+    # The driver records the merged weights, workers must not write the weight files concurrently
+    attacker.printStatistics = lambda: None
+    options['agents'][ATTACKER_INDEX] = attacker
+
+    if engine == 'fast':
+        import fastCapture
+        games = fastCapture.runGames(**options)
+    else:
+        games = capture.runGames(**options)
+    return attacker.getWeights(), [game.state.data.score for game in games]
+
+
+def averageWeights(allWeights):
+    return {feature: sum([weights[feature] for weights in allWeights]) / len(allWeights)
+            for feature in allWeights[0]}
+
+
+
+class TrainingDriver:
+    def __init__(self, options):
+        self.options = options
+        self.contestDir = os.path.abspath(options.contestDir)
+        self.opponents = options.opponents.split(',')
+        self.layouts = options.layouts.split(',')
+        self.numTasks = 0
+        self.scores = []
+
+        import myTeam
+        self.checkpointer = myTeam.WeightCheckpointer(myTeam.getWeightsFile('myAttackingAgent'),
+                                                      flushEvery=options.checkpointEvery, compress=options.compress)
+
+    def makeTask(self, weights):
+        # Tasks cycle through every (opponents, layout) pair, each with its own random seed
+        taskNumber = self.numTasks
+        self.numTasks += 1
+        opponents = self.opponents[taskNumber % len(self.opponents)]
+        layout = self.layouts[(taskNumber // len(self.opponents)) % len(self.layouts)]
+        if layout == 'RANDOM':
+            layout = 'RANDOM{}'.format(self.options.seed + taskNumber)
+        return (self.contestDir, dict(weights), opponents, layout, self.options.episodes,
+                self.options.seed + taskNumber, self.getReplayOptions(), self.options.engine)
+
+    def getReplayOptions(self):
+        if self.options.replayCapacity == 0:
+            return {}
+        return {'replayCapacity': self.options.replayCapacity, 'replayPrioritized': self.options.replayPrioritized,
+                'replayBatchSize': self.options.replayBatchSize, 'replayEvery': self.options.replayEvery}
+
+    def train(self, weights):
+        startTime = time.time()
+        with ProcessPoolExecutor(self.options.workers) as pool:
+            if self.options.merge == 'average':
+                weights = self.trainSynchronously(pool, weights, startTime)
+            else:
+                weights = self.trainAsynchronously(pool, weights, startTime)
+        self.checkpointer.flush()
+        return weights
+
+    # Every round, each worker trains from the same weights and the results are averaged
+    def trainSynchronously(self, pool, weights, startTime):
+        for round in range(self.options.rounds):
+            futures = [pool.submit(runTrainingTask, *self.makeTask(weights)) for _ in range(self.options.workers)]
+            results = [future.result() for future in futures]
+            weights = averageWeights([workerWeights for workerWeights, _ in results])
+            for _, scores in results:
+                self.scores.extend(scores)
+            self.report(round + 1, weights, startTime)
+        return weights
+
+    # Parameter-server style: the weight change of each finished task is applied to the current weights
+    # (scaled by 1 / workers, so that one task per worker moves the weights as much as an averaged round)
+    # and the worker immediately starts a new task from the result.
+    def trainAsynchronously(self, pool, weights, startTime):
+        totalTasks = self.options.rounds * self.options.workers
+        pending = {}
+        for _ in range(min(self.options.workers, totalTasks)):
+            task = self.makeTask(weights)
+            pending[pool.submit(runTrainingTask, *task)] = task[1]
+
+        finishedTasks = 0
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                startWeights = pending.pop(future)
+                workerWeights, scores = future.result()
+                weights = {feature: value + (workerWeights[feature] - startWeights[feature]) / self.options.workers
+                           for feature, value in weights.items()}
+                self.scores.extend(scores)
+                finishedTasks += 1
+                if finishedTasks % self.options.workers == 0:
+                    self.report(finishedTasks // self.options.workers, weights, startTime)
+                if self.numTasks < totalTasks:
+                    task = self.makeTask(weights)
+                    pending[pool.submit(runTrainingTask, *task)] = task[1]
+        return weights
+
+    def report(self, round, weights, startTime):
+        self.checkpointer.add(len(self.scores), weights)
+        recentScores = self.scores[-self.options.workers * self.options.episodes:]
+        elapsed = time.time() - startTime
+        print('Round {}: {} episodes, mean score {:.2f}, {:.1f} episodes/s'.format(
+            round, len(self.scores), sum(recentScores) / float(len(recentScores)), len(self.scores) / elapsed))
+
+
+def readCommand(argv):
+    parser = argparse.ArgumentParser(description='Train the myTeam.py attacker weights in parallel worker processes')
+    parser.add_argument('--contestDir', default='.', help='directory of capture.py and its layouts')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--rounds', type=int, default=10, help='number of tasks run by each worker')
+    parser.add_argument('--episodes', type=int, default=10, help='training episodes per task')
+    parser.add_argument('--opponents', default='baselineTeam',
+                        help='comma separated opponent teams, e.g. baselineTeam,myTeam for self-play')
+    parser.add_argument('--layouts', default='defaultCapture',
+                        help='comma separated layouts, RANDOM picks a new random layout for every task')
+    parser.add_argument('--merge', choices=['average', 'async'], default='average',
+                        help='average the workers after every round, or apply each result as soon as it is ready')
+    parser.add_argument('--weights', default=None,
+                        help='start from the last weights of this weights file or weight history, '
+                             'instead of those the attacker loads at startup')
+    parser.add_argument('--checkpointEvery', type=int, default=1, help='rounds between checkpoint writes')
+    parser.add_argument('--compress', action='store_true', help='gzip the weight history')
+    parser.add_argument('--replayCapacity', type=int, default=0,
+                        help='transitions kept for experience replay in each worker, 0 learns every transition once')
+    parser.add_argument('--replayBatchSize', type=int, default=32)
+    parser.add_argument('--replayEvery', type=int, default=0,
+                        help='transitions between mini-batch updates, 0 replays at the end of each episode only')
+    parser.add_argument('--replayPrioritized', action='store_true', help='sample transitions by TD error')
+    parser.add_argument('--engine', choices=['capture', 'fast'], default='capture',
+                        help='play the training games with capture.py, or with the headless simulator fastCapture.py')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    options = readCommand(sys.argv[1:])
+    workingDir = os.getcwd()
+    if options.weights is not None:
+        options.weights = os.path.abspath(options.weights)
+    importCapture(os.path.abspath(options.contestDir))
+    import myTeam
+    weights = myTeam.myAttackingAgent(ATTACKER_INDEX, weightsFile=options.weights).getWeights()
+
+    os.chdir(workingDir)
+    weights = TrainingDriver(options).train(weights)
+    print(weights)